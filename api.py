@@ -1,9 +1,21 @@
-import json
-import jsonpatch
+import gzip
 import requests
 import time
+import zlib
+from requests.adapters import HTTPAdapter
+from rate_limiter import parse_retry_after
+from cache import cache_key, entity_id_from_path
+from codec import default_codec
+from diff import make_patch
+from metrics import RequestInfo, endpoint_template
+from retry import HTTPError, RetriesExhausted, RetryableError, RetryPolicy
+from deadline import DeadlineExceeded, expiry, remaining
 
 wikidata_endpoint = "https://www.wikidata.org/w/rest.php/wikibase/v0"
+# Seconds to wait for a connection, and then for each read from the socket
+default_timeout = (10, 60)
+# Response encodings asked for; requests and aiohttp decode both
+default_accept_encoding = "gzip, deflate"
 
 singular = {
     # English can't do plural inflections consistently. That would be too nice.
@@ -11,6 +23,27 @@ singular = {
     "properties": "property"
 }
 
+class EditConflict(HTTPError):
+    # The wiki refused an edit because the entity changed underneath it:
+    # 412 when an If-Match revision is outdated, 409 when a patch no
+    # longer applies.
+    def __init__(self, status_code, body):
+        super().__init__(status_code, body)
+        self.args = (f"Edit conflict with status code: {status_code}",)
+
+def parse_revision(etag):
+    # ETags are the revision ID in quotes, possibly marked weak
+    if etag is None:
+        return None
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"')
+
+def _fields_params(fields):
+    if fields is None:
+        return {}
+    return {"_fields": ",".join(fields)}
+
 def _prepare_payload(verb, part, new_data, old_data, bot, edit_summary, tags=[]):
     payload = {
         "tags": ["wikibase-patcher-v1"],
@@ -21,11 +54,62 @@ def _prepare_payload(verb, part, new_data, old_data, bot, edit_summary, tags=[])
     if edit_summary is not None:
         payload["comment"] = edit_summary
     if verb.lower() == "patch" and old_data is not None:
-        payload["patch"] = list(jsonpatch.make_patch(old_data, new_data))
+        payload["patch"] = make_patch(old_data, new_data)
     elif verb.lower() != "delete":
         payload[part] = new_data
     return payload
 
+def decompress(body, content_encoding):
+    # A response body sent with Content-Encoding, decoded
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        # Meant to be zlib-wrapped, but some servers send raw deflate
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+
+def _received_size(response):
+    # Body bytes as they came over the wire, before urllib3 decoded them
+    try:
+        return response.raw.tell()
+    except AttributeError:
+        return len(response.content)
+
+class _Call:
+    # One _request call, as its attempts see it
+    def __init__(self, verb, path, params, headers, key, return_revision,
+                 attempts, expires, body, compressed):
+        self.verb = verb
+        self.path = path
+        self.params = params
+        self.headers = headers
+        self.key = key
+        self.return_revision = return_revision
+        self.attempts = attempts
+        self.endpoint = (verb.lower(), endpoint_template(path))
+        self.expires = expires
+        # Encoded once for every attempt; GETs have no body
+        self.body = body
+        self.compressed = compressed
+
+def make_session(pool_connections=10, pool_maxsize=10, pool_block=False):
+    # pool_connections is the number of hosts kept in the pool and
+    # pool_maxsize the number of keep-alive sockets per host. With
+    # pool_block=True, threads wait for a free socket instead of opening
+    # (and then discarding) extra ones.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 class WikibaseRestAPI:
     def get_access_token(self):
         if self.access_token is not None:
@@ -41,7 +125,43 @@ class WikibaseRestAPI:
 
 
     def __init__(self, access_token=None, api_key=None, api_secret=None,
-                 endpoint=wikidata_endpoint):
+                 endpoint=wikidata_endpoint, session=None, pool_connections=10,
+                 pool_maxsize=10, pool_block=False, keep_alive=True, rate_limiter=None,
+                 cache=None, journal=None, hooks=None, retry_policy=None,
+                 timeout=default_timeout, deadline=None, codec=None,
+                 accept_encoding=default_accept_encoding, compress_requests=None):
+        self._set_options(access_token, api_key, api_secret, endpoint, rate_limiter,
+                          cache, journal, hooks, retry_policy, timeout, deadline, codec,
+                          accept_encoding, compress_requests)
+        if not keep_alive:
+            self.base_headers["Connection"] = "close"
+
+        # A session passed in is shared with whoever created it, so only
+        # close sessions we built ourselves.
+        self.owns_session = session is None
+        if session is None:
+            session = make_session(pool_connections, pool_maxsize, pool_block)
+        self.session = session
+
+    def _set_options(self, access_token, api_key, api_secret, endpoint, rate_limiter,
+                     cache, journal, hooks, retry_policy, timeout, deadline, codec,
+                     accept_encoding, compress_requests):
+        # The options shared with AsyncWikibaseRestAPI
+        self._set_credentials(access_token, api_key, api_secret, endpoint)
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        # With a journal.Journal, writes are recorded instead of sent
+        self.journal = journal
+        # Called around every HTTP attempt; see metrics.py
+        self.hooks = list(hooks or [])
+        # Which failures are retried and how; see retry.py
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._set_timeouts(timeout, deadline)
+        # Encodes payloads and decodes responses; see codec.py
+        self.codec = codec or default_codec
+        self._set_compression(accept_encoding, compress_requests)
+
+    def _set_credentials(self, access_token, api_key, api_secret, endpoint):
         self.api_key = api_key
         self.api_secret = api_secret
         self.endpoint = endpoint
@@ -53,94 +173,366 @@ class WikibaseRestAPI:
         if self.access_token is not None:
             self.base_headers["Authorization"] = f"Bearer {self.access_token}"
 
+    def _set_timeouts(self, timeout, deadline):
+        # timeout is (connect, read) seconds, or one number for both; None
+        # waits forever. deadline limits each API call, retries included,
+        # on top of any enclosing deadline.deadline().
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def _set_compression(self, accept_encoding, compress_requests):
+        # accept_encoding is sent as Accept-Encoding, unless None. Request
+        # bodies of compress_requests bytes or more are sent gzipped; only
+        # for wikis that accept Content-Encoding: gzip. A 415 in answer to
+        # one turns this off for the rest of the client's life.
+        if accept_encoding is not None:
+            self.base_headers["Accept-Encoding"] = accept_encoding
+        self.compress_requests = compress_requests
+
+    def close(self):
+        if self.owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _build_headers(self, verb, headers, revision=None):
+        headers = dict(headers)
+        for k, v in self.base_headers.items():
+            headers[k] = v
+        if verb.lower() == "patch":
+            headers["Content-Type"] = "application/json-patch+json"
+        if revision is not None:
+            headers["If-Match"] = f'"{revision}"'
+        return headers
+
+    def _wait_time(self, verb):
+        if self.rate_limiter is None:
+            return 0
+        return self.rate_limiter.reserve(edit=verb.lower() != "get")
+
+    def _throttled(self, status_code, response_headers):
+        # 429 is rate limiting; 503 with Retry-After is also what MediaWiki
+        # sends when replication lag exceeds maxlag. Returns the server's
+        # requested pause, if any, after passing it on to the shared limiter.
+        # Pauses are capped at the retry policy's max_delay, so a
+        # Retry-After of a day does not stall every worker for a day.
+        retry_after = parse_retry_after(response_headers.get("Retry-After"))
+        if retry_after is not None:
+            retry_after = min(retry_after, self.retry_policy.max_delay)
+        lag = response_headers.get("X-Database-Lag")
+        if lag is not None:
+            print(f"Database lag: {lag} seconds")
+        if self.rate_limiter is not None:
+            self.rate_limiter.throttle(retry_after)
+        return retry_after
+
+    def _succeeded(self, endpoint, status_code):
+        self.retry_policy.record(endpoint, status_code)
+        if self.rate_limiter is not None:
+            self.rate_limiter.succeed()
+
+    def _timeouts(self, expires, wait_time=0):
+        # (connect, read) timeouts for an attempt starting in wait_time
+        # seconds, cut to the time left before expires
+        left = remaining(expires)
+        if left is None:
+            return self.timeout
+        left -= wait_time
+        if left <= 0:
+            raise DeadlineExceeded("Deadline exceeded before the request could be sent")
+        return tuple(left if limit is None else min(limit, left) for limit in self.timeout)
+
+    def _retry_delay(self, call, error, attempt):
+        # After a failed attempt: None if error is to be raised as it is,
+        # otherwise the seconds to wait before the next attempt
+        policy = self.retry_policy
+        attempts = call.attempts
+        status_code = error.status_code if isinstance(error, HTTPError) else None
+        retry_after = error.retry_after if isinstance(error, HTTPError) else None
+        policy.record(call.endpoint, status_code, error, retry_after)
+        if isinstance(error, EditConflict) or not policy.is_transient(status_code, error):
+            # Retrying cannot help; edit conflicts are for the caller to rebase
+            return None
+        if attempt >= attempts:
+            print(f"Error encountered: {str(error)}. All retries exhausted!")
+            raise RetriesExhausted(attempts, error) from error
+        if status_code in (429, 503) and self.rate_limiter is not None:
+            # The limiter holds every thread back until the pause is over
+            delay = 0
+        else:
+            delay = policy.delay(attempt, retry_after)
+        left = remaining(call.expires)
+        if left is not None and delay >= left:
+            print(f"Error encountered: {str(error)}. Deadline exceeded!")
+            raise DeadlineExceeded(f"Deadline exceeded after {attempt} attempts."
+                                   f" Last error encountered: {str(error)}")
+        print(f"Error encountered: {str(error)}. "
+              f"Retrying {attempt + 1}/{attempts} in {delay:.2f} seconds...")
+        return delay
+
+    def _cache_lookup(self, verb, path, params, headers):
+        # Returns (key, entry). entry is set when the cache can answer
+        # without a request; otherwise a stale entry's ETag is added to
+        # headers.
+        if self.cache is None or verb.lower() != "get":
+            return None, None
+        key = cache_key(path, params)
+        entry, fresh = self.cache.lookup(key)
+        if entry is None:
+            return key, None
+        if fresh:
+            return key, entry
+        if entry.etag is not None:
+            headers["If-None-Match"] = entry.etag
+        return key, None
+
+    def _cache_not_modified(self, key, headers):
+        entry = self.cache.revalidated(key)
+        if entry is None:
+            # Evicted since we asked; the retry fetches the full body
+            headers.pop("If-None-Match", None)
+            raise RetryableError("Cache entry evicted during revalidation")
+        return entry
+
+    def _result(self, body, etag, return_revision):
+        data = self.codec.loads(body)
+        if return_revision:
+            return data, parse_revision(etag)
+        return data
+
+    def _compress(self, body):
+        # The gzipped body, if it is big enough to be sent that way
+        if body is None or self.compress_requests is None or len(body) < self.compress_requests:
+            return None
+        return gzip.compress(body, compresslevel=6, mtime=0)
+
+    def _attempt_body(self, body, compressed, headers):
+        # What to send on this attempt; compression may have been turned
+        # off by an earlier one
+        if compressed is not None and self.compress_requests is not None:
+            headers["Content-Encoding"] = "gzip"
+            return compressed
+        headers.pop("Content-Encoding", None)
+        return body
+
+    def _compression_refused(self):
+        print("The wiki does not accept compressed request bodies; sending them uncompressed")
+        self.compress_requests = None
+        raise RetryableError("Compressed request body refused with status code: 415")
+
+    def _request_started(self, verb, path, attempt, data, body):
+        # data is the body as sent, body before any compression
+        if not self.hooks:
+            return None
+        info = RequestInfo(verb, path, attempt, 0 if data is None else len(data),
+                           0 if body is None else len(body))
+        for hook in self.hooks:
+            if hasattr(hook, "before_request"):
+                hook.before_request(info)
+        return info
+
+    def _request_finished(self, info, status=None, bytes_received=0, error=None,
+                          uncompressed_bytes_received=None):
+        # Once per attempt; later calls (from the error handling of a
+        # response already reported) do nothing
+        if info is None or info.finished:
+            return
+        info.finished = True
+        info.seconds = time.perf_counter() - info.started
+        info.status = status
+        info.bytes_received = bytes_received
+        info.uncompressed_bytes_received = (bytes_received if uncompressed_bytes_received is None
+                                            else uncompressed_bytes_received)
+        info.error = error
+        for hook in self.hooks:
+            if hasattr(hook, "after_request"):
+                hook.after_request(info)
+
+    def _record(self, verb, path, payload, revision, return_revision):
+        # A recorded write has no response; Entity keeps its own data
+        self.journal.record(verb, path, payload, revision)
+        return (None, None) if return_revision else None
+
+    def _conflicted(self, path, status_code, body):
+        # Someone else edited the entity. Drop what we have cached of it, so
+        # that the refetch for a rebase sees their edit, not our stale copy.
+        if self.cache is not None:
+            entity_id = entity_id_from_path(path)
+            if entity_id is not None:
+                self.cache.invalidate(entity_id)
+        raise EditConflict(status_code, body)
+
+    def _cache_response(self, verb, path, key, headers, response_headers, body):
+        if self.cache is None:
+            return
+        if verb.lower() == "get":
+            if "If-None-Match" in headers:
+                self.cache.miss(key)
+            self.cache.store(key, response_headers.get("ETag"), body)
+        else:
+            entity_id = entity_id_from_path(path)
+            if entity_id is not None:
+                self.cache.invalidate(entity_id)
+
+    def _begin(self, verb, path, params, headers, payload, max_retries, revision,
+               return_revision):
+        # Everything before the first attempt. Returns (result, None) when
+        # the journal or the cache answers without a request, otherwise
+        # (None, call) for the attempts.
+        if self.journal is not None and verb.lower() != "get":
+            return self._record(verb, path, payload, revision, return_revision), None
+        headers = self._build_headers(verb, headers, revision)
+        key, cached = self._cache_lookup(verb, path, params, headers)
+        if cached is not None:
+            return self._result(cached.body, cached.etag, return_revision), None
+        body = None if payload is None else self.codec.dumps(payload)
+        return None, _Call(verb, path, params, headers, key, return_revision,
+                           max_retries or self.retry_policy.max_retries,
+                           expiry(self.deadline), body, self._compress(body))
+
+    def _response(self, call, data, status_code, response_headers, body, text):
+        # The result of an attempt that got a response, or the error to
+        # judge with _retry_delay. data is the request body as sent.
+        if status_code == 304 and call.key is not None:
+            cached = self._cache_not_modified(call.key, call.headers)
+            self._succeeded(call.endpoint, status_code)
+            return self._result(cached.body, cached.etag, call.return_revision)
+        elif status_code in (429, 503):
+            retry_after = self._throttled(status_code, response_headers)
+            raise HTTPError(status_code, text, retry_after)
+        elif status_code in (409, 412):
+            self._conflicted(call.path, status_code, text)
+        elif status_code == 415 and call.compressed is not None and data is call.compressed:
+            self._compression_refused()
+        elif status_code > 299:
+            print(text)
+            raise HTTPError(status_code, text)
+        self._succeeded(call.endpoint, status_code)
+        self._cache_response(call.verb, call.path, call.key, call.headers,
+                             response_headers, body)
+        return self._result(body, response_headers.get("ETag"), call.return_revision)
+
     def _request(self, verb, path, params={}, headers={}, payload=None,
-        max_retries=10, base_delay=1, max_delay=60):
-        for retry in range(max_retries):
+        max_retries=None, revision=None, return_revision=False):
+        # revision makes the request conditional on the entity still being
+        # at that revision (If-Match). With return_revision the result is a
+        # (data, revision) tuple. max_retries overrides the retry policy's.
+        # Raises DeadlineExceeded once self.deadline or an enclosing
+        # deadline.deadline() runs out.
+        result, call = self._begin(verb, path, params, headers, payload, max_retries,
+                                   revision, return_revision)
+        if call is None:
+            return result
+        for attempt in range(1, call.attempts + 1):
+            info = None
+            self.retry_policy.before_request(call.endpoint)
             try:
-                for k, v in self.base_headers.items():
-                    headers[k] = v
-
-                if verb.lower() == "patch":
-                    headers["Content-Type"] = "application/json-patch+json"
-
-                request = requests.request(
+                wait_time = self._wait_time(verb)
+                timeout = self._timeouts(call.expires, wait_time)
+                if wait_time > 0:
+                    time.sleep(wait_time)
+                data = self._attempt_body(call.body, call.compressed, call.headers)
+                info = self._request_started(verb, path, attempt, data, call.body)
+                request = self.session.request(
                               verb,
                               self.endpoint + path,
                               params=params,
-                              headers=headers,
-                              data=json.dumps(payload))
+                              headers=call.headers,
+                              data=data,
+                              timeout=timeout)
+                self._request_finished(info, request.status_code, _received_size(request),
+                                       uncompressed_bytes_received=len(request.content))
                 #print(f"{verb.upper()} {path}")
-                if request.status_code == 409:
-                    print(f"Conflict; skipping – {request.text}")
-                    return request.json()
-                elif request.status_code > 299:
-                    print(request.text)
-                    raise Exception("HTTP Error with status code: {}"\
-                        .format(request.status_code))
-                return request.json()
-            except (Exception, requests.exceptions.RequestException,
-                requests.exceptions.JSONDecodeError) as e:
-                if retry < max_retries - 1:
-                    delay = min(base_delay * (2 ** retry), max_delay)
-                    print(f"Error encountered: {str(e)}. "
-                          f"Retrying {retry + 2}/{max_retries} in {delay} seconds...")
-                    time.sleep(delay)
-                    continue
-                else:  # if it's the last retry, raise the error
-                    print(f"Error encountered: {str(e)}. All retries exhausted!")
-                    raise Exception(f"All retries exhausted after {max_retries}"
-                                    f" attempts. Last error encountered: {str(e)}")
-
-    def _get(self, path, params={}):
-        return self._request("get", path, params=params)
-
-    def _post(self, path, part, data, bot, edit_summary, tags):
+                return self._response(call, data, request.status_code, request.headers,
+                                      request.content, request.text)
+            except Exception as e:
+                self._request_finished(info, error=e)
+                delay = self._retry_delay(call, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def _get(self, path, params={}, return_revision=False):
+        return self._request("get", path, params=params,
+            return_revision=return_revision)
+
+    def _post(self, path, part, data, bot, edit_summary, tags,
+        revision=None, return_revision=False):
         return self._request("post", path, payload=_prepare_payload(
-            "post", part, data, None, bot, edit_summary, tags))
+            "post", part, data, None, bot, edit_summary, tags),
+            revision=revision, return_revision=return_revision)
 
-    def _put(self, path, part, data, bot, edit_summary, tags):
+    def _put(self, path, part, data, bot, edit_summary, tags,
+        revision=None, return_revision=False):
         return self._request("put", path, payload=_prepare_payload(
-            "put", part, data, None, bot, edit_summary, tags))
+            "put", part, data, None, bot, edit_summary, tags),
+            revision=revision, return_revision=return_revision)
 
-    def _patch(self, path, data, old_data, bot, edit_summary, tags):
+    def _patch(self, path, data, old_data, bot, edit_summary, tags,
+        revision=None, return_revision=False):
         return self._request("patch", path, payload=_prepare_payload(
-            "patch", None, data, old_data, bot, edit_summary, tags))
+            "patch", None, data, old_data, bot, edit_summary, tags),
+            revision=revision, return_revision=return_revision)
 
-    def _delete(self, path, bot, edit_summary, tags):
+    def _delete(self, path, bot, edit_summary, tags,
+        revision=None, return_revision=False):
         return self._request("delete", path, payload=_prepare_payload(
-            "delete", None, None, None, bot, edit_summary, tags))
+            "delete", None, None, None, bot, edit_summary, tags),
+            revision=revision, return_revision=return_revision)
 
 
     # GET
-    def get_entity(self, entity_type, entity_id):
-        return self._get(f"/entities/{entity_type}/{entity_id}")
+    def get_entity(self, entity_type, entity_id, fields=None):
+        # fields optionally limits the response to some top-level fields,
+        # e.g. ["labels", "statements"]
+        return self._get(f"/entities/{entity_type}/{entity_id}",
+            params=_fields_params(fields))
 
-    def get_entity_labels(self, entity_type, entity_id):
-        return self._get(f"/entities/{entity_type}/{entity_id}/labels")
+    def get_entity_with_revision(self, entity_type, entity_id, fields=None):
+        # Returns (entity, revision ID)
+        return self._get(f"/entities/{entity_type}/{entity_id}",
+            params=_fields_params(fields), return_revision=True)
+
+    def get_entity_labels(self, entity_type, entity_id, return_revision=False):
+        return self._get(f"/entities/{entity_type}/{entity_id}/labels",
+            return_revision=return_revision)
 
     def get_entity_label(self, entity_type, entity_id, language_code):
         return self._get(f"/entities/{entity_type}/{entity_id}/labels/{language_code}")
 
-    def get_entity_descriptions(self, entity_type, entity_id):
-        return self._get(f"/entities/{entity_type}/{entity_id}/descriptions")
+    def get_entity_descriptions(self, entity_type, entity_id, return_revision=False):
+        return self._get(f"/entities/{entity_type}/{entity_id}/descriptions",
+            return_revision=return_revision)
 
     def get_entity_description(self, entity_type, entity_id, language_code):
         return self._get(f"/entities/{entity_type}/{entity_id}/descriptions/{language_code}")
 
-    def get_entity_aliases(self, entity_type, entity_id):
-        return self._get(f"/entities/{entity_type}/{entity_id}/aliases")
+    def get_entity_aliases(self, entity_type, entity_id, return_revision=False):
+        return self._get(f"/entities/{entity_type}/{entity_id}/aliases",
+            return_revision=return_revision)
 
     def get_entity_aliases_in_language(self, entity_type, entity_id, language_code):
         return self._get(f"/entities/{entity_type}/{entity_id}/aliases/{language_code}")
 
-    def get_entity_statements(self, entity_type, entity_id):
-        return self._get(f"/entities/{entity_type}/{entity_id}/statements")
+    def get_entity_statements(self, entity_type, entity_id, property_id=None,
+        return_revision=False):
+        # property_id limits the response to that property's statements
+        params = {} if property_id is None else {"property": property_id}
+        return self._get(f"/entities/{entity_type}/{entity_id}/statements",
+            params=params, return_revision=return_revision)
 
     def get_entity_statement(self, entity_type, entity_id, statement_id):
         return self._get(f"/entities/{entity_type}/{entity_id}/statements/{statement_id}")
 
-    def get_item_sitelinks(self, item_id):
-        return self._get(f"/entities/items/{item_id}/sitelinks")
+    def get_item_sitelinks(self, item_id, return_revision=False):
+        return self._get(f"/entities/items/{item_id}/sitelinks",
+            return_revision=return_revision)
 
     def get_item_sitelink(self, item_id, site_id):
         return self._get(f"/entities/items/{item_id}/sitelinks/{site_id}")
@@ -153,9 +545,9 @@ class WikibaseRestAPI:
             data, old_data, bot, edit_summary, tags)
 
     def update_entity(self, entity_type, entity_id, data, old_data,
-        bot=False, edit_summary=None, tags=[]):
+        bot=False, edit_summary=None, tags=[], revision=None, return_revision=False):
         return self._patch(f"/entities/{entity_type}/{entity_id}",
-            data, old_data, bot, edit_summary, tags)
+            data, old_data, bot, edit_summary, tags, revision, return_revision)
 
     def update_entity_labels(self, entity_type, entity_id, data, old_data,
         bot=False, edit_summary=None, tags=[]):
@@ -179,9 +571,10 @@ class WikibaseRestAPI:
 
 
     # POST
-    def add_item(self, data, bot=False, edit_summary=None, tags=[]):
+    def add_item(self, data, bot=False, edit_summary=None, tags=[],
+        return_revision=False):
         return self._post(f"/entities/items",
-            "item", data, bot, edit_summary, tags)
+            "item", data, bot, edit_summary, tags, return_revision=return_revision)
 
     def add_entity_label(self, entity_type, entity_id, data,
         bot=False, edit_summary=None, tags=[]):
@@ -230,6 +623,11 @@ class WikibaseRestAPI:
         return self._put(f"/entities/{entity_type}/{entity_id}/statements/{statement_id}",
             "statement", data, bot, edit_summary, tags)
 
+    def replace_item_sitelink(self, item_id, site_id, data,
+        bot=False, edit_summary=None, tags=[]):
+        return self._put(f"/entities/items/{item_id}/sitelinks/{site_id}",
+            "sitelink", data, bot, edit_summary, tags)
+
 
     # DELETE
     def delete_statement(self, statement_id,
@@ -262,6 +660,11 @@ class WikibaseRestAPI:
         return self._delete(f"/entities/{entity_type}/{entity_id}/statements/{statement_id}",
             bot, edit_summary, tags)
 
+    def delete_item_sitelink(self, item_id, site_id,
+        bot=False, edit_summary=None, tags=[]):
+        return self._delete(f"/entities/items/{item_id}/sitelinks/{site_id}",
+            bot, edit_summary, tags)
+
 
     # Convenience functions
     def get_item(self, item_id):
@@ -306,11 +709,11 @@ class WikibaseRestAPI:
     def get_property_aliases_in_language(self, property_id, language_code):
         return self.get_entity_aliases_in_language("properties", property_id, language_code)
 
-    def get_item_statements(self, item_id):
-        return self.get_entity_statements("items", item_id)
+    def get_item_statements(self, item_id, property_id=None):
+        return self.get_entity_statements("items", item_id, property_id)
 
-    def get_property_statements(self, property_id):
-        return self.get_entity_statements("properties", property_id)
+    def get_property_statements(self, property_id, statement_property_id=None):
+        return self.get_entity_statements("properties", property_id, statement_property_id)
 
     def get_item_statement(self, item_id, statement_id):
         return self.get_entity_statement("items", item_id, statement_id)
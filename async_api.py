@@ -0,0 +1,121 @@
+import asyncio
+from api import (WikibaseRestAPI, decompress, default_accept_encoding, default_timeout,
+                 wikidata_endpoint)
+from deadline import remaining
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+class AsyncWikibaseRestAPI(WikibaseRestAPI):
+    # Every endpoint method is inherited from WikibaseRestAPI. They all end in
+    # self._request(...), which is a coroutine here, so each of them returns
+    # an awaitable and payloads are still built by _prepare_payload.
+    #
+    # max_concurrency caps the number of requests in flight on this client;
+    # callers can also hold self.semaphore to throttle their own work.
+
+    def __init__(self, access_token=None, api_key=None, api_secret=None,
+                 endpoint=wikidata_endpoint, session=None, max_concurrency=100,
+                 pool_maxsize=100, pool_maxsize_per_host=0, keep_alive=True,
+                 keepalive_timeout=15, rate_limiter=None, cache=None, journal=None,
+                 hooks=None, retry_policy=None, timeout=default_timeout, deadline=None,
+                 codec=None, accept_encoding=default_accept_encoding, compress_requests=None):
+        if aiohttp is None:
+            raise ImportError("AsyncWikibaseRestAPI requires aiohttp "
+                "(pip install aiohttp)")
+        self._set_options(access_token, api_key, api_secret, endpoint, rate_limiter,
+                          cache, journal, hooks, retry_policy, timeout, deadline, codec,
+                          accept_encoding, compress_requests)
+        self.keep_alive = keep_alive
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.owns_session = session is None
+        # aiohttp sessions have to be created inside a running event loop,
+        # so our own session is opened on the first request.
+        self.session = session
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            if self.keep_alive:
+                connector = aiohttp.TCPConnector(
+                    limit=self.pool_maxsize,
+                    limit_per_host=self.pool_maxsize_per_host,
+                    keepalive_timeout=self.keepalive_timeout)
+            else:
+                connector = aiohttp.TCPConnector(
+                    limit=self.pool_maxsize,
+                    limit_per_host=self.pool_maxsize_per_host,
+                    force_close=True)
+            # Responses are decompressed in _request, which can then
+            # tell how big they were on the wire
+            self.session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+            self.owns_session = True
+        return self.session
+
+    async def close(self):
+        if self.owns_session and self.session is not None:
+            await self.session.close()
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with AsyncWikibaseRestAPI")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _decoded(self, session, received, response_headers):
+        encoding = response_headers.get("Content-Encoding")
+        if getattr(session, "auto_decompress", True):
+            # A session passed in may have decoded it already, in which
+            # case the size on the wire is not known
+            return received
+        return decompress(received, encoding)
+
+    async def _request(self, verb, path, params={}, headers={}, payload=None,
+        max_retries=None, revision=None, return_revision=False):
+        result, call = self._begin(verb, path, params, headers, payload, max_retries,
+                                   revision, return_revision)
+        if call is None:
+            return result
+        session = self._get_session()
+        for attempt in range(1, call.attempts + 1):
+            info = None
+            self.retry_policy.before_request(call.endpoint)
+            try:
+                wait_time = self._wait_time(verb)
+                self._timeouts(call.expires, wait_time)
+                if wait_time > 0:
+                    await asyncio.sleep(wait_time)
+                async with self.semaphore:
+                    connect, read = self._timeouts(call.expires)
+                    timeout = aiohttp.ClientTimeout(total=remaining(call.expires),
+                                                    sock_connect=connect, sock_read=read)
+                    data = self._attempt_body(call.body, call.compressed, call.headers)
+                    info = self._request_started(verb, path, attempt, data, call.body)
+                    async with session.request(
+                                   verb.upper(),
+                                   self.endpoint + path,
+                                   params=params,
+                                   headers=call.headers,
+                                   data=data,
+                                   timeout=timeout) as request:
+                        status_code = request.status
+                        response_headers = request.headers
+                        received = await request.read()
+                    body = self._decoded(session, received, response_headers)
+                    self._request_finished(info, status_code, len(received),
+                                           uncompressed_bytes_received=len(body))
+                return self._response(call, data, status_code, response_headers, body,
+                                      body.decode("utf-8", "replace"))
+            except Exception as e:
+                self._request_finished(info, error=e)
+                delay = self._retry_delay(call, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
@@ -0,0 +1,53 @@
+# diff.make_patch against jsonpatch.make_patch on large synthetic entities:
+# time per diff and number of operations emitted.
+#
+#   python -m benchmarks.bench_diff [--sizes 1000,10000] [--repeat N]
+#                                   [--properties N]
+#
+# By default statements are spread over size / 20 properties; use
+# --properties 1 for the many-authors case of one very long statement list.
+
+import argparse
+import copy
+import random
+import time
+
+import jsonpatch
+
+from benchmarks.synthetic import edits, make_entity
+from diff import make_patch
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--properties", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"{'statements':>10}  {'edit':<26}{'jsonpatch ms':>13}{'ops':>7}"
+          f"{'diff ms':>10}{'ops':>7}{'speedup':>9}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        old = make_entity(size, args.properties)
+        for name, edit in edits.items():
+            new = copy.deepcopy(old)
+            edit(new, random.Random(1))
+            jp_time, jp_ops = best_time(
+                lambda: list(jsonpatch.make_patch(old, new)), args.repeat)
+            diff_time, diff_ops = best_time(lambda: make_patch(old, new), args.repeat)
+            assert jsonpatch.apply_patch(old, diff_ops) == new
+            print(f"{size:>10}  {name:<26}{jp_time * 1000:>13.1f}{len(jp_ops):>7}"
+                  f"{diff_time * 1000:>10.1f}{len(diff_ops):>7}"
+                  f"{jp_time / diff_time:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
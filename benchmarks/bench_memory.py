@@ -0,0 +1,65 @@
+# Memory held by entities as the dicts WikibaseRestAPI returns against the
+# same entities as compact.CompactEntity, plus the cost of converting.
+#
+#   python -m benchmarks.bench_memory [--entities 200] [--statements 500]
+#
+# Entities go through json.loads first, as they would coming off the wire,
+# so the dicts share no strings with each other.
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_entity
+from compact import CompactEntity
+
+def traced(function):
+    # Returns (result, bytes still allocated by it)
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--statements", type=int, default=500)
+    args = parser.parse_args()
+
+    texts = [json.dumps(make_entity(args.statements, seed=n, entity_id=f"Q{n}"))
+             for n in range(args.entities)]
+
+    dicts, dict_bytes = traced(lambda: [json.loads(text) for text in texts])
+
+    def convert():
+        entities = [CompactEntity.from_dict(json.loads(text)) for text in texts]
+        return entities
+    compact, compact_bytes = traced(convert)
+
+    start = time.perf_counter()
+    for entity in dicts:
+        CompactEntity.from_dict(entity)
+    from_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for entity in compact:
+        entity.to_dict()
+    to_seconds = time.perf_counter() - start
+    lossless = all(entity.to_dict() == data for entity, data in zip(compact, dicts))
+
+    statements = args.entities * args.statements
+    print(f"{args.entities} entities, {statements} statements")
+    print(f"{'':<10}{'MB':>10}{'bytes/statement':>18}")
+    print(f"{'dicts':<10}{dict_bytes / 2 ** 20:>10.1f}{dict_bytes / statements:>18.0f}")
+    print(f"{'compact':<10}{compact_bytes / 2 ** 20:>10.1f}{compact_bytes / statements:>18.0f}")
+    print(f"compact is {dict_bytes / compact_bytes:.1f}x smaller")
+    print(f"from_dict {from_seconds * 1e6 / statements:.1f} us/statement, "
+          f"to_dict {to_seconds * 1e6 / statements:.1f} us/statement, "
+          f"lossless: {lossless}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Requests/sec through WikibaseRestAPI with and without connection pooling,
+# measured against mockserver.MockServer.
+#
+#   python -m benchmarks.bench_pooling [--requests N] [--threads N]
+#                                      [--handshake-ms MS]
+#
+# Plain HTTP on loopback makes a new connection almost free, so the server
+# can charge an artificial delay per accepted connection to stand in for the
+# TCP+TLS handshake to a remote wiki.
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api import WikibaseRestAPI
+from mockserver import MockServer
+
+entity = {
+    "id": "Q1",
+    "type": "item",
+    "labels": {"en": "benchmark item"},
+    "descriptions": {},
+    "aliases": {},
+    "statements": {},
+    "sitelinks": {}
+}
+
+def run(api, n_requests, n_threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        list(pool.map(lambda _: api.get_item("Q1"), range(n_requests)))
+    return n_requests / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--handshake-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    with MockServer(entities=[entity], connect_delay=args.handshake_ms / 1000) as server:
+        with WikibaseRestAPI(endpoint=server.endpoint, keep_alive=False) as api:
+            unpooled = run(api, args.requests, args.threads)
+        with WikibaseRestAPI(endpoint=server.endpoint, pool_maxsize=args.threads) as api:
+            pooled = run(api, args.requests, args.threads)
+
+    print(f"without pooling: {unpooled:10.1f} req/s")
+    print(f"with pooling:    {pooled:10.1f} req/s")
+    print(f"speedup:         {pooled / unpooled:10.2f}x")
+
+if __name__ == "__main__":
+    main()
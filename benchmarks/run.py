@@ -0,0 +1,219 @@
+# The benchmark suite: the client's CPU-bound hot paths on synthetic
+# entities of 10, 1,000 and 10,000 statements, plus load-modify-submit
+# against mockserver.MockServer. Results go to a JSON file, and two such
+# files can be compared to catch regressions between commits.
+#
+#   python -m benchmarks.run [--sizes 10,1000,10000] [--cases a,b]
+#                            [--repeat N] [--output FILE]
+#   python -m benchmarks.run --compare OLD.json NEW.json [--threshold 0.1]
+#
+# Each case is timed repeat times, each time over enough calls to take about
+# 50 ms, and reported as seconds per call (the best and the median sample).
+# --compare exits with status 1 if any case got slower than the threshold.
+
+import argparse
+import copy
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import jsonpatch
+
+from api import WikibaseRestAPI, _prepare_payload
+from benchmarks.synthetic import edit_statement_value, make_entity
+from codec import default_codec
+from entity import Connection, Entity
+from mockserver import MockServer
+
+sample_seconds = 0.05
+
+class ParsingAPI(WikibaseRestAPI):
+    # Hands out the entity as the codec decodes it off the wire. Nothing
+    # else is ever sent; the rest of the API is only there to plan submits
+    # with.
+    def __init__(self, body):
+        self.body = body
+
+    def get_entity_with_revision(self, entity_type, entity_id, fields=None):
+        return default_codec.loads(self.body), "1"
+
+def offline_entity(data):
+    connection = Connection(api=ParsingAPI(default_codec.dumps(data)))
+    return Entity(connection=connection, entity_id=data["id"])
+
+def edited(data):
+    new = copy.deepcopy(data)
+    edit_statement_value(new, random.Random(1))
+    return new
+
+# Each case takes the synthetic entity and returns the function to time
+
+def case_prepare_payload(data):
+    # The diff behind every PATCH
+    new = edited(data)
+    return lambda: _prepare_payload("patch", None, new, data, False, "summary")
+
+def case_apply_patch(data):
+    # Replaying changes onto a refetched entity after an edit conflict
+    patch = _prepare_payload("patch", None, edited(data), data, False, "summary")["patch"]
+    return lambda: jsonpatch.apply_patch(data, patch)
+
+def case_encode(data):
+    # A full entity as a request body, with codec.default_codec
+    return lambda: default_codec.dumps(data)
+
+def case_decode(data):
+    body = default_codec.dumps(data)
+    return lambda: default_codec.loads(body)
+
+def case_to_dict(data):
+    entity = offline_entity(data)
+    return entity.to_dict
+
+def case_load(data):
+    # Parsing the response and setting up change tracking
+    entity = offline_entity(data)
+    return entity.load
+
+def case_change_detection(data):
+    # What submit() works out before sending anything: one label and one
+    # statement changed
+    entity = offline_entity(data)
+    property_id = next(iter(entity.data["statements"]))
+    counter = iter(range(10 ** 9))
+    def detect():
+        entity.changes = {}
+        n = next(counter)
+        entity.set_label("en", f"label {n}")
+        entity.touch("statements", property_id)
+        entity.data["statements"][property_id][0]["value"]["content"] = f"value {n}"
+        return entity._submit_plan()
+    return detect
+
+def case_end_to_end(data):
+    # Load, change a label and a statement, submit: one GET and one PATCH
+    # over HTTP
+    server = MockServer(entities=[data], log_requests=False)
+    connection = Connection(endpoint=server.endpoint, max_targeted_edits=0)
+    counter = iter(range(10 ** 9))
+    def round_trip():
+        entity = Entity(connection=connection, entity_id=data["id"])
+        n = next(counter)
+        entity.set_label("en", f"label {n}")
+        statement = next(iter(entity.data["statements"].values()))[0]
+        entity.touch("statements", statement["property"]["id"])
+        statement["value"]["content"] = f"value {n}"
+        entity.submit()
+    round_trip.cleanup = lambda: (connection.close(), server.stop())
+    return round_trip
+
+cases = {
+    "prepare_payload": case_prepare_payload,
+    "apply_patch": case_apply_patch,
+    "encode": case_encode,
+    "decode": case_decode,
+    "to_dict": case_to_dict,
+    "load": case_load,
+    "change_detection": case_change_detection,
+    "end_to_end": case_end_to_end
+}
+
+def measure(function, repeat):
+    # Returns (loops, [seconds per call, ...])
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    loops = max(1, int(sample_seconds / max(elapsed, 1e-9)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        samples.append((time.perf_counter() - start) / loops)
+    return loops, samples
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+def run(sizes, names, repeat):
+    results = []
+    for size in sizes:
+        data = make_entity(size, entity_id="Q1")
+        for name in names:
+            function = cases[name](data)
+            try:
+                loops, samples = measure(function, repeat)
+            finally:
+                if hasattr(function, "cleanup"):
+                    function.cleanup()
+            result = {"case": name, "size": size, "loops": loops, "repeat": repeat,
+                      "best": min(samples), "median": statistics.median(samples)}
+            results.append(result)
+            print(f"{name:<18}{size:>7}{result['best'] * 1000:>12.3f}"
+                  f"{result['median'] * 1000:>12.3f}")
+    return results
+
+def compare(old_path, new_path, threshold):
+    # Compares medians; returns the number of cases slower than threshold
+    with open(old_path) as f:
+        old = {(result["case"], result["size"]): result for result in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    print(f"{'case':<18}{'size':>7}{'old ms':>12}{'new ms':>12}{'change':>9}")
+    regressions = 0
+    for result in new:
+        before = old.get((result["case"], result["size"]))
+        if before is None:
+            continue
+        change = result["median"] / before["median"] - 1
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  slower"
+        print(f"{result['case']:<18}{result['size']:>7}{before['median'] * 1000:>12.3f}"
+              f"{result['median'] * 1000:>12.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--cases", default=",".join(cases))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown counted as a regression by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        print(f"{regressions} regression(s) over {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    names = args.cases.split(",")
+    for name in names:
+        if name not in cases:
+            parser.error(f"unknown case {name}; choose from {', '.join(cases)}")
+    print(f"{'case':<18}{'size':>7}{'best ms':>12}{'median ms':>12}")
+    results = run([int(size) for size in args.sizes.split(",")], names, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "codec": default_codec.name,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "results": results
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
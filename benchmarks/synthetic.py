@@ -0,0 +1,81 @@
+# Synthetic entities shaped like WikibaseRestAPI.get_entity responses, for
+# benchmarks. Statements carry qualifiers and references in roughly the
+# proportions seen on large Wikidata items (papers with many authors, taxa).
+
+import random
+import uuid
+
+def make_snak(rng, property_id):
+    return {
+        "property": {"id": property_id, "data_type": "string"},
+        "value": {"type": "value", "content": f"value-{rng.randrange(10 ** 9)}"}
+    }
+
+def make_statement(rng, entity_id, property_id):
+    return {
+        "id": f"{entity_id}${uuid.UUID(int=rng.getrandbits(128))}",
+        "rank": "normal",
+        "property": {"id": property_id, "data_type": "string"},
+        "value": {"type": "value", "content": f"value-{rng.randrange(10 ** 9)}"},
+        "qualifiers": [make_snak(rng, f"P{rng.randrange(1, 50)}")
+                       for _ in range(rng.randrange(3))],
+        "references": [{
+            "hash": f"{rng.getrandbits(160):040x}",
+            "parts": [make_snak(rng, "P248"), make_snak(rng, "P813")]
+        } for _ in range(rng.randrange(1, 3))]
+    }
+
+def make_entity(n_statements, n_properties=None, seed=0, entity_id="Q1"):
+    rng = random.Random(seed)
+    if n_properties is None:
+        n_properties = max(1, n_statements // 20)
+    languages = ["en", "de", "fr", "es", "it", "nl", "ja", "zh", "ru", "pt"]
+    statements = {}
+    for n in range(n_statements):
+        property_id = f"P{n % n_properties + 1}"
+        statements.setdefault(property_id, []).append(
+            make_statement(rng, entity_id, property_id))
+    return {
+        "id": entity_id,
+        "type": "item",
+        "labels": {language: f"label {language}" for language in languages},
+        "descriptions": {language: f"description {language}" for language in languages},
+        "aliases": {language: [f"alias {language} {n}" for n in range(3)] for language in languages},
+        "statements": statements,
+        "sitelinks": {f"{language}wiki": {
+            "title": f"Title {language}",
+            "badges": [],
+            "url": f"https://{language}.wikipedia.org/wiki/Title"
+        } for language in languages}
+    }
+
+# Edits applied to a copy of an entity, named for reporting
+
+def edit_label(entity, rng):
+    entity["labels"]["en"] = "changed label"
+
+def edit_statement_value(entity, rng):
+    statements = rng.choice(list(entity["statements"].values()))
+    rng.choice(statements)["value"]["content"] = "changed value"
+
+def remove_first_statement(entity, rng):
+    # Shifts every later statement of the busiest property down by one
+    statements = max(entity["statements"].values(), key=len)
+    statements.pop(0)
+
+def insert_statement_at_front(entity, rng):
+    property_id, statements = max(entity["statements"].items(), key=lambda item: len(item[1]))
+    statements.insert(0, make_statement(rng, entity["id"], property_id))
+
+def append_statements(entity, rng):
+    property_id = "P9999"
+    entity["statements"][property_id] = [
+        make_statement(rng, entity["id"], property_id) for _ in range(10)]
+
+edits = {
+    "label": edit_label,
+    "statement value": edit_statement_value,
+    "remove first statement": remove_first_statement,
+    "insert statement at front": insert_statement_at_front,
+    "append 10 statements": append_statements
+}
@@ -0,0 +1,265 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+entity_path_pattern = re.compile(r"^/entities/[^/]+/([^/?]+)")
+statement_path_pattern = re.compile(r"^/statements/([^$/?]+)\$")
+
+def entity_id_from_path(path):
+    # "/entities/items/Q42/labels/en" and "/statements/Q42$..." both belong
+    # to Q42
+    match = entity_path_pattern.match(path) or statement_path_pattern.match(path)
+    if match is None:
+        return None
+    return match.group(1)
+
+def cache_key(path, params):
+    if not params:
+        return path
+    return path + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+class CacheEntry:
+    def __init__(self, etag, body, stored_at):
+        self.etag = etag
+        self.body = body
+        self.stored_at = stored_at
+
+    def size(self):
+        return len(self.body)
+
+class ResponseCache:
+    # In-memory LRU cache of GET response bodies, keyed by endpoint path.
+    # Entries younger than ttl seconds are served without a request; older
+    # ones are revalidated with If-None-Match, so an unchanged entity costs
+    # a bodiless 304. Raw bytes are stored, which keeps the size bound exact
+    # and means callers always get a fresh copy to mutate.
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_entity = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        # Returns (entry, fresh). A stale entry is still returned so its ETag
+        # can be sent for revalidation.
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            self.entries.move_to_end(key)
+            if time.monotonic() - entry.stored_at < self.ttl:
+                self.hits += 1
+                return entry, True
+            return entry, False
+
+    def store(self, key, etag, body):
+        entry = CacheEntry(etag, body, time.monotonic())
+        if entry.size() > self.max_bytes:
+            return
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = entry
+            self.total_bytes += entry.size()
+            entity_id = entity_id_from_path(key)
+            if entity_id is not None:
+                self.keys_by_entity.setdefault(entity_id, set()).add(key)
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def revalidated(self, key):
+        # The server answered 304 Not Modified
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.stored_at = time.monotonic()
+                self.revalidations += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def miss(self, key):
+        # The server sent a new body for an entry we tried to revalidate
+        with self.lock:
+            self.misses += 1
+
+    def invalidate(self, entity_id):
+        with self.lock:
+            for key in list(self.keys_by_entity.get(entity_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_entity.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size()
+        entity_id = entity_id_from_path(key)
+        keys = self.keys_by_entity.get(entity_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_entity[entity_id]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses
+            }
+
+class DiskCache:
+    # SQLite-backed drop-in for ResponseCache that survives restarts and can
+    # be shared by several worker processes. Rows are keyed by endpoint path
+    # and carry the entity ID and revision (ETag) they belong to. The
+    # database runs in WAL mode, so readers never block the single writer
+    # and a busy writer is waited for rather than failed.
+    #
+    # Entries older than max_age seconds are deleted, and the oldest entries
+    # go first once the bodies add up to more than max_bytes. Eviction runs
+    # every evict_every stores, or on demand with evict().
+    def __init__(self, path, ttl=3600, max_age=7 * 24 * 3600,
+                 max_bytes=1024 * 1024 * 1024, evict_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stores = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        db = self._db()
+        db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                          key TEXT PRIMARY KEY,
+                          entity_id TEXT,
+                          revision TEXT,
+                          body BLOB NOT NULL,
+                          size INTEGER NOT NULL,
+                          stored_at REAL NOT NULL)""")
+        db.execute("CREATE INDEX IF NOT EXISTS responses_entity ON responses (entity_id, revision)")
+        db.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+
+    def _db(self):
+        # sqlite3 connections must not cross threads or forks
+        db = getattr(self.local, "db", None)
+        if db is None or self.local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+            self.local.pid = os.getpid()
+        return db
+
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, key):
+        row = self._db().execute(
+            "SELECT revision, body, stored_at FROM responses WHERE key = ?",
+            (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None, False
+        revision, body, stored_at = row
+        if time.time() - stored_at > self.max_age:
+            self._count("misses")
+            return None, False
+        # Freshness is judged on the wall clock, since rows are shared
+        # between processes
+        entry = CacheEntry(revision, body, stored_at)
+        if time.time() - stored_at < self.ttl:
+            self._count("hits")
+            return entry, True
+        return entry, False
+
+    def store(self, key, etag, body):
+        body = bytes(body)
+        self._db().execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (key, entity_id_from_path(key), etag, body, len(body), time.time()))
+        with self.lock:
+            self.stores += 1
+            evict = self.stores % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def revalidated(self, key):
+        db = self._db()
+        db.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+        row = db.execute("SELECT revision, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("revalidations")
+        return CacheEntry(row[0], row[1], time.time())
+
+    def miss(self, key):
+        self._count("misses")
+
+    def invalidate(self, entity_id):
+        self._db().execute("DELETE FROM responses WHERE entity_id = ?", (entity_id,))
+
+    def get_revision(self, entity_id):
+        # Latest revision cached for any of the entity's endpoints
+        row = self._db().execute(
+            "SELECT revision FROM responses WHERE entity_id = ? ORDER BY stored_at DESC LIMIT 1",
+            (entity_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def evict(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM responses WHERE stored_at < ?",
+                       (time.time() - self.max_age,))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Walk from the oldest entry until enough bytes are freed
+                excess = total - self.max_bytes
+                cutoff = None
+                for stored_at, size in db.execute(
+                        "SELECT stored_at, size FROM responses ORDER BY stored_at"):
+                    excess -= size
+                    cutoff = stored_at
+                    if excess <= 0:
+                        break
+                db.execute("DELETE FROM responses WHERE stored_at <= ?", (cutoff,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self._db().execute("DELETE FROM responses")
+
+    def stats(self):
+        entries, total = self._db().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self.lock:
+            return {
+                "entries": entries,
+                "bytes": total,
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses
+            }
@@ -0,0 +1,56 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON encoding and decoding for request bodies, responses, dumps and
+# journals. Codecs encode straight to compact UTF-8 bytes and decode bytes
+# or str. orjson is used if it is installed (pip install orjson), the
+# standard library otherwise:
+#
+#   api = WikibaseRestAPI(codec=get_codec("json"))
+#
+# sort_keys=True gives the same bytes for equal values whatever their key
+# order, for use as a comparison key.
+
+class StdlibCodec:
+    name = "json"
+
+    def __init__(self):
+        self.encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+        self.sorted_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"),
+                                               sort_keys=True)
+
+    def dumps(self, value, sort_keys=False):
+        encoder = self.sorted_encoder if sort_keys else self.encoder
+        return encoder.encode(value).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def dumps(self, value, sort_keys=False):
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+    def loads(self, data):
+        # orjson.JSONDecodeError is a json.JSONDecodeError
+        return orjson.loads(data)
+
+codecs = {"json": StdlibCodec}
+if orjson is not None:
+    codecs["orjson"] = OrjsonCodec
+
+def get_codec(name=None):
+    # The named codec, or by default the fastest one installed
+    if name is None:
+        name = "orjson" if "orjson" in codecs else "json"
+    if name not in codecs:
+        raise ValueError(f"Unknown or uninstalled JSON codec {name}; "
+                         f"choose from {', '.join(codecs)}")
+    return codecs[name]()
+
+default_codec = get_codec()
@@ -0,0 +1,274 @@
+import sys
+
+# Compact, read-mostly copies of entities in the shape WikibaseRestAPI
+# returns, for holding a few hundred thousand statements in memory at once
+# (cross-entity checks, dedupe planning). A Snak takes one __slots__ object
+# instead of three dicts, lists become tuples and property IDs, language
+# codes, site IDs, data types, ranks and item values are interned, so every
+# "P31" or "Q5" is the same string object. Keyed sections stay dicts, since
+# a dict beats a tuple of pairs once there are more than a few keys.
+#
+# to_dict() gives back exactly what from_dict() was given. Keys this module
+# does not know about are kept frozen in .extra, and absent keys stay
+# absent.
+
+# Marks a key that was not in the dict
+absent = object()
+
+# Data types whose values are entity IDs, and so repeat a lot
+interned_types = {"wikibase-item", "wikibase-property", "wikibase-lexeme",
+                  "wikibase-form", "wikibase-sense"}
+# Value fields that hold a URL or code shared by many values
+interned_keys = {"calendarmodel", "unit", "globe", "language"}
+
+class Fields(tuple):
+    # A frozen dict, as ((key, value), ...); plain tuples are frozen lists
+    __slots__ = ()
+
+def _intern(value):
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+def freeze(value):
+    if isinstance(value, dict):
+        return Fields((sys.intern(key), freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value):
+    if isinstance(value, Fields):
+        return {key: thaw(item) for key, item in value}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+def _freeze_content(content, data_type):
+    if isinstance(content, dict):
+        return Fields((sys.intern(key), _intern(item) if key in interned_keys else freeze(item))
+                      for key, item in content.items())
+    if data_type in interned_types:
+        return _intern(content)
+    return freeze(content)
+
+def _extra(data, known):
+    extra = {key: value for key, value in data.items() if key not in known}
+    return freeze(extra) if extra else None
+
+class CompactSnak:
+    __slots__ = ("property_id", "data_type", "value_type", "content", "extra")
+
+    @classmethod
+    def from_dict(cls, data):
+        snak = cls.__new__(cls)
+        snak._load(data)
+        return snak
+
+    def _load(self, data):
+        prop = data.get("property")
+        value = data.get("value")
+        if isinstance(prop, dict) and "id" in prop and prop.keys() <= {"id", "data_type"} \
+                and isinstance(value, dict) and "type" in value \
+                and value.keys() <= {"type", "content"}:
+            self.property_id = sys.intern(prop["id"])
+            self.data_type = _intern(prop.get("data_type", absent))
+            self.value_type = sys.intern(value["type"])
+            self.content = absent
+            if "content" in value:
+                self.content = _freeze_content(value["content"], self.data_type)
+            self.extra = _extra(data, ("property", "value"))
+        else:
+            # Not a shape we know; keep all of it as it is
+            self.property_id = absent
+            self.data_type = absent
+            self.value_type = absent
+            self.content = absent
+            self.extra = _extra(data, ())
+
+    def to_dict(self):
+        data = {}
+        if self.property_id is not absent:
+            data["property"] = {"id": self.property_id}
+            if self.data_type is not absent:
+                data["property"]["data_type"] = self.data_type
+            data["value"] = {"type": self.value_type}
+            if self.content is not absent:
+                data["value"]["content"] = thaw(self.content)
+        if self.extra is not None:
+            data.update(thaw(self.extra))
+        return data
+
+    def get_property_id(self):
+        return None if self.property_id is absent else self.property_id
+
+    def get_value(self):
+        if self.property_id is absent:
+            return None
+        value = {"type": self.value_type}
+        if self.content is not absent:
+            value["content"] = thaw(self.content)
+        return value
+
+class CompactReference:
+    __slots__ = ("hash", "parts", "extra")
+
+    @classmethod
+    def from_dict(cls, data):
+        reference = cls.__new__(cls)
+        reference.hash = data.get("hash", absent)
+        reference.parts = absent
+        known = ["hash"]
+        if isinstance(data.get("parts"), list):
+            reference.parts = tuple(CompactSnak.from_dict(part) for part in data["parts"])
+            known.append("parts")
+        reference.extra = _extra(data, known)
+        return reference
+
+    def to_dict(self):
+        data = {}
+        if self.hash is not absent:
+            data["hash"] = self.hash
+        if self.parts is not absent:
+            data["parts"] = [part.to_dict() for part in self.parts]
+        if self.extra is not None:
+            data.update(thaw(self.extra))
+        return data
+
+class CompactStatement(CompactSnak):
+    __slots__ = ("id", "rank", "qualifiers", "references")
+
+    def _load(self, data):
+        super()._load(data)
+        if self.property_id is absent:
+            self.id = self.rank = self.qualifiers = self.references = absent
+            return
+        self.id = data.get("id", absent)
+        self.rank = _intern(data.get("rank", absent))
+        self.qualifiers = absent
+        self.references = absent
+        known = ["property", "value", "id", "rank"]
+        if isinstance(data.get("qualifiers"), list):
+            self.qualifiers = tuple(CompactSnak.from_dict(qualifier)
+                                    for qualifier in data["qualifiers"])
+            known.append("qualifiers")
+        if isinstance(data.get("references"), list):
+            self.references = tuple(CompactReference.from_dict(reference)
+                                    for reference in data["references"])
+            known.append("references")
+        self.extra = _extra(data, known)
+
+    def to_dict(self):
+        data = {}
+        if self.id is not absent:
+            data["id"] = self.id
+        if self.rank is not absent:
+            data["rank"] = self.rank
+        data.update(super().to_dict())
+        if self.qualifiers is not absent:
+            data["qualifiers"] = [qualifier.to_dict() for qualifier in self.qualifiers]
+        if self.references is not absent:
+            data["references"] = [reference.to_dict() for reference in self.references]
+        return data
+
+    def get_id(self):
+        return None if self.id is absent else self.id
+
+class CompactSitelink:
+    __slots__ = ("title", "badges", "url", "extra")
+
+    @classmethod
+    def from_dict(cls, data):
+        sitelink = cls.__new__(cls)
+        sitelink.title = data.get("title", absent)
+        sitelink.url = data.get("url", absent)
+        sitelink.badges = absent
+        known = ["title", "url"]
+        if isinstance(data.get("badges"), list):
+            sitelink.badges = tuple(_intern(badge) for badge in data["badges"])
+            known.append("badges")
+        sitelink.extra = _extra(data, known)
+        return sitelink
+
+    def to_dict(self):
+        data = {}
+        if self.title is not absent:
+            data["title"] = self.title
+        if self.badges is not absent:
+            data["badges"] = list(self.badges)
+        if self.url is not absent:
+            data["url"] = self.url
+        if self.extra is not None:
+            data.update(thaw(self.extra))
+        return data
+
+class CompactEntity:
+    __slots__ = ("id", "type", "labels", "descriptions", "aliases", "statements",
+                 "sitelinks", "extra")
+    known = ("id", "type", "labels", "descriptions", "aliases", "statements", "sitelinks")
+
+    @classmethod
+    def from_dict(cls, data):
+        entity = cls.__new__(cls)
+        entity.id = data.get("id", absent)
+        entity.type = _intern(data.get("type", absent))
+        entity.labels = entity._terms(data, "labels")
+        entity.descriptions = entity._terms(data, "descriptions")
+        entity.aliases = absent
+        if "aliases" in data:
+            entity.aliases = {sys.intern(language): tuple(aliases)
+                              for language, aliases in data["aliases"].items()}
+        entity.statements = absent
+        if "statements" in data:
+            entity.statements = {
+                sys.intern(property_id): tuple(CompactStatement.from_dict(statement)
+                                               for statement in statements)
+                for property_id, statements in data["statements"].items()}
+        entity.sitelinks = absent
+        if "sitelinks" in data:
+            entity.sitelinks = {sys.intern(site_id): CompactSitelink.from_dict(sitelink)
+                                for site_id, sitelink in data["sitelinks"].items()}
+        entity.extra = _extra(data, cls.known)
+        return entity
+
+    @staticmethod
+    def _terms(data, section):
+        if section not in data:
+            return absent
+        return {sys.intern(language): text for language, text in data[section].items()}
+
+    def to_dict(self):
+        data = {}
+        for key in ("id", "type"):
+            if getattr(self, key) is not absent:
+                data[key] = getattr(self, key)
+        for section in ("labels", "descriptions"):
+            if getattr(self, section) is not absent:
+                data[section] = dict(getattr(self, section))
+        if self.aliases is not absent:
+            data["aliases"] = {language: list(aliases)
+                               for language, aliases in self.aliases.items()}
+        if self.statements is not absent:
+            data["statements"] = {
+                property_id: [statement.to_dict() for statement in statements]
+                for property_id, statements in self.statements.items()}
+        if self.sitelinks is not absent:
+            data["sitelinks"] = {site_id: sitelink.to_dict()
+                                 for site_id, sitelink in self.sitelinks.items()}
+        if self.extra is not None:
+            data.update(thaw(self.extra))
+        return data
+
+    def get_id(self):
+        return None if self.id is absent else self.id
+
+    def get_label(self, language_code):
+        if self.labels is absent:
+            return None
+        return self.labels.get(language_code)
+
+    def get_statements(self, property_id=None):
+        statements = {} if self.statements is absent else self.statements
+        if property_id is None:
+            return statements
+        return statements.get(property_id, ())
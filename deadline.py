@@ -0,0 +1,52 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Wall-clock budgets for API calls and the batches made of them.
+#
+# Every request made inside "with deadline(seconds):" has to finish by the
+# time the block's budget runs out, retries and rate limiter waits
+# included. Requests cut their socket timeouts to the time left and raise
+# DeadlineExceeded rather than start (or wait for) an attempt that cannot
+# finish in time. Nested deadlines can only shorten the budget.
+#
+#   with deadline(600):
+#       for entity in connection.load_many(ids):
+#           ...
+#           queue.submit(entity)
+#       queue.join()
+#
+# The budget is a context variable, so it follows asyncio tasks, and
+# Connection.load_many, EditQueue and journal.replay carry it over to their
+# worker threads.
+
+_expires = contextvars.ContextVar("wikibase_deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    # Not an OSError (unlike TimeoutError), so it is never retried
+    pass
+
+def expiry(seconds=None):
+    # The time.monotonic() by which work started now has to be done: in
+    # seconds, or at the enclosing deadline if that is sooner. None if
+    # there is no limit.
+    expires = _expires.get()
+    if seconds is not None:
+        own = time.monotonic() + seconds
+        expires = own if expires is None else min(expires, own)
+    return expires
+
+def remaining(expires=None):
+    # Seconds left until expires (by default, the enclosing deadline), or
+    # None if there is no limit
+    if expires is None:
+        expires = _expires.get()
+    return None if expires is None else expires - time.monotonic()
+
+@contextmanager
+def deadline(seconds):
+    token = _expires.set(expiry(seconds))
+    try:
+        yield
+    finally:
+        _expires.reset(token)
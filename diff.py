@@ -0,0 +1,83 @@
+from codec import default_codec
+
+# RFC 6902 patches between two versions of a Wikibase entity (or any part of
+# one). Unlike jsonpatch.make_patch, list items are matched by identity
+# rather than by position: statements by "id", references by "hash", and
+# everything else (qualifiers, reference parts, aliases, badges) by value.
+# Removing or inserting a statement therefore costs a single operation
+# instead of a cascade of replaces down the rest of the list, and unchanged
+# items are never descended into twice.
+
+def make_patch(old, new):
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+def escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def _diff(old, new, path, ops):
+    if old is new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{escape(key)}"})
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, f"{path}/{escape(key)}", ops)
+            else:
+                ops.append({"op": "add", "path": f"{path}/{escape(key)}", "value": value})
+    elif isinstance(old, list) and isinstance(new, list):
+        _diff_list(old, new, path, ops)
+    elif type(old) is not type(new) or old != new:
+        ops.append({"op": "replace", "path": path, "value": new})
+
+def _identity(item):
+    if isinstance(item, dict):
+        if item.get("id") is not None:
+            return ("id", item["id"])
+        if item.get("hash") is not None:
+            return ("hash", item["hash"])
+    return ("value", default_codec.dumps(item, sort_keys=True))
+
+def _identities(items):
+    # Numbers repeated identities so that duplicates pair up in order
+    seen = {}
+    keys = []
+    for item in items:
+        key = _identity(item)
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        keys.append((key, n))
+    return keys
+
+def _diff_list(old, new, path, ops):
+    if old == new:
+        return
+    old_keys = _identities(old)
+    new_keys = _identities(new)
+    new_key_set = set(new_keys)
+    old_index = {key: n for n, key in enumerate(old_keys)}
+
+    # Removals go from the end so earlier indexes stay valid
+    for n in range(len(old_keys) - 1, -1, -1):
+        if old_keys[n] not in new_key_set:
+            ops.append({"op": "remove", "path": f"{path}/{n}"})
+    current = [key for key in old_keys if key in new_key_set]
+
+    # Walk the new list, moving matched items into place (a no-op unless
+    # the order changed) and inserting new ones
+    for n, key in enumerate(new_keys):
+        if key in old_index:
+            if current[n] != key:
+                m = current.index(key, n)
+                ops.append({"op": "move", "from": f"{path}/{m}", "path": f"{path}/{n}"})
+                current.insert(n, current.pop(m))
+            # Items matched by value are equal by definition; for the rest a
+            # C-level equality check is far cheaper than walking them
+            if key[0][0] != "value" and old[old_index[key]] != new[n]:
+                _diff(old[old_index[key]], new[n], f"{path}/{n}", ops)
+        else:
+            ops.append({"op": "add", "path": f"{path}/{n}", "value": new[n]})
+            current.insert(n, key)
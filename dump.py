@@ -0,0 +1,295 @@
+import bz2
+import gzip
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from codec import default_codec
+from entity import Entity
+
+# Streaming reader for Wikibase JSON dumps (latest-all.json[.gz|.bz2]):
+# one entity per line between "[" and "]", each line but the last ending
+# in ",". Entities come out in the shape WikibaseRestAPI.get_entity
+# returns, or as in the dump with raw=True.
+#
+# With processes > 1 the work is spread over a process pool. Uncompressed
+# dumps and multistream .bz2 dumps (many bzip2 streams back to back) are
+# cut into byte ranges that each worker decompresses and parses on its
+# own. A .gz or single-stream .bz2 dump can only be decompressed from the
+# start, so the main process does that and the pool parses batches of
+# lines. Either way at most 2 * processes ranges or batches are in flight.
+
+# A bzip2 stream header: "BZh", the block size, then the block magic
+bz2_header = re.compile(rb"BZh[1-9]1AY&SY")
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+def parse_line(line):
+    # The entity on a dump line, or None for the brackets around them
+    line = line.strip()
+    if line.endswith(b","):
+        line = line[:-1]
+    if not line or line in (b"[", b"]"):
+        return None
+    return default_codec.loads(line)
+
+# Dump (Wikibase JSON) to REST API shape
+
+entity_prefixes = {"item": "Q", "property": "P", "lexeme": "L"}
+
+def _content(datavalue):
+    value = datavalue["value"]
+    value_type = datavalue["type"]
+    if value_type == "wikibase-entityid":
+        if "id" in value:
+            return value["id"]
+        return entity_prefixes[value["entity-type"]] + str(value["numeric-id"])
+    if value_type == "time":
+        return {"time": value["time"], "precision": value["precision"],
+                "calendarmodel": value["calendarmodel"]}
+    if value_type == "globecoordinate":
+        return {"latitude": value["latitude"], "longitude": value["longitude"],
+                "precision": value["precision"], "globe": value["globe"]}
+    return value
+
+def _snak(snak):
+    rest = {
+        "property": {"id": snak["property"], "data_type": snak.get("datatype")},
+        "value": {"type": snak["snaktype"]}
+    }
+    if snak["snaktype"] == "value":
+        rest["value"]["content"] = _content(snak["datavalue"])
+    return rest
+
+def _snaks(snaks, order):
+    return [_snak(snak) for property_id in order or snaks for snak in snaks[property_id]]
+
+def _statement(statement):
+    rest = {"id": statement["id"], "rank": statement["rank"]}
+    rest.update(_snak(statement["mainsnak"]))
+    rest["qualifiers"] = _snaks(statement.get("qualifiers", {}), statement.get("qualifiers-order"))
+    rest["references"] = [{
+        "hash": reference["hash"],
+        "parts": _snaks(reference["snaks"], reference.get("snaks-order"))
+    } for reference in statement.get("references", [])]
+    return rest
+
+def to_rest(entity):
+    # Items and properties are converted; other entity types (lexemes,
+    # media info) are passed through as they are. The dump has no sitelink
+    # URLs, so sitelinks come without one.
+    if entity.get("type") not in ("item", "property"):
+        return entity
+    rest = {
+        "id": entity["id"],
+        "type": entity["type"],
+        "labels": {language: term["value"] for language, term in entity.get("labels", {}).items()},
+        "descriptions": {language: term["value"]
+                         for language, term in entity.get("descriptions", {}).items()},
+        "aliases": {language: [alias["value"] for alias in aliases]
+                    for language, aliases in entity.get("aliases", {}).items()},
+        "statements": {property_id: [_statement(statement) for statement in statements]
+                       for property_id, statements in entity.get("claims", {}).items()}
+    }
+    if entity["type"] == "property":
+        rest["data_type"] = entity.get("datatype")
+    else:
+        rest["sitelinks"] = {site_id: {"title": sitelink["title"], "badges": sitelink["badges"]}
+                             for site_id, sitelink in entity.get("sitelinks", {}).items()}
+    return rest
+
+# Filtering
+
+def _prefilter(types, properties):
+    # A cheap test on the undecoded line. It can let through lines that
+    # _matches then rejects, but never rejects a match.
+    patterns = []
+    if types is not None:
+        names = b"|".join(re.escape(entity_type.encode()) for entity_type in types)
+        patterns.append(re.compile(rb'"type":\s*"(?:%s)"' % names))
+    if properties is not None:
+        names = b"|".join(re.escape(property_id.encode()) for property_id in properties)
+        patterns.append(re.compile(rb'"(?:%s)":' % names))
+    return lambda line: all(pattern.search(line) for pattern in patterns)
+
+def _matches(entity, types, properties):
+    if types is not None and entity.get("type") not in types:
+        return False
+    if properties is not None:
+        claims = entity.get("claims", {})
+        if not any(property_id in claims for property_id in properties):
+            return False
+    return True
+
+def _entities(lines, types, properties, raw, revisions):
+    prefilter = _prefilter(types, properties)
+    for line in lines:
+        if not prefilter(line):
+            continue
+        entity = parse_line(line)
+        if entity is None or not _matches(entity, types, properties):
+            continue
+        result = entity if raw else to_rest(entity)
+        if revisions:
+            revision = entity.get("lastrevid")
+            result = (result, None if revision is None else str(revision))
+        yield result
+
+def _process_lines(lines, *options):
+    return list(_entities(lines, *options))
+
+# Byte-range shards
+#
+# A shard covers the lines that start in (start, end]: it drops everything
+# up to and including the first newline at or after start (unless start is
+# 0) and reads past end to finish the last line. Neighbouring shards thus
+# neither miss nor repeat a line, wherever the cut falls.
+
+def _range_lines(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        if start > 0:
+            position += len(f.readline())
+        while position <= end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
+            position += len(line)
+
+def _next_stream(f, offset, size, window=1 << 20):
+    # Offset of the first bzip2 stream header at or after offset
+    while offset < size:
+        f.seek(offset)
+        block = f.read(window + 9)
+        match = bz2_header.search(block)
+        if match is not None:
+            return offset + match.start()
+        offset += window
+    return size
+
+def _bz2_stream_chunks(f, start, read_size=1 << 20):
+    # Yields (stream start, decompressed data) across consecutive streams
+    f.seek(start)
+    stream_start = start
+    # File offset just past what has been read
+    consumed = start
+    decompressor = bz2.BZ2Decompressor()
+    pending = b""
+    while True:
+        if not pending:
+            pending = f.read(read_size)
+            if not pending:
+                return
+            consumed += len(pending)
+        data = decompressor.decompress(pending)
+        pending = b""
+        if data:
+            yield stream_start, data
+        if decompressor.eof:
+            pending = decompressor.unused_data
+            stream_start = consumed - len(pending)
+            decompressor = bz2.BZ2Decompressor()
+
+def _bz2_range_lines(path, start, end):
+    # start and end are stream offsets; positions are in decompressed bytes
+    with open(path, "rb") as f:
+        buffer = b""
+        position = 0
+        boundary = None
+        skip = start > 0
+        for stream_start, data in _bz2_stream_chunks(f, start):
+            if boundary is None and stream_start >= end:
+                boundary = position + len(buffer)
+            buffer += data
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                line += b"\n"
+                if skip:
+                    skip = False
+                elif boundary is not None and position > boundary:
+                    return
+                else:
+                    yield line
+                position += len(line)
+        if buffer and not skip and (boundary is None or position <= boundary):
+            yield buffer
+
+def _shard(path, start, end, compressed, *options):
+    lines = _bz2_range_lines(path, start, end) if compressed else _range_lines(path, start, end)
+    return _process_lines(lines, *options)
+
+def _shards(path, chunk_bytes):
+    # (start, end) ranges, or None if the dump cannot be split
+    size = os.path.getsize(path)
+    if path.endswith(".gz"):
+        return None
+    if not path.endswith(".bz2"):
+        starts = list(range(0, size, chunk_bytes)) + [size]
+        return list(zip(starts, starts[1:]))
+    with open(path, "rb") as f:
+        starts = [0]
+        for offset in range(chunk_bytes, size, chunk_bytes):
+            start = _next_stream(f, offset, size)
+            if start > starts[-1] and start < size:
+                starts.append(start)
+    if len(starts) == 1:
+        return None
+    starts.append(size)
+    return list(zip(starts, starts[1:]))
+
+def _batches(path, batch_lines):
+    with _open(path) as f:
+        batch = []
+        for line in f:
+            batch.append(line)
+            if len(batch) >= batch_lines:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def read_dump(path, types=None, properties=None, processes=1, raw=False, revisions=False,
+              chunk_bytes=64 * 1024 * 1024, batch_lines=1000):
+    # Yields the entities in a dump, in order. types (e.g. ["item"]) and
+    # properties (e.g. ["P31"], matching entities with any of them) are
+    # checked on the raw line before it is parsed. With revisions=True,
+    # yields (entity, revision ID) pairs.
+    options = (None if types is None else set(types), properties, raw, revisions)
+    if processes <= 1:
+        with _open(path) as f:
+            yield from _entities(f, *options)
+        return
+
+    shards = _shards(path, chunk_bytes)
+    if shards is not None:
+        compressed = path.endswith(".bz2")
+        tasks = ((_shard, path, start, end, compressed) + options for start, end in shards)
+    else:
+        tasks = ((_process_lines, batch) + options for batch in _batches(path, batch_lines))
+
+    window = processes * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for task in tasks:
+            pending.append(executor.submit(*task))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def read_dump_entities(path, connection, **kwargs):
+    # Like read_dump, but yields Entity objects on connection, loaded at
+    # the dump's revision of each entity: submitting one fails with an
+    # edit conflict (and is rebased) if the entity has changed since.
+    for data, revision in read_dump(path, revisions=True, **kwargs):
+        entity = Entity(connection=connection)
+        entity._set_loaded(data, revision)
+        yield entity
@@ -0,0 +1,289 @@
+import argparse
+import heapq
+import mmap
+import os
+import re
+import struct
+import tempfile
+from collections import deque
+from dump import _bz2_stream_chunks, parse_line, to_rest
+
+# An on-disk index from entity ID to the position of its line in a dump, for
+# looking up single entities without scanning. The index is a header and a
+# sorted array of fixed-size records, memory-mapped and binary searched, so
+# opening it costs nothing and a lookup touches a few pages.
+#
+# Uncompressed dumps are indexed by byte offset. Multistream .bz2 dumps are
+# indexed by the offset of the bzip2 stream a line starts in and the line's
+# offset in that stream's decompressed data, so a lookup decompresses one
+# stream (and the next, if the line runs on). .gz dumps cannot be read from
+# the middle and are not supported.
+
+magic = b"WBDUMPIX"
+# magic, 1 for .bz2, number of records, size of the dump indexed
+header = struct.Struct("<8sQQQ")
+# Records are big-endian so that sorting them as bytes sorts them by key
+plain_record = struct.Struct(">QQ")
+bz2_record = struct.Struct(">QQQ")
+key_struct = struct.Struct(">Q")
+
+id_pattern = re.compile(r"([A-Z])([1-9][0-9]*)")
+line_id_pattern = re.compile(rb'"id":\s*"([^"]+)"')
+
+def id_key(entity_id):
+    # Q42 -> ord("Q") << 56 | 42, or None for IDs that do not fit
+    match = id_pattern.fullmatch(entity_id)
+    if match is None or int(match[2]) >= 1 << 56:
+        return None
+    return ord(match[1]) << 56 | int(match[2])
+
+def _is_bz2(path):
+    if path.endswith(".gz"):
+        raise ValueError("Cannot index a .gz dump; use an uncompressed or multistream .bz2 one")
+    return path.endswith(".bz2")
+
+def _plain_lines(path):
+    # (line, offset)
+    with open(path, "rb") as f:
+        position = 0
+        for line in f:
+            yield line, position
+            position += len(line)
+
+def _bz2_lines(path):
+    # (line, stream offset, offset in the stream's decompressed data)
+    streams = deque()
+    with open(path, "rb") as f:
+        buffer = b""
+        position = 0
+        decompressed = 0
+        current = None
+        for stream_start, data in _bz2_stream_chunks(f, 0):
+            if stream_start != current:
+                streams.append((decompressed, stream_start))
+                current = stream_start
+            decompressed += len(data)
+            buffer += data
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                # Drop streams that end before this line starts
+                while len(streams) > 1 and streams[1][0] <= position:
+                    streams.popleft()
+                base, offset = streams[0]
+                yield line, offset, position - base
+                position += len(line) + 1
+        if buffer:
+            while len(streams) > 1 and streams[1][0] <= position:
+                streams.popleft()
+            base, offset = streams[0]
+            yield buffer, offset, position - base
+
+def _records(dump_path, compressed):
+    record = bz2_record if compressed else plain_record
+    lines = _bz2_lines(dump_path) if compressed else _plain_lines(dump_path)
+    for line, *position in lines:
+        match = line_id_pattern.search(line)
+        if match is None:
+            continue
+        key = id_key(match[1].decode())
+        if key is not None:
+            yield record.pack(key, *position)
+
+def _write_run(directory, records):
+    records.sort()
+    f = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+    with f:
+        f.write(b"".join(records))
+    return f.name
+
+def _read_run(path, size):
+    with open(path, "rb") as f:
+        while True:
+            record = f.read(size)
+            if not record:
+                return
+            yield record
+
+def build_index(dump_path, index_path, run_records=1000000):
+    # Sorts in runs of run_records records, merged into the index at the
+    # end, so memory stays bounded on full-size dumps
+    compressed = _is_bz2(dump_path)
+    size = (bz2_record if compressed else plain_record).size
+    directory = os.path.dirname(os.path.abspath(index_path))
+    with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+        runs = []
+        records = []
+        for record in _records(dump_path, compressed):
+            records.append(record)
+            if len(records) >= run_records:
+                runs.append(_write_run(run_directory, records))
+                records = []
+        records.sort()
+        count = 0
+        with open(index_path, "wb") as f:
+            f.write(header.pack(magic, int(compressed), 0, os.path.getsize(dump_path)))
+            for record in heapq.merge(records, *(_read_run(run, size) for run in runs)):
+                f.write(record)
+                count += 1
+            f.seek(0)
+            f.write(header.pack(magic, int(compressed), count, os.path.getsize(dump_path)))
+    return count
+
+class DumpIndex:
+    # Looks entities up in dump_path through an index built by build_index.
+    # Safe to share between threads.
+    def __init__(self, index_path, dump_path):
+        self.dump_path = dump_path
+        with open(index_path, "rb") as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        found, compressed, self.count, dump_size = header.unpack_from(self.index)
+        if found != magic:
+            self.index.close()
+            raise ValueError(f"Not a dump index: {index_path}")
+        if dump_size != os.path.getsize(dump_path):
+            self.index.close()
+            raise ValueError(f"{index_path} was built for a different dump than {dump_path}")
+        self.compressed = bool(compressed)
+        self.record = bz2_record if self.compressed else plain_record
+        self.dump = None
+        if not self.compressed:
+            with open(dump_path, "rb") as f:
+                self.dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.index.close()
+        if self.dump is not None:
+            self.dump.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, entity_id):
+        return self.position(entity_id) is not None
+
+    def position(self, entity_id):
+        # The indexed position of entity_id's line, or None
+        key = id_key(entity_id)
+        if key is None:
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if key_struct.unpack_from(self.index, header.size + middle * self.record.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count:
+            return None
+        found, *position = self.record.unpack_from(self.index, header.size + low * self.record.size)
+        return tuple(position) if found == key else None
+
+    def _line(self, position):
+        if not self.compressed:
+            offset, = position
+            end = self.dump.find(b"\n", offset)
+            return self.dump[offset:] if end < 0 else self.dump[offset:end]
+        stream, offset = position
+        buffer = b""
+        with open(self.dump_path, "rb") as f:
+            for _, data in _bz2_stream_chunks(f, stream, read_size=1 << 16):
+                buffer += data
+                end = buffer.find(b"\n", offset)
+                if end >= 0:
+                    return buffer[offset:end]
+        return buffer[offset:]
+
+    def get_line(self, entity_id):
+        # entity_id's undecoded dump line, or None
+        position = self.position(entity_id)
+        return None if position is None else self._line(position)
+
+    def get_raw(self, entity_id):
+        # The entity as it is in the dump, or None
+        line = self.get_line(entity_id)
+        return None if line is None else parse_line(line)
+
+    def get(self, entity_id):
+        # The entity in the shape the REST API returns, or None
+        entity = self.get_raw(entity_id)
+        return None if entity is None else to_rest(entity)
+
+class DumpAPI:
+    # A read-only stand-in for WikibaseRestAPI that serves entities from a
+    # DumpIndex, for dry runs and validation without the network:
+    # Connection(api=DumpAPI(index)). Revisions are the dump's, and edits
+    # raise.
+    def __init__(self, index):
+        self.index = index
+        # The last line read, since loading sections one by one asks for
+        # the same entity several times in a row. Lines are parsed again on
+        # every call, so callers never share (and edit) the same dicts.
+        self.last = (None, None)
+
+    def close(self):
+        self.index.close()
+
+    def _entity(self, entity_id):
+        last_id, line = self.last
+        if last_id != entity_id:
+            line = self.index.get_line(entity_id)
+            if line is None:
+                raise KeyError(f"{entity_id} is not in the dump")
+            self.last = (entity_id, line)
+        entity = parse_line(line)
+        revision = entity.get("lastrevid")
+        return to_rest(entity), None if revision is None else str(revision)
+
+    def _section(self, entity_id, section, return_revision):
+        data, revision = self._entity(entity_id)
+        value = data.get(section, {})
+        return (value, revision) if return_revision else value
+
+    def get_entity(self, entity_type, entity_id, fields=None):
+        return self.get_entity_with_revision(entity_type, entity_id, fields)[0]
+
+    def get_entity_with_revision(self, entity_type, entity_id, fields=None):
+        data, revision = self._entity(entity_id)
+        if fields is not None:
+            data = {field: data[field] for field in fields if field in data}
+        return data, revision
+
+    def get_entity_labels(self, entity_type, entity_id, return_revision=False):
+        return self._section(entity_id, "labels", return_revision)
+
+    def get_entity_descriptions(self, entity_type, entity_id, return_revision=False):
+        return self._section(entity_id, "descriptions", return_revision)
+
+    def get_entity_aliases(self, entity_type, entity_id, return_revision=False):
+        return self._section(entity_id, "aliases", return_revision)
+
+    def get_entity_statements(self, entity_type, entity_id, property_id=None,
+        return_revision=False):
+        statements, revision = self._section(entity_id, "statements", True)
+        if property_id is not None:
+            statements = {key: value for key, value in statements.items() if key == property_id}
+        return (statements, revision) if return_revision else statements
+
+    def get_item_sitelinks(self, item_id, return_revision=False):
+        return self._section(item_id, "sitelinks", return_revision)
+
+    def __getattr__(self, name):
+        # Everything else WikibaseRestAPI has writes to the wiki
+        raise AttributeError(f"DumpAPI is read-only and has no {name}()")
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a Wikibase JSON dump by entity ID")
+    parser.add_argument("dump", help="uncompressed or multistream .bz2 dump")
+    parser.add_argument("index", help="index file to write")
+    args = parser.parse_args()
+    print(f"Indexed {build_index(args.dump, args.index)} entities")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+class EditQueue:
+    # Runs edits on a pool of worker threads. Edits sharing a key (normally
+    # the entity ID) run one after another in the order they were queued;
+    # edits with different keys run in parallel. Each queued edit returns a
+    # concurrent.futures.Future holding the API response.
+    def __init__(self, workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.chains = {}
+        self.futures = set()
+        self.closed = False
+
+    def submit(self, entity):
+        # Queues entity.submit(). The entity is diffed when its turn comes,
+        # so changes made to it before then are included.
+        key = entity.get_id()
+        if key is None:
+            # New entities have nothing to be ordered against
+            key = ("new", id(entity))
+        return self.call(key, entity.submit)
+
+    def call(self, key, function, *args, **kwargs):
+        # Queues an arbitrary call, e.g.
+        #   queue.call("Q42", connection.api.replace_item_label, "Q42", "en", "label")
+        # It runs in a copy of the caller's context, so an enclosing
+        # deadline.deadline() applies to it.
+        future = Future()
+        job = (future, contextvars.copy_context(), function, args, kwargs)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("EditQueue is closed")
+            self.futures.add(future)
+            future.add_done_callback(self._forget)
+            if key in self.chains:
+                self.chains[key].append(job)
+            else:
+                self.chains[key] = deque([job])
+                self.executor.submit(self._drain, key)
+        return future
+
+    def _forget(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def _drain(self, key):
+        # The chain stays registered until it is empty, so edits queued for
+        # this key in the meantime are picked up here rather than run
+        # concurrently by another worker.
+        while True:
+            with self.lock:
+                chain = self.chains[key]
+                if not chain:
+                    del self.chains[key]
+                    return
+                future, context, function, args, kwargs = chain.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(context.run(function, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def pending(self):
+        with self.lock:
+            return len(self.futures)
+
+    def join(self):
+        # Waits for every edit queued so far, including ones that failed
+        while True:
+            with self.lock:
+                futures = list(self.futures)
+            if not futures:
+                return
+            wait(futures)
+
+    def close(self, wait=True):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,21 +1,95 @@
-import json
+import asyncio
+import contextvars
 import copy
-from api import WikibaseRestAPI, wikidata_endpoint
+import jsonpatch
+from collections import deque
+from contextlib import nullcontext
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from api import (EditConflict, WikibaseRestAPI, default_accept_encoding, default_timeout,
+                 singular, wikidata_endpoint)
+from diff import make_patch
+from async_api import AsyncWikibaseRestAPI
+from edit_queue import EditQueue
+from statement_index import StatementIndex
+
+# Stands in for a key that is absent from a section
+missing = object()
+
+# The parts of an entity that can be loaded and edited on their own
+sections = ("labels", "descriptions", "aliases", "statements", "sitelinks")
 
 class Base:
+    # Called before the object's data changes. Entity sets it on the
+    # statements and sitelinks added to it (and they on their qualifiers,
+    # references and reference parts) so it can record the original value.
+    on_change = None
+
     def __init__(self):
         self.data = {}
 
     def to_dict(self):
         return self.data
 
+    def _changing(self):
+        if self.on_change is not None:
+            self.on_change()
+
 class Connection:
-    def __init__(self, endpoint=wikidata_endpoint, access_token=None, bot=False, edit_summary="Updating item data", tags=[]):
+    def __init__(self, endpoint=wikidata_endpoint, access_token=None, bot=False, edit_summary="Updating item data", tags=[],
+                 session=None, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True,
+                 rate_limiter=None, cache=None, conflict_retries=3, max_targeted_edits=1,
+                 api=None, journal=None, hooks=None, tracer=None, retry_policy=None,
+                 timeout=default_timeout, deadline=None, codec=None,
+                 accept_encoding=default_accept_encoding, compress_requests=None):
+        self._set_options(endpoint, bot, edit_summary, conflict_retries, max_targeted_edits,
+                          tracer)
+        # api replaces the REST client, e.g. with a dump_index.DumpAPI
+        if api is not None:
+            self.api = api
+            return
+        self.api = WikibaseRestAPI(access_token=access_token, endpoint=self.endpoint,
+                                   session=session, pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize, pool_block=pool_block,
+                                   **self._client_options(
+                                       keep_alive, rate_limiter, cache, journal, hooks,
+                                       retry_policy, timeout, deadline, codec,
+                                       accept_encoding, compress_requests))
+
+    def _set_options(self, endpoint, bot, edit_summary, conflict_retries, max_targeted_edits,
+                     tracer):
+        # The options shared with AsyncConnection
         self.endpoint = endpoint
         self.bot = bot
         self.edit_summary = edit_summary
         self.tags = []
-        self.api = WikibaseRestAPI(access_token=access_token, endpoint=self.endpoint)
+        self.conflict_retries = conflict_retries
+        # Submits needing at most this many requests to the narrowest
+        # endpoints are sent that way; anything bigger is one entity PATCH.
+        self.max_targeted_edits = max_targeted_edits
+        # Entities wrap their load, diff and submit phases in
+        # tracer.span(phase, entity_id=...); see metrics.py
+        self.tracer = tracer
+
+    def _client_options(self, keep_alive, rate_limiter, cache, journal, hooks, retry_policy,
+                        timeout, deadline, codec, accept_encoding, compress_requests):
+        # Client options passed on as they are, by both kinds of connection
+        return {"keep_alive": keep_alive, "rate_limiter": rate_limiter, "cache": cache,
+                "journal": journal, "hooks": hooks, "retry_policy": retry_policy,
+                "timeout": timeout, "deadline": deadline, "codec": codec,
+                "accept_encoding": accept_encoding, "compress_requests": compress_requests}
+
+    def close(self):
+        self.api.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_async(self):
+        return False
 
     def add_edit_tag(self, content):
         self.tags.append(content)
@@ -30,6 +104,130 @@ class Connection:
     def append_to_edit_summary(self, content):
         self.edit_summary = f"{self.edit_summary} {content}"
 
+    def edit_queue(self, workers=8):
+        # Edits to the same entity are submitted in order, edits to
+        # different entities in parallel:
+        #   with connection.edit_queue(workers=16) as queue:
+        #       futures = [queue.submit(entity) for entity in entities]
+        return EditQueue(workers=workers)
+
+    def load_many(self, entity_ids, entity_type="items", workers=8, ordered=True, errors=None,
+                  fields=None, properties=None):
+        # Fetches entities on a pool of worker threads and yields them as
+        # Entity objects, either in the order of entity_ids or as soon as
+        # they arrive. At most 2 * workers fetches are queued at a time, so
+        # entity_ids can be a long-running iterator. An ID that cannot be
+        # loaded is skipped and, if errors is a dict, recorded there as
+        # errors[entity_id] = exception. fields and properties are passed on
+        # to Entity. Fetches run in a copy of the context the generator is
+        # advanced in, so an enclosing deadline.deadline() applies to them.
+        def fetch(entity_id):
+            return Entity(connection=self, entity_id=entity_id, entity_type=entity_type,
+                          fields=fields, properties=properties)
+
+        def finish(entity_id, future):
+            try:
+                return future.result()
+            except Exception as e:
+                if errors is not None:
+                    errors[entity_id] = e
+                else:
+                    print(f"Failed to load {entity_id}: {str(e)}")
+                return None
+
+        window = workers * 2
+        entity_ids = iter(entity_ids)
+        pending = deque() if ordered else {}
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                while len(pending) < window:
+                    entity_id = next(entity_ids, None)
+                    if entity_id is None:
+                        break
+                    future = executor.submit(contextvars.copy_context().run, fetch, entity_id)
+                    if ordered:
+                        pending.append((entity_id, future))
+                    else:
+                        pending[future] = entity_id
+                if not pending:
+                    break
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [(pending.pop(future), future) for future in finished]
+                for entity_id, future in done:
+                    entity = finish(entity_id, future)
+                    if entity is not None:
+                        yield entity
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+class AsyncConnection(Connection):
+    # Entities on an AsyncConnection are not loaded on construction; use
+    # "await entity.load_async()" and "await entity.submit_async()".
+    def __init__(self, endpoint=wikidata_endpoint, access_token=None, bot=False, edit_summary="Updating item data", tags=[],
+                 session=None, max_concurrency=100, pool_maxsize=100, pool_maxsize_per_host=0, keep_alive=True,
+                 rate_limiter=None, cache=None, conflict_retries=3, max_targeted_edits=1,
+                 journal=None, hooks=None, tracer=None, retry_policy=None,
+                 timeout=default_timeout, deadline=None, codec=None,
+                 accept_encoding=default_accept_encoding, compress_requests=None):
+        self._set_options(endpoint, bot, edit_summary, conflict_retries, max_targeted_edits,
+                          tracer)
+        self.api = AsyncWikibaseRestAPI(access_token=access_token, endpoint=self.endpoint,
+                                        session=session, max_concurrency=max_concurrency,
+                                        pool_maxsize=pool_maxsize,
+                                        pool_maxsize_per_host=pool_maxsize_per_host,
+                                        **self._client_options(
+                                            keep_alive, rate_limiter, cache, journal, hooks,
+                                            retry_policy, timeout, deadline, codec,
+                                            accept_encoding, compress_requests))
+
+    def is_async(self):
+        return True
+
+    def edit_queue(self, workers=8):
+        raise TypeError("EditQueue submits on threads; on an AsyncConnection, "
+                        "gather entity.submit_async() calls instead")
+
+    async def load_many(self, entity_ids, entity_type="items", workers=8, ordered=True,
+                        errors=None, fields=None, properties=None):
+        # Connection.load_many for asyncio: loads up to workers entities at
+        # a time and returns them as a list, in the order of entity_ids or
+        # as they arrive. Failures are skipped and recorded the same way.
+        semaphore = asyncio.Semaphore(workers)
+        arrived = []
+
+        async def fetch(entity_id):
+            try:
+                async with semaphore:
+                    entity = Entity(connection=self, entity_id=entity_id,
+                                    entity_type=entity_type)
+                    await entity.load_async(fields=fields, properties=properties)
+            except Exception as e:
+                if errors is not None:
+                    errors[entity_id] = e
+                else:
+                    print(f"Failed to load {entity_id}: {str(e)}")
+                return None
+            arrived.append(entity)
+            return entity
+
+        entities = await asyncio.gather(*[fetch(entity_id) for entity_id in entity_ids])
+        if not ordered:
+            return arrived
+        return [entity for entity in entities if entity is not None]
+
+    async def close(self):
+        await self.api.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
 class Snak(Base):
     def __init__(self, property_id=None, data_type=None, value_type="value", value_content=None):
         self.data = {
@@ -53,31 +251,36 @@ class Snak(Base):
         return self.data["value"]
 
     def set_property(self, property_id, data_type):
+        self._changing()
         self.data["property"] = {
             "id": property_id,
             "data_type": data_type
         }
 
     def set_value(self, content):
+        self._changing()
         self.data["value"]["type"] = "value"
         self.data["value"]["content"] = content
 
     def set_no_value(self):
+        self._changing()
         self.data["value"] = {"type": "novalue"}
 
     def set_unknown_value(self):
+        self._changing()
         self.data["value"] = {"type": "somevalue"}
 
     def set_property_and_value(self, property_id, data_type, content):
-        self.data = {
-            "property": {
-                "id": property_id,
-                "data_type": data_type
-            },
-            "value": {
-                "type": "value",
-                "content": content
-            }
+        # Updated in place: the dict may already be part of an entity, and a
+        # Statement keeps its ID, rank, qualifiers and references
+        self._changing()
+        self.data["property"] = {
+            "id": property_id,
+            "data_type": data_type
+        }
+        self.data["value"] = {
+            "type": "value",
+            "content": content
         }
 
     def set_wikibase_item_value(self, property_id, content):
@@ -114,12 +317,12 @@ class Snak(Base):
              "calendarmodel": f"http://www.wikidata.org/entity/{calendarmodel}"})
 
 class Sitelink(Base):
-    def __init__(self, site_code=None, title=None, url=None, badges=[]):
+    def __init__(self, site_code=None, title=None, url=None, badges=None):
         self.site_code = site_code
         self.data = {
             "title": title,
             "url": url,
-            "badges": badges
+            "badges": list(badges or [])
         }
 
     def get_site_code(self):
@@ -138,16 +341,20 @@ class Sitelink(Base):
         self.site_code = content
 
     def set_title(self, content):
+        self._changing()
         self.data["title"] = content
 
     def set_url(self, content):
+        self._changing()
         self.data["url"] = content
 
     def add_badge(self, content):
+        self._changing()
         self.data["badges"].append(content)
 
     def remove_badge(self, content):
         if content in self.data["badges"]:
+            self._changing()
             self.data["badges"].remove(content)
 
 class Reference(Base):
@@ -160,24 +367,29 @@ class Reference(Base):
     def to_dict(self):
         return {
             "hash": self.data["hash"],
-            "parts": [part.to_dict() for part in self.data["parts"]]
+            "parts": list(self.data["parts"])
         }
 
     def get_hash(self):
         return self.data["hash"]
 
     def set_hash(self, ref_hash):
+        self._changing()
         self.data["hash"] = ref_hash
 
     def add_part(self, part):
         if isinstance(part, Snak):
+            self._changing()
             self.data["parts"].append(part.data)
+            part.on_change = self._changing
         else:
             raise ValueError("Reference part must be a Snak")
 
     def remove_part(self, part):
         if part.data in self.data["parts"]:
+            self._changing()
             self.data["parts"].remove(part.data)
+            part.on_change = None
 
 class Statement(Snak):
     def __init__(self, statement_id=None, rank="normal", property_id=None,
@@ -199,10 +411,13 @@ class Statement(Snak):
             "property": self.data["property"],
             "value": self.data["value"],
         }
+        # Qualifiers and references are held as the dicts of their Snaks
+        # and References
         if "qualifiers" in self.data:
-            r["qualifiers"] = [qualifier.to_dict() for qualifier in self.data["qualifiers"]]
+            r["qualifiers"] = list(self.data["qualifiers"])
         if "references" in self.data:
-            r["references"] = [reference.to_dict() for reference in self.data["references"]]
+            r["references"] = list(self.data["references"])
+        return r
 
     def get_id(self):
         return self.data["id"]
@@ -217,37 +432,64 @@ class Statement(Snak):
         return self.data["references"]
 
     def set_id(self, content):
+        self._changing()
         self.data["id"] = content
 
     def set_rank(self, content):
         if content in ["deprecated", "normal", "preferred"]:
+            self._changing()
             self.data["rank"] = content
         else:
             raise ValueError("Rank must be deprecated, normal, or preferred")
 
     def add_qualifier(self, qualifier):
         if isinstance(qualifier, Snak):
+            self._changing()
             self.data["qualifiers"].append(qualifier.data)
+            qualifier.on_change = self._changing
         else:
             raise ValueError("Qualifier must be a Snak")
 
     def remove_qualifier(self, qualifier):
         if qualifier.data in self.data["qualifiers"]:
+            self._changing()
             self.data["qualifiers"].remove(qualifier.data)
+            qualifier.on_change = None
 
     def add_reference(self, reference):
         if isinstance(reference, Reference):
+            self._changing()
             self.data["references"].append(reference.data)
+            reference.on_change = self._changing
         else:
             raise ValueError("Reference must be a Reference-type object")
 
     def remove_reference(self, reference):
         if reference.data in self.data["references"]:
+            self._changing()
             self.data["references"].remove(reference.data)
+            reference.on_change = None
 
 
 class Entity(Base):
-    def __init__(self, connection=None, entity_id=None, entity_type="items"):
+    # Changes are tracked rather than found by comparing against a copy of
+    # the loaded entity. The first time a label, description, alias list,
+    # sitelink or property's statements is changed, its original value is
+    # copied into self.changes; submit() sends only those keys and skips an
+    # untouched entity without looking at its data. The setters, and the
+    # Statement and Sitelink objects added with them, record this on their
+    # own. Code that edits self.data directly has to call touch() first.
+    #
+    # fields limits loading to some sections, e.g. ["labels"]. The rest are
+    # fetched from their own endpoints the first time they are used (with
+    # "await entity.load_sections_async([...])" on an AsyncConnection), and
+    # a submit only ever involves the sections that were loaded.
+    #
+    # properties makes the statements section a view of just those
+    # properties' statements, each fetched with the statements endpoint's
+    # property filter. Other properties are fetched as they are used.
+    def __init__(self, connection=None, entity_id=None, entity_type="items", fields=None,
+                 properties=None):
         self.data = {
             "id": entity_id,
             "type": entity_type,
@@ -261,19 +503,345 @@ class Entity(Base):
             self.connection = connection
         else:
             raise ValueError("connection must be a Connection-type object")
-        self.original_data = None
-        if entity_id is not None and connection is not None:
-            self.load()
-
-    def load(self):
+        self.loaded = False
+        self.unloaded = set()
+        # Properties in the statements view, or None if all are loaded
+        self.properties = None
+        # Built on first lookup, see statement_index.py
+        self.index = None
+        self.changes = {}
+        self.revision = None
+        if entity_id is not None and not connection.is_async():
+            self.load(fields, properties)
+
+    def load(self, fields=None, properties=None):
         if self.connection is None:
             raise Exception("No Wikibase connection defined.")
-        self.data = self.connection.api.get_entity(self.data["type"], self.data["id"])
-        self.original_data = copy.deepcopy(self.data)
+        with self._span("load"):
+            api = self.connection.api
+            if fields is None and properties is None:
+                self._set_loaded(*api.get_entity_with_revision(
+                    self._entity_path_type(), self.data["id"]))
+                return
+            fields = self._fields(fields, properties)
+            result = ({}, None)
+            if fields:
+                result = api.get_entity_with_revision(
+                    self._entity_path_type(), self.data["id"], fields=fields)
+            self._set_partial(fields, *result)
+            if properties is not None:
+                self._set_view()
+                for property_id in properties:
+                    self._property_loaded(property_id, self._property_request(property_id))
+
+    async def load_async(self, fields=None, properties=None):
+        if self.connection is None:
+            raise Exception("No Wikibase connection defined.")
+        with self._span("load"):
+            api = self.connection.api
+            if fields is None and properties is None:
+                self._set_loaded(*await api.get_entity_with_revision(
+                    self._entity_path_type(), self.data["id"]))
+                return
+            fields = self._fields(fields, properties)
+            result = ({}, None)
+            if fields:
+                result = await api.get_entity_with_revision(
+                    self._entity_path_type(), self.data["id"], fields=fields)
+            self._set_partial(fields, *result)
+            if properties is not None:
+                self._set_view()
+                await self.load_properties_async(properties)
+
+    def _span(self, phase):
+        tracer = getattr(self.connection, "tracer", None)
+        if tracer is None:
+            return nullcontext()
+        return tracer.span(phase, entity_id=self.data.get("id"))
+
+    def _set_loaded(self, data, revision=None, unloaded=()):
+        self.data = data
+        self.loaded = True
+        self.unloaded = set(unloaded)
+        self.properties = None
+        self.index = None
+        self.changes = {}
+        self.revision = revision
+
+    def _sections(self):
+        if self._entity_path_type() == "items":
+            return sections
+        return tuple(section for section in sections if section != "sitelinks")
+
+    def _fields(self, fields, properties=None):
+        # With a statements view, statements are fetched per property
+        return [field for field in fields or [] if field in self._sections()
+                and (properties is None or field != "statements")]
+
+    def _set_partial(self, fields, data, revision):
+        partial_data = {
+            "id": self.data["id"],
+            "type": singular.get(self._entity_path_type(), self.data["type"])
+        }
+        for field in fields:
+            partial_data[field] = data.get(field, {})
+        self._set_loaded(partial_data, revision,
+                         [section for section in self._sections() if section not in fields])
+
+    def _set_view(self):
+        self.data["statements"] = {}
+        self.unloaded.discard("statements")
+        self.properties = set()
+
+    def _section_request(self, section):
+        # One section from its own endpoint, with the revision it is at
+        api = self.connection.api
+        entity_type = self._entity_path_type()
+        entity_id = self.data["id"]
+        if section == "sitelinks":
+            return api.get_item_sitelinks(entity_id, return_revision=True)
+        getters = {
+            "labels": api.get_entity_labels,
+            "descriptions": api.get_entity_descriptions,
+            "aliases": api.get_entity_aliases,
+            "statements": api.get_entity_statements
+        }
+        return getters[section](entity_type, entity_id, return_revision=True)
+
+    def _section_loaded(self, section, result):
+        value, revision = result
+        self.data[section] = value
+        self.unloaded.discard(section)
+        if section == "statements":
+            self.index = None
+        self._revision_seen(revision)
+
+    def _revision_seen(self, revision):
+        # Parts are fetched one after another, so the first revision is the
+        # oldest and the one edits have to be checked against
+        if self.revision is None:
+            self.revision = revision
+
+    def _property_request(self, property_id):
+        return self.connection.api.get_entity_statements(
+            self._entity_path_type(), self.data["id"], property_id=property_id,
+            return_revision=True)
+
+    def _property_loaded(self, property_id, result):
+        value, revision = result
+        if value.get(property_id):
+            self.data["statements"][property_id] = value[property_id]
+            self._statements_changed(property_id)
+        self.properties.add(property_id)
+        self._revision_seen(revision)
+
+    def section(self, name):
+        # data[name], fetched first if it has not been loaded yet
+        if name in self.unloaded:
+            if self.connection.is_async():
+                raise Exception(f"The {name} section is not loaded; use "
+                                f"'await entity.load_sections_async([\"{name}\"])'")
+            self._section_loaded(name, self._section_request(name))
+        return self.data[name]
+
+    def load_sections(self, names):
+        for name in names:
+            self.section(name)
+
+    async def load_sections_async(self, names):
+        for name in names:
+            if name in self.unloaded:
+                self._section_loaded(name, await self._section_request(name))
+
+    def property_statements(self, property_id):
+        # data["statements"].get(property_id), fetching the property first
+        # if the statements are a view that does not include it yet
+        if self.properties is not None and property_id not in self.properties:
+            if self.connection.is_async():
+                raise Exception(f"{property_id} is not loaded; use "
+                                f"'await entity.load_properties_async([\"{property_id}\"])'")
+            self._property_loaded(property_id, self._property_request(property_id))
+        return self.section("statements").get(property_id)
+
+    async def load_properties_async(self, property_ids):
+        for property_id in property_ids:
+            if self.properties is not None and property_id not in self.properties:
+                self._property_loaded(property_id, await self._property_request(property_id))
+
+    def _fresh_requests(self):
+        # (section, property ID or None, request) for everything loaded
+        requests = []
+        for section in self._sections():
+            if section == "statements" and self.properties is not None:
+                for property_id in sorted(self.properties):
+                    requests.append((section, property_id,
+                                     partial(self._property_request, property_id)))
+            elif section not in self.unloaded:
+                requests.append((section, None, partial(self._section_request, section)))
+        return requests
+
+    def _fresh_part(self, fresh, section, property_id, value):
+        if property_id is None:
+            fresh[section] = value
+        elif value.get(property_id):
+            fresh.setdefault(section, {})[property_id] = value[property_id]
+        else:
+            fresh.setdefault(section, {})
+
+    def _fetch_fresh(self):
+        # The latest revision of whatever we have loaded, for a rebase
+        if not self.unloaded and self.properties is None:
+            return self.connection.api.get_entity_with_revision(
+                self._entity_path_type(), self.data["id"])
+        fresh = {"id": self.data["id"], "type": self.data["type"]}
+        revision = None
+        for section, property_id, request in self._fresh_requests():
+            value, part_revision = request()
+            self._fresh_part(fresh, section, property_id, value)
+            revision = revision or part_revision
+        return fresh, revision
+
+    async def _fetch_fresh_async(self):
+        if not self.unloaded and self.properties is None:
+            return await self.connection.api.get_entity_with_revision(
+                self._entity_path_type(), self.data["id"])
+        fresh = {"id": self.data["id"], "type": self.data["type"]}
+        revision = None
+        for section, property_id, request in self._fresh_requests():
+            value, part_revision = await request()
+            self._fresh_part(fresh, section, property_id, value)
+            revision = revision or part_revision
+        return fresh, revision
+
+    def touch(self, section, key):
+        # Call before changing data[section][key] directly
+        if section == "statements":
+            self._statements_changed(key)
+        self._record(section, key)
+
+    def _record(self, section, key):
+        # Records data[section][key] as it is now, unless it has already
+        # been changed since the last load or submit
+        if not self.loaded or (section, key) in self.changes:
+            return
+        if section == "statements":
+            self.property_statements(key)
+        elif section in self.unloaded:
+            self.section(section)
+        value = self.data.get(section, {}).get(key, missing)
+        self.changes[(section, key)] = value if value is missing else copy.deepcopy(value)
+
+    def has_changes(self):
+        return bool(self.changes)
+
+    @property
+    def original_data(self):
+        # The entity as loaded or last submitted, rebuilt from the change
+        # log. Untouched parts are shared with self.data, so don't modify it.
+        if not self.loaded:
+            return None
+        original = dict(self.data)
+        copied = set()
+        for (section, key), value in self.changes.items():
+            if section not in copied:
+                original[section] = dict(self.data.get(section, {}))
+                copied.add(section)
+            if value is missing:
+                original[section].pop(key, None)
+            else:
+                original[section][key] = value
+        return original
+
+    def _changed_sections(self):
+        # Returns (old, new): the sections that changed, holding only the
+        # keys that did. A patch between them applies to the whole entity.
+        old = {}
+        new = {}
+        for (section, key), value in self.changes.items():
+            current = self.data.get(section, {}).get(key, missing)
+            if current is value or value == current:
+                continue
+            old.setdefault(section, {})
+            new.setdefault(section, {})
+            if value is not missing:
+                old[section][key] = value
+            if current is not missing:
+                new[section][key] = current
+        return old, new
+
+    def _rebase(self, fresh_data, revision):
+        # Replays our local changes on top of the latest revision. Raises
+        # EditConflict if they touch something that has since changed
+        # incompatibly.
+        old, new = self._changed_sections()
+        changes = {}
+        for section in new:
+            for key in set(old[section]) | set(new[section]):
+                value = fresh_data.get(section, {}).get(key, missing)
+                changes[(section, key)] = value if value is missing else copy.deepcopy(value)
+        # Statements are replayed by ID, as list positions shift when
+        # statements are added or removed
+        old_statements = old.pop("statements", None)
+        new_statements = new.pop("statements", None)
+        try:
+            jsonpatch.apply_patch(fresh_data, make_patch(old, new), in_place=True)
+        except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException) as e:
+            raise EditConflict(409, f"Local changes no longer apply: {str(e)}")
+        if new_statements is not None:
+            statements = fresh_data.setdefault("statements", {})
+            for property_id in set(old_statements) | set(new_statements):
+                rebased = self._rebase_statements(property_id,
+                                                  statements.get(property_id, []),
+                                                  old_statements.get(property_id, []),
+                                                  new_statements.get(property_id, []))
+                if rebased:
+                    statements[property_id] = rebased
+                else:
+                    statements.pop(property_id, None)
+        self.data = fresh_data
+        self.changes = changes
+        self.index = None
+        self.revision = revision
+
+    def _rebase_statements(self, property_id, fresh, old, new):
+        # Our changes to one property's statements, replayed onto its fresh
+        # statements: new ones are appended, removed ones dropped and
+        # changed ones patched, each matched up by statement ID.
+        old_by_id = {statement["id"]: statement for statement in old if "id" in statement}
+        new_by_id = {statement["id"]: statement for statement in new
+                     if statement.get("id") in old_by_id}
+        if list(new_by_id) != [statement_id for statement_id in old_by_id
+                               if statement_id in new_by_id]:
+            raise EditConflict(409, f"Reordered {property_id} statements cannot be rebased")
+        fresh_ids = set()
+        rebased = []
+        for statement in fresh:
+            statement_id = statement.get("id")
+            fresh_ids.add(statement_id)
+            if statement_id not in old_by_id:
+                # Added by someone else
+                rebased.append(statement)
+            elif statement_id in new_by_id:
+                try:
+                    rebased.append(jsonpatch.apply_patch(
+                        statement, make_patch(old_by_id[statement_id], new_by_id[statement_id])))
+                except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException) as e:
+                    raise EditConflict(409, f"Local changes to {statement_id} no longer"
+                                            f" apply: {str(e)}")
+        for statement_id, statement in new_by_id.items():
+            if statement_id not in fresh_ids and statement != old_by_id[statement_id]:
+                raise EditConflict(409, f"Statement {statement_id} was changed locally"
+                                        f" but has since been removed")
+        rebased.extend(statement for statement in new if statement.get("id") not in old_by_id)
+        return rebased
+
+    def _entity_path_type(self):
+        plural = {"item": "items", "property": "properties"}
+        return plural.get(self.data["type"], self.data["type"])
 
     def to_dict(self):
         statements = {}
-        for property_id, statements_list in self.data["statements"].items():
+        for property_id, statements_list in self.section("statements").items():
             expanded_statements_list = []
             for statement in statements_list:
                 to_append = {}
@@ -286,48 +854,231 @@ class Entity(Base):
                 if "value" in statement:
                     to_append["value"] = statement["value"]
                 if "qualifiers" in statement:
-                    to_append["qualifiers"] = [qualifier.to_dict() for qualifier in statement["qualifiers"]]
+                    to_append["qualifiers"] = list(statement["qualifiers"])
                 if "references" in statement:
-                    to_append["references"] = [reference.to_dict() for reference in statement["references"]]
+                    to_append["references"] = list(statement["references"])
                 expanded_statements_list.append(to_append)
             statements[property_id] = expanded_statements_list
         return {
             "id": self.data["id"],
             "type": self.data["type"],
-            "labels": self.data["labels"],
-            "descriptions": self.data["descriptions"],
-            "aliases": self.data["aliases"],
+            "labels": self.section("labels"),
+            "descriptions": self.section("descriptions"),
+            "aliases": self.section("aliases"),
             "statements": statements,
-            "sitelinks": self.data["sitelinks"]
+            "sitelinks": self.section("sitelinks")
         }
 
     def submit(self):
+        # Edits are conditional on the revision we loaded. If someone else
+        # edited the entity since, only the entity is refetched, our changes
+        # are replayed onto it and the edit is retried, up to
+        # connection.conflict_retries times.
+        with self._span("submit"):
+            attempt = 0
+            while True:
+                with self._span("diff"):
+                    plan = self._submit_plan()
+                if plan is None:
+                    return None
+                try:
+                    response = None
+                    for call, done in plan:
+                        response = done(call())
+                    return response
+                except EditConflict:
+                    if attempt >= self.connection.conflict_retries or not self.loaded:
+                        raise
+                    attempt += 1
+                    self._rebase(*self._fetch_fresh())
+
+    async def submit_async(self):
+        with self._span("submit"):
+            attempt = 0
+            while True:
+                with self._span("diff"):
+                    plan = self._submit_plan()
+                if plan is None:
+                    return None
+                try:
+                    response = None
+                    for call, done in plan:
+                        response = done(await call())
+                    return response
+                except EditConflict:
+                    if attempt >= self.connection.conflict_retries or not self.loaded:
+                        raise
+                    attempt += 1
+                    self._rebase(*await self._fetch_fresh_async())
+
+    def _submitted(self, result):
+        # The server answers with the entity as saved. A write recorded to a
+        # journal has no answer; the entity then counts as saved as it is.
+        response, revision = result
+        if response is None:
+            self.changes = {}
+            return None
+        self._set_loaded(response, revision)
+        return response
+
+    def _submit_plan(self):
+        # Returns a list of (call, done) pairs, or None if there is nothing
+        # to submit. call() makes one API request (returning a coroutine on
+        # an AsyncConnection) and done() records its result, returning the
+        # response. submit() returns the last response.
         if self.connection is None:
             raise Exception("No Wikibase connection defined.")
         # Don't submit anything if no changes have been made
-        if self.data == self.original_data:
+        if self.loaded and not self.changes:
             return
-        print(json.dumps(self.data))
-        if self.original_data is None:
+        api = self.connection.api
+        edit_options = {
+            "bot": self.connection.bot,
+            "edit_summary": self.connection.edit_summary,
+            "tags": self.connection.tags
+        }
+        if not self.loaded:
             if self.data["type"] != "items":
                 raise RuntimeException("Creation of non-item entities not supported.")
             # Submit new item (only items supported)
-            return self.connection.api.add_item(
-                       self.data,
-                       bot=self.connection.bot,
-                       edit_summary=self.connection.edit_summary,
-                       tags=self.connection.tags)
-        else:
-            plural = {"item": "items", "property": "properties"}
-            # Update existing entities
-            return self.connection.api.update_entity(
-                       plural[self.data["type"]],
-                       self.data["id"],
-                       self.data,
-                       self.original_data,
-                       bot=self.connection.bot,
-                       edit_summary=self.connection.edit_summary,
-                       tags=self.connection.tags)
+            return [(lambda: api.add_item(self.data, return_revision=True, **edit_options),
+                     self._submitted)]
+        old, new = self._changed_sections()
+        if not new:
+            # Everything touched is back to its original value
+            self.changes = {}
+            return
+        if self.connection.max_targeted_edits > 0:
+            edits = self._section_edits(old, new, edit_options)
+            if edits is not None and len(edits) <= self.connection.max_targeted_edits:
+                return edits
+        # Update existing entities
+        return [(lambda: api.update_entity(
+                             self._entity_path_type(),
+                             self.data["id"],
+                             new,
+                             old,
+                             revision=self.revision,
+                             return_revision=True,
+                             **edit_options),
+                 self._submitted)]
+
+    def _section_edits(self, old, new, edit_options):
+        # Breaks the changes down into requests to the narrowest endpoints:
+        # a PUT or DELETE per label, description or sitelink, one PATCH of
+        # the aliases section and a POST, PATCH or DELETE per statement.
+        # Returns None when the changes cannot be expressed that way (e.g.
+        # reordered statements), leaving them to a single entity PATCH.
+        #
+        # These requests carry no If-Match: each one only touches its own
+        # part of the entity, so unrelated concurrent edits do not conflict
+        # with it. self.revision is left at the loaded revision, so a later
+        # whole-entity PATCH still detects those concurrent edits.
+        api = self.connection.api
+        entity_type = self._entity_path_type()
+        entity_id = self.data["id"]
+        edits = []
+
+        for section in new:
+            if section not in ("labels", "descriptions", "aliases", "statements", "sitelinks"):
+                return None
+
+        terms = [("labels", api.replace_entity_label, api.delete_entity_label),
+                 ("descriptions", api.replace_entity_description, api.delete_entity_description)]
+        for section, replace, delete in terms:
+            new_terms = new.get(section, {})
+            for language_code in set(old.get(section, {})) | set(new_terms):
+                if language_code in new_terms:
+                    call = partial(replace, entity_type, entity_id, language_code,
+                                   new_terms[language_code], **edit_options)
+                else:
+                    call = partial(delete, entity_type, entity_id, language_code, **edit_options)
+                edits.append((call, partial(self._settled, section, [language_code])))
+
+        if "aliases" in new:
+            # The patch only mentions the changed languages, but its paths are
+            # relative to the whole aliases section
+            changed = list(set(old["aliases"]) | set(new["aliases"]))
+            call = partial(api.update_entity_aliases, entity_type, entity_id,
+                           new["aliases"], old["aliases"], **edit_options)
+            edits.append((call, partial(self._settled, "aliases", changed)))
+
+        new_sitelinks = new.get("sitelinks", {})
+        for site_id in set(old.get("sitelinks", {})) | set(new_sitelinks):
+            if site_id in new_sitelinks:
+                call = partial(api.replace_item_sitelink, entity_id, site_id,
+                               new_sitelinks[site_id], **edit_options)
+            else:
+                call = partial(api.delete_item_sitelink, entity_id, site_id, **edit_options)
+            edits.append((call, partial(self._settled, "sitelinks", [site_id])))
+
+        old_statements = old.get("statements", {})
+        new_statements = new.get("statements", {})
+        for property_id in set(old_statements) | set(new_statements):
+            old_list = old_statements.get(property_id, [])
+            new_list = new_statements.get(property_id, [])
+            old_by_id = {statement["id"]: statement for statement in old_list}
+            new_ids = [statement.get("id") for statement in new_list]
+            kept = [statement_id for statement_id in new_ids if statement_id in old_by_id]
+            added = new_ids[len(kept):]
+            # The server appends new statements and cannot reorder existing
+            # ones, so anything else needs an entity PATCH
+            if kept != [statement["id"] for statement in old_list if statement["id"] in kept] \
+                    or any(statement_id is not None for statement_id in added):
+                return None
+            for statement in old_list:
+                if statement["id"] not in kept:
+                    call = partial(api.delete_statement, statement["id"], **edit_options)
+                    edits.append((call, partial(self._statement_removed, property_id, statement["id"])))
+            for statement in new_list[:len(kept)]:
+                if statement != old_by_id[statement["id"]]:
+                    call = partial(api.update_statement, statement["id"], statement,
+                                   old_by_id[statement["id"]], **edit_options)
+                    edits.append((call, partial(self._statement_updated, property_id, statement)))
+            for statement in new_list[len(kept):]:
+                payload = {k: v for k, v in statement.items() if k != "id"}
+                call = partial(api.add_entity_statement, entity_type, entity_id,
+                               payload, **edit_options)
+                edits.append((call, partial(self._statement_added, property_id, statement)))
+        return edits
+
+    # The following move the recorded originals forward as targeted edits
+    # succeed, so a conflict part way through only replays the rest.
+
+    def _settled(self, section, keys, response=None):
+        for key in keys:
+            self.changes.pop((section, key), None)
+        return response
+
+    def _original_statements(self, property_id):
+        if self.changes[("statements", property_id)] is missing:
+            self.changes[("statements", property_id)] = []
+        return self.changes[("statements", property_id)]
+
+    def _statements_settled(self, property_id, response):
+        if self.changes[("statements", property_id)] == self.data["statements"].get(property_id, []):
+            del self.changes[("statements", property_id)]
+        return response
+
+    def _statement_removed(self, property_id, statement_id, response=None):
+        statements = self._original_statements(property_id)
+        statements[:] = [statement for statement in statements if statement["id"] != statement_id]
+        return self._statements_settled(property_id, response)
+
+    def _statement_updated(self, property_id, statement, response=None):
+        statements = self._original_statements(property_id)
+        for n, old_statement in enumerate(statements):
+            if old_statement["id"] == statement["id"]:
+                statements[n] = copy.deepcopy(statement)
+        return self._statements_settled(property_id, response)
+
+    def _statement_added(self, property_id, statement, response):
+        # Adopt the ID (and anything else) the server assigned
+        if response is not None:
+            statement.update(response)
+        self._statements_changed(property_id)
+        self._original_statements(property_id).append(copy.deepcopy(statement))
+        return self._statements_settled(property_id, response)
 
     def get_id(self):
         return self.data["id"]
@@ -336,66 +1087,144 @@ class Entity(Base):
         return self.data["type"]
 
     def get_labels(self):
-        return self.data["labels"]
+        return self.section("labels")
 
     def get_label(self, language_code):
-        return self.data["labels"].get(language_code)
+        return self.section("labels").get(language_code)
 
     def get_descriptions(self):
-        return self.data["descriptions"]
+        return self.section("descriptions")
 
     def get_description(self, language_code):
-        return self.data["descriptions"].get(language_code)
+        return self.section("descriptions").get(language_code)
 
     def get_aliases(self, language_code=None):
         if language_code is None:
-            return self.data["aliases"]
-        return self.data["aliases"].get(language_code)
+            return self.section("aliases")
+        return self.section("aliases").get(language_code)
 
     def get_statements(self, property_id=None):
+        # Only the view's properties if the entity was loaded with some
         if property_id is None:
-            return self.data["statements"]
-        return self.data["statements"].get(property_id)
+            return self.section("statements")
+        return self.property_statements(property_id)
 
     def get_sitelinks(self):
-        return self.data["sitelinks"]
+        return self.section("sitelinks")
 
     def get_sitelink(self, site_code):
-        return self.data["sitelinks"].get(site_code)
+        return self.section("sitelinks").get(site_code)
 
     def set_label(self, language_code, content):
-        self.data["labels"][language_code] = content
+        self._record("labels", language_code)
+        self.section("labels")[language_code] = content
+
+    def remove_label(self, language_code):
+        labels = self.section("labels")
+        if language_code in labels:
+            self._record("labels", language_code)
+            del labels[language_code]
 
     def set_description(self, language_code, content):
-        self.data["descriptions"][language_code] = content
+        self._record("descriptions", language_code)
+        self.section("descriptions")[language_code] = content
+
+    def remove_description(self, language_code):
+        descriptions = self.section("descriptions")
+        if language_code in descriptions:
+            self._record("descriptions", language_code)
+            del descriptions[language_code]
 
     def add_alias(self, language_code, content):
-        if language_code not in self.data["aliases"]:
-            self.data["aliases"][language_code] = []
-        self.data["aliases"][language_code].append(content)
+        aliases = self.section("aliases")
+        self._record("aliases", language_code)
+        if language_code not in aliases:
+            aliases[language_code] = []
+        aliases[language_code].append(content)
 
     def remove_alias(self, language_code, content):
-        if language_code in self.data["aliases"] and content in self.data["aliases"][language_code]:
-            self.data["aliases"][language_code].remove(content)
+        aliases = self.section("aliases")
+        if language_code in aliases and content in aliases[language_code]:
+            self._record("aliases", language_code)
+            aliases[language_code].remove(content)
 
     def add_statement(self, content):
         if isinstance(content, Statement):
-            if content.data["property"]["id"] not in self.data["statements"]:
-                self.data["statements"][content.data["property"]["id"]] = []
-            self.data["statements"][content.data["property"]["id"]].append(content.data)
+            statements = self.section("statements")
+            property_id = content.data["property"]["id"]
+            self._record("statements", property_id)
+            if property_id not in statements:
+                statements[property_id] = []
+            statements[property_id].append(content.data)
+            if self.index is not None:
+                self.index.add(property_id, content.data)
+            content.on_change = partial(self.touch, "statements", property_id)
         else:
             raise ValueError("Statement must be a Statement-type object")
 
     def remove_statement(self, content):
-        if content in self.data["statements"]:
-            self.data["statements"].remove(content)
+        # Takes a Statement, a statement dict or a statement ID. On an entity
+        # loaded with properties, only the view's statements can be found
+        # by ID.
+        if isinstance(content, Statement):
+            statement = content.data
+        elif isinstance(content, dict):
+            statement = content
+        else:
+            property_id, statement = self._statement_index().get(content)
+            if statement is None:
+                return
+        if statement.get("id") is not None:
+            property_id, statement = self._statement_index().get(statement["id"])
+            if statement is None:
+                return
+        else:
+            property_id = statement["property"]["id"]
+        statements = self.section("statements")
+        for n, other in enumerate(statements.get(property_id, [])):
+            if other is statement:
+                break
+        else:
+            return
+        self._record("statements", property_id)
+        del statements[property_id][n]
+        if not statements[property_id]:
+            del statements[property_id]
+        if self.index is not None:
+            self.index.remove(property_id, statement)
+        if isinstance(content, Statement):
+            content.on_change = None
+
+    def get_statement(self, statement_id):
+        return self._statement_index().get(statement_id)[1]
+
+    def find_statements(self, property_id, value):
+        # Statements of property_id whose value (as in Snak.get_value()) is
+        # equal to value, e.g. {"type": "value", "content": "Q5"}
+        return self._statement_index().find(property_id, value)
+
+    def _statement_index(self):
+        if self.index is None:
+            self.index = StatementIndex(self.section("statements"))
+        return self.index
+
+    def _statements_changed(self, property_id):
+        if self.index is not None:
+            self.index.mark_stale(property_id)
 
     def add_sitelink(self, content):
         if isinstance(content, Sitelink):
-            self.data["sitelinks"][content.site_code] = content.data
+            sitelinks = self.section("sitelinks")
+            self._record("sitelinks", content.site_code)
+            sitelinks[content.site_code] = content.data
+            content.on_change = partial(self.touch, "sitelinks", content.site_code)
         else:
             raise ValueError("Sitelink must be a Sitelink-type object")
 
     def remove_sitelink(self, content):
-        if content in self.data["sitelinks"]:
-            self.data["sitelinks"].remove(content)
+        # Takes a Sitelink or a site code
+        site_code = content.site_code if isinstance(content, Sitelink) else content
+        sitelinks = self.section("sitelinks")
+        if site_code in sitelinks:
+            self._record("sitelinks", site_code)
+            del sitelinks[site_code]
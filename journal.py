@@ -0,0 +1,140 @@
+import os
+import threading
+from collections import deque
+from cache import entity_id_from_path
+from codec import default_codec
+from edit_queue import EditQueue
+
+# Record and replay of writes. An API (or Connection) given a Journal writes
+# every POST, PUT, PATCH and DELETE to it as one line of JSON instead of
+# sending it:
+#
+#   {"verb":"patch","path":"/entities/items/Q42","payload":{...},"revision":"123"}
+#
+# payload is the request body as it would have been sent (edit summary,
+# tags and all) and revision the If-Match precondition, left out if there
+# was none. Planning an edit job can then run offline, and replay() sends
+# the journal later with its own parallelism and rate limits.
+#
+# Records are numbered from 0 in file order; that number is the offset
+# replay() starts from and reports back for resuming.
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+
+    def record(self, verb, path, payload, revision=None):
+        record = {"verb": verb.lower(), "path": path, "payload": payload}
+        if revision is not None:
+            record["revision"] = revision
+        line = default_codec.dumps(record) + b"\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def read_journal(path, start=0):
+    # Yields (offset, record) from offset start on
+    with open(path, "rb") as f:
+        for offset, line in enumerate(f):
+            if offset >= start and line.strip():
+                yield offset, default_codec.loads(line)
+
+class _Sender:
+    # Sends records, carrying revisions forward: a record made against the
+    # revision an earlier replayed write started from is sent against the
+    # revision that write produced, as it would have been had the job run
+    # live. Writes to the same entity are never sent concurrently, so this
+    # is only shared across entities.
+    def __init__(self, api):
+        self.api = api
+        self.lock = threading.Lock()
+        self.revisions = {}
+
+    def send(self, key, record):
+        revision = record.get("revision")
+        with self.lock:
+            recorded, current = self.revisions.get(key, (None, None))
+        if revision is not None and revision == recorded:
+            revision = current
+        response, new_revision = self.api._request(
+            record["verb"], record["path"], payload=record.get("payload"),
+            revision=revision, return_revision=True)
+        if record.get("revision") is not None and new_revision is not None:
+            with self.lock:
+                self.revisions[key] = (record["revision"], new_revision)
+        return response
+
+def _read_checkpoint(checkpoint):
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint) as f:
+        return int(f.read().strip() or 0)
+
+def _write_checkpoint(checkpoint, offset):
+    temporary = checkpoint + ".tmp"
+    with open(temporary, "w") as f:
+        f.write(f"{offset}\n")
+    os.replace(temporary, checkpoint)
+
+def replay(api, path, start=None, workers=8, errors=None, checkpoint=None):
+    # Sends the journal at path through api (a WikibaseRestAPI, whose rate
+    # limiter and retries apply). Writes to the same entity go one after
+    # another in journal order, writes to different entities in parallel on
+    # up to workers threads, with at most 4 * workers records in flight.
+    #
+    # Records that fail (an edit conflict, say) go into errors as
+    # {offset: exception} if given, otherwise the first failure is raised
+    # once the records in flight have finished. Returns the offset to
+    # resume from: every record before it has been sent or has failed. With
+    # a checkpoint path that offset is also saved as records finish, and
+    # read back as the start when start is None. Records are sent under any
+    # enclosing deadline.deadline().
+    if getattr(api, "journal", None) is not None:
+        raise ValueError("Cannot replay through an API that records to a journal")
+    if start is None:
+        start = _read_checkpoint(checkpoint)
+    sender = _Sender(api)
+    window = workers * 4
+    pending = deque()
+    resume = start
+    failure = None
+
+    def finish():
+        nonlocal resume, failure
+        offset, future = pending.popleft()
+        exception = future.exception()
+        if exception is not None:
+            print(f"Journal record {offset} failed: {exception}")
+            if errors is None:
+                failure = failure or exception
+            else:
+                errors[offset] = exception
+        resume = offset + 1
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, resume)
+
+    with EditQueue(workers=workers) as queue:
+        for offset, record in read_journal(path, start):
+            if failure is not None:
+                break
+            # Entity creations have no entity to be ordered against
+            key = entity_id_from_path(record["path"]) or ("record", offset)
+            pending.append((offset, queue.call(key, sender.send, key, record)))
+            while len(pending) >= window:
+                finish()
+        while pending:
+            finish()
+    if failure is not None:
+        raise failure
+    return resume
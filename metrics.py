@@ -0,0 +1,239 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Request hooks and spans, and a collector that turns them into metrics.
+#
+# WikibaseRestAPI(hooks=[...]) calls before_request(info) and
+# after_request(info) on each hook around every HTTP attempt, retries
+# included. info is a RequestInfo; hooks only need the methods they use.
+#
+# Connection(tracer=...) has Entity wrap its load, diff and submit phases
+# in tracer.span(phase, entity_id=...), a context manager.
+#
+# MetricsCollector is both, and exports what it saw in the OpenMetrics text
+# format:
+#
+#   metrics = MetricsCollector()
+#   connection = Connection(hooks=[metrics], tracer=metrics)
+#   ...
+#   print(metrics.openmetrics())
+
+# Path segments that vary between requests to the same endpoint
+id_segment = re.compile(r"^[A-Z][0-9]+$")
+keyed_sections = {"labels": "{language_code}", "descriptions": "{language_code}",
+                  "aliases": "{language_code}", "sitelinks": "{site_id}",
+                  "statements": "{statement_id}"}
+
+def endpoint_template(path):
+    # /entities/items/Q42/labels/en -> /entities/items/{entity_id}/labels/{language_code}
+    parts = path.split("/")
+    for n, part in enumerate(parts):
+        if id_segment.match(part):
+            parts[n] = "{entity_id}"
+        elif n > 0 and parts[n - 1] in keyed_sections and part:
+            parts[n] = keyed_sections[parts[n - 1]]
+    return "/".join(parts)
+
+class RequestInfo:
+    # One HTTP attempt. before_request sees the first group of fields;
+    # after_request also sees the second. status is None if no response
+    # came back, in which case error holds the exception. bytes_sent and
+    # bytes_received count body bytes as they went over the wire, and the
+    # uncompressed_ ones the same bodies before compression.
+    def __init__(self, verb, path, attempt, bytes_sent, uncompressed_bytes_sent=None):
+        self.verb = verb.lower()
+        self.path = path
+        self.endpoint = endpoint_template(path)
+        self.attempt = attempt
+        self.bytes_sent = bytes_sent
+        self.uncompressed_bytes_sent = (bytes_sent if uncompressed_bytes_sent is None
+                                        else uncompressed_bytes_sent)
+        self.started = time.perf_counter()
+
+        self.finished = False
+        self.seconds = None
+        self.status = None
+        self.bytes_received = 0
+        self.uncompressed_bytes_received = 0
+        self.error = None
+
+    def compression_ratio(self, direction="received"):
+        # Uncompressed over wire size of the "sent" or "received" body; 1.0
+        # if it was not compressed, None if there was none
+        wire = getattr(self, f"bytes_{direction}")
+        if not wire:
+            return None
+        return getattr(self, f"uncompressed_bytes_{direction}") / wire
+
+class RequestHook:
+    # A base class for hooks, though any object with these methods will do
+    def before_request(self, info):
+        pass
+
+    def after_request(self, info):
+        pass
+
+# Upper bounds of the latency histogram buckets, in seconds
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Not cumulative; the last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        n = 0
+        while n < len(self.buckets) and value > self.buckets[n]:
+            n += 1
+        self.counts[n] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Estimated by linear interpolation within the bucket, as
+        # Prometheus' histogram_quantile does
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for n, count in enumerate(self.counts):
+            if seen + count >= rank and count > 0:
+                if n == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[n - 1] if n > 0 else 0.0
+                return lower + (self.buckets[n] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsCollector(RequestHook):
+    # Counts requests, retries and bytes and keeps latency histograms per
+    # verb and endpoint template, and durations of Entity spans per phase.
+    # Safe to share between threads and connections.
+    def __init__(self, prefix="wikibase", buckets=default_buckets):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # (verb, endpoint, status) -> count; status is "error" for attempts
+        # that got no response
+        self.requests = {}
+        # (verb, endpoint) -> count of attempts after the first
+        self.retries = {}
+        self.bytes_sent = {}
+        self.bytes_received = {}
+        self.uncompressed_bytes_sent = {}
+        self.uncompressed_bytes_received = {}
+        self.latency = {}
+        # phase -> Histogram
+        self.spans = {}
+
+    def after_request(self, info):
+        key = (info.verb, info.endpoint)
+        status = "error" if info.status is None else str(info.status)
+        with self.lock:
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            if info.attempt > 1:
+                self.retries[key] = self.retries.get(key, 0) + 1
+            self.bytes_sent[key] = self.bytes_sent.get(key, 0) + info.bytes_sent
+            self.bytes_received[key] = self.bytes_received.get(key, 0) + info.bytes_received
+            self.uncompressed_bytes_sent[key] = (self.uncompressed_bytes_sent.get(key, 0)
+                                                 + info.uncompressed_bytes_sent)
+            self.uncompressed_bytes_received[key] = (self.uncompressed_bytes_received.get(key, 0)
+                                                     + info.uncompressed_bytes_received)
+            if key not in self.latency:
+                self.latency[key] = Histogram(self.buckets)
+            self.latency[key].observe(info.seconds)
+
+    @contextmanager
+    def span(self, phase, **attributes):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                if phase not in self.spans:
+                    self.spans[phase] = Histogram(self.buckets)
+                self.spans[phase].observe(elapsed)
+
+    def quantile(self, q, verb=None, endpoint=None):
+        # Estimated latency quantile (e.g. 0.99) over the matching requests
+        with self.lock:
+            merged = Histogram(self.buckets)
+            for (key_verb, key_endpoint), histogram in self.latency.items():
+                if verb in (None, key_verb) and endpoint in (None, key_endpoint):
+                    merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                    merged.count += histogram.count
+            return merged.quantile(q)
+
+    def compression_ratio(self, direction="received", verb=None, endpoint=None):
+        # Uncompressed over wire bytes "sent" or "received" in the matching
+        # requests, e.g. 4.0 if compression saved three quarters
+        wire = getattr(self, f"bytes_{direction}")
+        uncompressed = getattr(self, f"uncompressed_bytes_{direction}")
+        with self.lock:
+            keys = [key for key in wire
+                    if verb in (None, key[0]) and endpoint in (None, key[1])]
+            total = sum(wire[key] for key in keys)
+            if not total:
+                return None
+            return sum(uncompressed[key] for key in keys) / total
+
+    def openmetrics(self):
+        lines = []
+        with self.lock:
+            self._counter(lines, "requests", "HTTP attempts by response status",
+                          ("verb", "endpoint", "status"), self.requests)
+            self._counter(lines, "retries", "HTTP attempts after the first",
+                          ("verb", "endpoint"), self.retries)
+            self._counter(lines, "request_bytes_sent", "Request body bytes sent",
+                          ("verb", "endpoint"), self.bytes_sent)
+            self._counter(lines, "request_bytes_received", "Response body bytes received",
+                          ("verb", "endpoint"), self.bytes_received)
+            self._counter(lines, "request_uncompressed_bytes_sent",
+                          "Request body bytes sent, before compression",
+                          ("verb", "endpoint"), self.uncompressed_bytes_sent)
+            self._counter(lines, "request_uncompressed_bytes_received",
+                          "Response body bytes received, after decompression",
+                          ("verb", "endpoint"), self.uncompressed_bytes_received)
+            self._histogram(lines, "request_duration_seconds", "HTTP attempt latency",
+                            ("verb", "endpoint"), self.latency)
+            self._histogram(lines, "entity_phase_duration_seconds",
+                            "Entity load, diff and submit durations", ("phase",),
+                            {(phase,): histogram for phase, histogram in self.spans.items()})
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _counter(self, lines, name, help, label_names, values):
+        name = f"{self.prefix}_{name}"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"# HELP {name} {help}")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}_total{_labels(label_names, key)} {value}")
+
+    def _histogram(self, lines, name, help, label_names, histograms):
+        name = f"{self.prefix}_{name}"
+        lines.append(f"# TYPE {name} histogram")
+        lines.append(f"# HELP {name} {help}")
+        for key, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(label_names, key, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_count{_labels(label_names, key)} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(label_names, key)} {_number(histogram.sum)}")
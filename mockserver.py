@@ -0,0 +1,424 @@
+import copy
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import jsonpatch
+import jsonpointer
+
+# A local stand-in for the Wikibase REST API, for tests and benchmarks that
+# should not depend on a real wiki. It serves the endpoints api.py uses from
+# entities held in memory:
+#
+#   server = MockServer(entities=[{"id": "Q1", ...}])
+#   connection = Connection(endpoint=server.endpoint)
+#   ...
+#   server.stop()
+#
+# Every write gives the entity a new revision, as MediaWiki does, and every
+# response about an entity carries it as the ETag. Writes with an outdated
+# If-Match get a 412, GETs with a current If-None-Match a 304, and JSON
+# patches that do not apply a 409. Latency, connection setup time and
+# errors (fail_next, error_rate) can be injected. Responses are gzipped for
+# clients that accept it if gzip_responses is set, and gzipped request
+# bodies are accepted unless gzip_requests is turned off (then they get a
+# 415).
+
+sections = ("labels", "descriptions", "aliases", "statements", "sitelinks")
+# Body keys for writes to one term, sitelink or statement
+singular_keys = {"labels": "label", "descriptions": "description", "aliases": "aliases",
+                 "statements": "statement", "sitelinks": "sitelink"}
+entity_types = {"items": "item", "properties": "property"}
+
+class MockError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+def _entity_type_path(entity_id):
+    return "properties" if entity_id.startswith("P") else "items"
+
+def _reference_hash(reference):
+    return hashlib.sha1(json.dumps(reference.get("parts", []), sort_keys=True)
+                        .encode("utf-8")).hexdigest()
+
+class MockWikibase:
+    # The wiki itself: entities, revisions and the request handling, without
+    # the HTTP. Safe to share between threads.
+    def __init__(self, entities=(), first_revision=1):
+        self.lock = threading.Lock()
+        self.entities = {}
+        self.revisions = {}
+        self.revision = first_revision
+        self.next_item = 1
+        for entity in entities:
+            self.put_entity(entity)
+
+    def put_entity(self, entity):
+        # Adds or replaces an entity as if someone had edited it
+        entity = copy.deepcopy(entity)
+        with self.lock:
+            self._normalize(entity["id"], entity)
+            self.entities[entity["id"]] = entity
+            self._bump(entity["id"])
+            if entity["id"].startswith("Q"):
+                self.next_item = max(self.next_item, int(entity["id"][1:]) + 1)
+        return self.revisions[entity["id"]]
+
+    def get_entity(self, entity_id):
+        with self.lock:
+            return copy.deepcopy(self.entities.get(entity_id))
+
+    def get_revision(self, entity_id):
+        with self.lock:
+            return self.revisions.get(entity_id)
+
+    def _bump(self, entity_id):
+        self.revision += 1
+        self.revisions[entity_id] = self.revision
+
+    def _normalize(self, entity_id, entity):
+        # What the wiki fills in on save: sections, statement IDs, ranks and
+        # reference hashes
+        for section in sections:
+            if section != "sitelinks" or entity_id.startswith("Q"):
+                entity.setdefault(section, {})
+        entity.setdefault("type", "property" if entity_id.startswith("P") else "item")
+        for property_id, statements in entity["statements"].items():
+            for statement in statements:
+                self._normalize_statement(entity_id, property_id, statement)
+
+    def _normalize_statement(self, entity_id, property_id, statement):
+        if not statement.get("id"):
+            statement["id"] = f"{entity_id}${str(uuid.uuid4()).upper()}"
+        statement.setdefault("rank", "normal")
+        statement.setdefault("property", {"id": property_id})
+        statement.setdefault("qualifiers", [])
+        statement.setdefault("references", [])
+        for reference in statement["references"]:
+            if not reference.get("hash"):
+                reference["hash"] = _reference_hash(reference)
+
+    # Request handling
+
+    def handle(self, verb, path, query, headers, body):
+        # Returns (status, revision, encoded response body). The body is
+        # encoded under the lock, before another request can change it.
+        verb = verb.lower()
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if parts[0] == "statements" and len(parts) == 2:
+            entity_id = parts[1].split("$")[0].upper()
+            parts = ["entities", _entity_type_path(entity_id), entity_id, "statements", parts[1]]
+        elif parts[0] != "entities" or len(parts) < 2 or parts[1] not in entity_types:
+            raise MockError(404, "resource-not-found", f"No route for {path}")
+        with self.lock:
+            try:
+                status, revision, result = self._route(verb, parts, query, headers, body)
+            except (AttributeError, KeyError, TypeError) as e:
+                raise MockError(400, "invalid-request-body", f"Unexpected request body: {e}")
+            data = b"" if status == 304 else json.dumps(result).encode("utf-8")
+        return status, revision, data
+
+    def _route(self, verb, parts, query, headers, body):
+        if len(parts) == 2:
+            if verb != "post" or parts[1] != "items":
+                raise MockError(405, "method-not-allowed", f"Cannot {verb} here")
+            return self._create_item(body)
+
+        entity_id = parts[2]
+        entity = self.entities.get(entity_id)
+        if entity is None:
+            raise MockError(404, "entity-not-found", f"Could not find an entity with the ID: {entity_id}")
+        revision = self.revisions[entity_id]
+        if verb == "get":
+            if headers.get("If-None-Match") == f'"{revision}"':
+                return 304, revision, None
+        elif "If-Match" in headers and headers["If-Match"] != f'"{revision}"':
+            raise MockError(412, "precondition-failed", "The entity has changed since that revision")
+
+        section = parts[3] if len(parts) > 3 else None
+        key = parts[4] if len(parts) > 4 else None
+        if section is not None and (section not in sections or section not in entity
+                                    or len(parts) > 5):
+            raise MockError(404, "resource-not-found", f"No route for {'/'.join(parts)}")
+
+        if verb == "get":
+            return 200, revision, self._read(entity, section, key, query)
+        status, result = self._write(verb, entity_id, entity, section, key, body)
+        self._bump(entity_id)
+        return status, self.revisions[entity_id], result
+
+    def _read(self, entity, section, key, query):
+        if section is None:
+            fields = query.get("_fields")
+            if fields is None:
+                return entity
+            fields = fields.split(",")
+            return {field: value for field, value in entity.items()
+                    if field == "id" or field in fields}
+        if key is None:
+            if section == "statements" and "property" in query:
+                property_id = query["property"]
+                statements = entity["statements"].get(property_id)
+                return {} if not statements else {property_id: statements}
+            return entity[section]
+        if section == "statements":
+            return self._find_statement(entity, key)[1]
+        if key not in entity[section]:
+            raise MockError(404, f"{singular_keys[section]}-not-defined",
+                            f"No {singular_keys[section]} for {key}")
+        return entity[section][key]
+
+    def _find_statement(self, entity, statement_id):
+        # (statements list, statement)
+        for statements in entity["statements"].values():
+            for statement in statements:
+                if statement["id"].lower() == statement_id.lower():
+                    return statements, statement
+        raise MockError(404, "statement-not-found", f"Could not find a statement with the ID: {statement_id}")
+
+    def _patch(self, target, body):
+        try:
+            return jsonpatch.apply_patch(target, body["patch"])
+        except (jsonpatch.JsonPatchException, jsonpointer.JsonPointerException) as e:
+            raise MockError(409, "patch-test-failed" if isinstance(e, jsonpatch.JsonPatchTestFailed)
+                            else "patch-target-not-found", str(e))
+        except (KeyError, TypeError) as e:
+            raise MockError(400, "invalid-patch", str(e))
+
+    def _write(self, verb, entity_id, entity, section, key, body):
+        if body is None:
+            raise MockError(400, "invalid-request-body", "A write needs a JSON body")
+        if section is None:
+            if verb == "patch":
+                patched = self._patch(entity, body)
+                if patched.get("id") != entity_id or not isinstance(patched.get("statements"), dict):
+                    raise MockError(422, "patched-entity-invalid", "The patched entity is not valid")
+                self._normalize(entity_id, patched)
+                self.entities[entity_id] = patched
+                return 200, patched
+            if verb == "delete":
+                del self.entities[entity_id]
+                return 200, "Entity deleted"
+            raise MockError(405, "method-not-allowed", f"Cannot {verb} an entity")
+
+        if section == "statements":
+            return self._write_statement(verb, entity_id, entity, key, body)
+        values = entity[section]
+        if key is None:
+            if verb == "patch":
+                patched = self._patch(values, body)
+                if not isinstance(patched, dict):
+                    raise MockError(422, "patched-invalid", f"The patched {section} are not valid")
+                entity[section] = patched
+                return 200, patched
+            if verb == "post":
+                # Adds to the section: {language: text} for terms,
+                # {language: [aliases]} for aliases
+                for language, value in body[singular_keys[section]].items():
+                    if section == "aliases":
+                        values.setdefault(language, []).extend(
+                            alias for alias in value if alias not in values.get(language, []))
+                    else:
+                        values[language] = value
+                return 201, values
+            raise MockError(405, "method-not-allowed", f"Cannot {verb} {section}")
+        if verb == "put":
+            status = 200 if key in values else 201
+            values[key] = body[singular_keys[section]]
+            return status, values[key]
+        if verb == "delete":
+            if key not in values:
+                raise MockError(404, f"{singular_keys[section]}-not-defined",
+                                f"No {singular_keys[section]} for {key}")
+            del values[key]
+            return 200, f"{singular_keys[section].capitalize()} deleted"
+        raise MockError(405, "method-not-allowed", f"Cannot {verb} a {singular_keys[section]}")
+
+    def _write_statement(self, verb, entity_id, entity, statement_id, body):
+        if statement_id is None:
+            if verb != "post":
+                raise MockError(405, "method-not-allowed", f"Cannot {verb} statements")
+            statement = body["statement"]
+            property_id = statement["property"]["id"]
+            statement.pop("id", None)
+            self._normalize_statement(entity_id, property_id, statement)
+            entity["statements"].setdefault(property_id, []).append(statement)
+            return 201, statement
+        statements, statement = self._find_statement(entity, statement_id)
+        if verb == "delete":
+            statements.remove(statement)
+            if not statements:
+                del entity["statements"][statement["property"]["id"]]
+            return 200, "Statement deleted"
+        if verb == "put":
+            replacement = body["statement"]
+        elif verb == "patch":
+            replacement = self._patch(statement, body)
+        else:
+            raise MockError(405, "method-not-allowed", f"Cannot {verb} a statement")
+        if replacement.get("property", {}).get("id") != statement["property"]["id"] \
+                or replacement.get("id", statement["id"]) != statement["id"]:
+            raise MockError(422, "invalid-statement-change",
+                            "A statement's ID and property cannot change")
+        replacement["id"] = statement["id"]
+        self._normalize_statement(entity_id, statement["property"]["id"], replacement)
+        statements[statements.index(statement)] = replacement
+        return 200, replacement
+
+    def _create_item(self, body):
+        if body is None or not isinstance(body.get("item"), dict):
+            raise MockError(400, "invalid-request-body", "Expected an item")
+        item = body["item"]
+        entity_id = f"Q{self.next_item}"
+        self.next_item += 1
+        item["id"] = entity_id
+        item["type"] = "item"
+        self._normalize(entity_id, item)
+        self.entities[entity_id] = item
+        self._bump(entity_id)
+        return 201, self.revisions[entity_id], item
+
+class MockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients asking for keep-alive get it
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # Stands in for the TCP and TLS handshakes of a remote wiki
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+        super().setup()
+
+    def _handle(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        url = urlsplit(self.path)
+        path = url.path
+        if path.startswith(server.prefix):
+            path = path[len(server.prefix):]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        server.log_request_line(self.command, path)
+        if server.latency:
+            time.sleep(server.latency)
+
+        injected = server.injected_error(self.command)
+        if injected is not None:
+            status, retry_after = injected
+            extra = {} if retry_after is None else {"Retry-After": str(retry_after)}
+            return self._send_error(status, "injected-error", "Injected error", extra)
+        encoding = self.headers.get("Content-Encoding", "identity").lower()
+        if encoding == "gzip" and server.gzip_requests:
+            raw = gzip.decompress(raw)
+        elif encoding != "identity":
+            return self._send_error(415, "unsupported-content-encoding",
+                                    f"Unsupported Content-Encoding: {encoding}")
+        try:
+            body = json.loads(raw) if raw.strip() else None
+        except ValueError:
+            return self._send_error(400, "invalid-request-body", "Invalid JSON")
+        try:
+            status, revision, data = server.wiki.handle(self.command, path, query,
+                                                        self.headers, body)
+        except MockError as e:
+            return self._send_error(e.status, e.code, str(e))
+        self._send(status, data, revision)
+
+    def _send_error(self, status, code, message, extra={}):
+        data = json.dumps({"code": code, "message": message}).encode("utf-8")
+        self._send(status, data, extra=extra)
+
+    def _send(self, status, data, revision=None, extra={}):
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+        if (self.server.gzip_responses and data
+                and "gzip" in self.headers.get("Accept-Encoding", "")):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        if revision is not None:
+            self.send_header("ETag", f'"{revision}"')
+        for name, value in extra.items():
+            self.send_header(name, value)
+        if self.headers.get("Connection", "").lower() == "close":
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+class MockServer(ThreadingHTTPServer):
+    # Serves a MockWikibase on a free port of 127.0.0.1 from a background
+    # thread. endpoint is what to pass to Connection or WikibaseRestAPI;
+    # prefix is the path the API is mounted at.
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, entities=(), wiki=None, latency=0, connect_delay=0, error_rate=0,
+                 error_status=503, seed=None, prefix="/w/rest.php/wikibase/v0",
+                 log_requests=True, gzip_responses=False, gzip_requests=True):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.wiki = wiki if wiki is not None else MockWikibase(entities)
+        self.latency = latency
+        self.connect_delay = connect_delay
+        # A fraction of requests answered with error_status instead
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.gzip_responses = gzip_responses
+        self.gzip_requests = gzip_requests
+        self.random = random.Random(seed)
+        self.prefix = prefix
+        self.endpoint = f"http://127.0.0.1:{self.server_address[1]}{prefix}"
+        self.lock = threading.Lock()
+        self.failures = []
+        # (verb, path) of every request, unless log_requests is False
+        self.requests = []
+        self.log_requests = log_requests
+        # A short poll interval keeps stop() quick
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def fail_next(self, status, count=1, retry_after=None, verbs=None):
+        # The next count requests (with one of verbs, if given) get status
+        with self.lock:
+            for _ in range(count):
+                self.failures.append((status, retry_after, verbs))
+
+    def injected_error(self, verb):
+        with self.lock:
+            for n, (status, retry_after, verbs) in enumerate(self.failures):
+                if verbs is None or verb.lower() in verbs:
+                    del self.failures[n]
+                    return status, retry_after
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.error_status, 0
+        return None
+
+    def log_request_line(self, verb, path):
+        if not self.log_requests:
+            return
+        with self.lock:
+            self.requests.append((verb.lower(), path))
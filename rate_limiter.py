@@ -0,0 +1,114 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now, rate):
+        # Takes a token, going into debt if there is none, and returns how
+        # long the caller has to wait for it. updated can lie in the future
+        # while the limiter is paused; no tokens accrue until then.
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+        self.tokens -= 1
+        return max(0.0, self.updated - now) + max(0.0, -self.tokens / rate)
+
+    def pause_until(self, until):
+        # Let one request through when the pause ends, then meter the rest
+        self.tokens = min(self.tokens, 1)
+        self.updated = max(self.updated, until)
+
+class RateLimiter:
+    # Token-bucket limiter meant to be shared by every WikibaseRestAPI (and
+    # every thread) talking to the same wiki. requests_per_second limits all
+    # requests and edits_per_minute limits writes only; either can be None.
+    #
+    # When the wiki answers 429 or 503 everyone pauses for the Retry-After
+    # time (or default_pause) and the rates are halved, down to
+    # min_rate_fraction of their targets. Each successful request then
+    # recovers recovery_step of the target rate.
+    def __init__(self, requests_per_second=None, edits_per_minute=None,
+                 default_pause=5, min_rate_fraction=0.1, recovery_step=0.01):
+        self.lock = threading.Lock()
+        self.default_pause = default_pause
+        self.min_rate_fraction = min_rate_fraction
+        self.recovery_step = recovery_step
+        self.rate_fraction = 1.0
+        self.paused_until = time.monotonic()
+        self.throttled_count = 0
+        self.requests = None
+        self.edits = None
+        if requests_per_second is not None:
+            self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        if edits_per_minute is not None:
+            self.edits = TokenBucket(edits_per_minute / 60, 1.0)
+
+    def reserve(self, edit=False):
+        # Returns the number of seconds to wait before sending. Async callers
+        # sleep on this themselves; threads can call acquire().
+        with self.lock:
+            now = time.monotonic()
+            delay = max(0.0, self.paused_until - now)
+            for bucket in (self.requests, self.edits if edit else None):
+                if bucket is not None:
+                    delay = max(delay, bucket.reserve(now, bucket.rate * self.rate_fraction))
+            return delay
+
+    def acquire(self, edit=False):
+        delay = self.reserve(edit)
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttle(self, retry_after=None):
+        if retry_after is None:
+            retry_after = self.default_pause
+        with self.lock:
+            self.throttled_count += 1
+            self.rate_fraction = max(self.min_rate_fraction, self.rate_fraction / 2)
+            until = max(self.paused_until, time.monotonic() + retry_after)
+            self.paused_until = until
+            for bucket in (self.requests, self.edits):
+                if bucket is not None:
+                    bucket.pause_until(until)
+
+    def succeed(self):
+        with self.lock:
+            self.rate_fraction = min(1.0, self.rate_fraction + self.recovery_step)
+
+    def current_rates(self):
+        # Effective (requests per second, edits per minute) right now
+        with self.lock:
+            return (
+                None if self.requests is None else self.requests.rate * self.rate_fraction,
+                None if self.edits is None else self.edits.rate * 60 * self.rate_fraction)
+
+shared_limiter = None
+shared_limiter_lock = threading.Lock()
+
+def shared_rate_limiter(requests_per_second=None, edits_per_minute=None, **kwargs):
+    # Process-wide limiter. The first call creates it; later calls return
+    # the same object and ignore their arguments.
+    global shared_limiter
+    with shared_limiter_lock:
+        if shared_limiter is None:
+            shared_limiter = RateLimiter(requests_per_second, edits_per_minute, **kwargs)
+        return shared_limiter
@@ -0,0 +1,159 @@
+import json
+import random
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# When WikibaseRestAPI retries a request, and how long it waits in between.
+#
+# Only transient failures are retried: connection errors and timeouts, 5xx
+# responses, 408 and 429. Anything else the wiki refuses (400, 403, 404,
+# 422, ...) would be refused again, so it is raised as HTTPError on the
+# first attempt. Edit conflicts are raised as they are; Entity rebases.
+#
+# Delays use "full jitter": a random time between 0 and the exponential
+# backoff, so that clients which failed together do not all retry together.
+# A Retry-After from the server is honoured, up to max_delay.
+#
+#   api = WikibaseRestAPI(retry_policy=RetryPolicy(max_retries=5,
+#                                                  circuit_breaker=CircuitBreaker()))
+
+class HTTPError(Exception):
+    # A response the wiki will keep giving; not retried. retry_after is the
+    # server's requested pause, in seconds, for a 429 or 503.
+    def __init__(self, status_code, body, retry_after=None):
+        super().__init__(f"HTTP Error with status code: {status_code}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+class RetriesExhausted(Exception):
+    # Every attempt failed. error is the last attempt's exception, and
+    # status_code its HTTP status (None if no response came back).
+    def __init__(self, attempts, error):
+        super().__init__(f"All retries exhausted after {attempts}"
+                         f" attempts. Last error encountered: {str(error)}")
+        self.attempts = attempts
+        self.error = error
+        self.status_code = getattr(error, "status_code", None)
+
+class RetryableError(Exception):
+    # A failure on our side of a request that is worth another attempt
+    pass
+
+class CircuitOpen(Exception):
+    # Raised without sending anything while an endpoint's circuit is open
+    def __init__(self, endpoint, retry_at):
+        super().__init__(f"Circuit open for {endpoint[0].upper()} {endpoint[1]}; "
+                         f"retrying in {max(0, retry_at - time.monotonic()):.1f} seconds")
+        self.endpoint = endpoint
+        self.retry_at = retry_at
+
+transient_errors = (OSError, json.JSONDecodeError, RetryableError)
+if aiohttp is not None:
+    transient_errors += (aiohttp.ClientError,)
+
+class RetryPolicy:
+    def __init__(self, max_retries=10, base_delay=1, max_delay=60, jitter=True,
+                 retry_statuses=(408, 429), circuit_breaker=None, seed=None):
+        # max_retries counts attempts, the first included. Every 5xx is
+        # retried, and so are the statuses in retry_statuses.
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.circuit_breaker = circuit_breaker
+        self.random = random.Random(seed)
+
+    def is_transient(self, status_code=None, error=None):
+        # By response status if there was one, otherwise by the exception
+        if status_code is not None:
+            return status_code >= 500 or status_code in self.retry_statuses
+        return isinstance(error, transient_errors)
+
+    def delay(self, attempt, retry_after=None):
+        # Seconds to wait after the attempt-th attempt (from 1) failed
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        backoff = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        if not self.jitter:
+            return backoff
+        return self.random.uniform(0, backoff)
+
+    def before_request(self, endpoint):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request(endpoint)
+
+    def record(self, endpoint, status_code=None, error=None, retry_after=None):
+        # Tells the circuit breaker how an attempt went. Any answer but a
+        # transient error status means the wiki is up; so does throttling
+        # (429, or a Retry-After), which the rate limiter deals with. Local
+        # errors say nothing either way.
+        breaker = self.circuit_breaker
+        if breaker is None or status_code == 429 or retry_after is not None:
+            return
+        if status_code is not None:
+            if self.is_transient(status_code):
+                breaker.failed(endpoint)
+            else:
+                breaker.succeeded(endpoint)
+        elif self.is_transient(error=error) and not isinstance(error, RetryableError):
+            breaker.failed(endpoint)
+
+class CircuitBreaker:
+    # Tracks failures per (verb, endpoint template). After failure_threshold
+    # transient failures in a row an endpoint's circuit opens, and requests
+    # to it raise CircuitOpen at once instead of adding to the load on a
+    # wiki that is down. After reset_timeout seconds one request is let
+    # through as a probe: if it succeeds the circuit closes, if not it stays
+    # open for another reset_timeout. Safe to share between threads and
+    # API clients.
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        # endpoint -> consecutive failures
+        self.failures = {}
+        # endpoint -> time the circuit may be probed
+        self.open_until = {}
+
+    def state(self, endpoint):
+        with self.lock:
+            if endpoint not in self.open_until:
+                return "closed"
+            if time.monotonic() < self.open_until[endpoint]:
+                return "open"
+            return "half-open"
+
+    def before_request(self, endpoint):
+        # Raises CircuitOpen, or lets the request through
+        with self.lock:
+            retry_at = self.open_until.get(endpoint)
+            if retry_at is None:
+                return
+            now = time.monotonic()
+            if now < retry_at:
+                raise CircuitOpen(endpoint, retry_at)
+            # This is the probe; everyone else waits for its outcome (or
+            # another reset_timeout, should it never report back)
+            self.open_until[endpoint] = now + self.reset_timeout
+
+    def succeeded(self, endpoint):
+        with self.lock:
+            self.failures.pop(endpoint, None)
+            self.open_until.pop(endpoint, None)
+
+    def failed(self, endpoint):
+        with self.lock:
+            failures = self.failures.get(endpoint, 0) + 1
+            self.failures[endpoint] = failures
+            if failures >= self.failure_threshold:
+                if endpoint not in self.open_until:
+                    print(f"Circuit opened for {endpoint[0].upper()} {endpoint[1]} "
+                          f"after {failures} failures")
+                self.open_until[endpoint] = time.monotonic() + self.reset_timeout
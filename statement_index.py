@@ -0,0 +1,87 @@
+from codec import default_codec
+
+def normalize_value(value):
+    # A hashable key that is equal for values Wikibase treats as equal:
+    # key order does not matter and quantities may or may not carry a "+"
+    content = value.get("content")
+    if isinstance(content, dict) and isinstance(content.get("amount"), str):
+        content = dict(content, amount=content["amount"].lstrip("+"))
+    if isinstance(content, str):
+        return (value.get("type"), content)
+    return (value.get("type"), default_codec.dumps(content, sort_keys=True))
+
+class StatementIndex:
+    # Lookups into an entity's statements dict (property ID -> list of
+    # statements) by statement ID and by (property ID, value). The entity
+    # reports every property it changes with mark_stale(); that property is
+    # reindexed on the next lookup, which keeps edits made through the
+    # Statement objects (or touch()) from leaving stale entries behind.
+    def __init__(self, statements):
+        self.statements = statements
+        self.by_id = {}
+        self.by_value = {}
+        # property ID -> [(statement ID, value key, statement), ...] as
+        # indexed, so entries can be dropped after the statements changed
+        self.indexed = {}
+        self.stale = set()
+        for property_id in statements:
+            self._index_property(property_id)
+
+    def _index_property(self, property_id):
+        for statement in self.statements.get(property_id, []):
+            self._index_statement(property_id, statement)
+
+    def _index_statement(self, property_id, statement):
+        statement_id = statement.get("id")
+        value_key = (property_id, normalize_value(statement.get("value", {})))
+        if statement_id is not None:
+            self.by_id[statement_id] = (property_id, statement)
+        self.by_value.setdefault(value_key, []).append(statement)
+        self.indexed.setdefault(property_id, []).append((statement_id, value_key, statement))
+
+    def _unindex_property(self, property_id):
+        for statement_id, value_key, statement in self.indexed.pop(property_id, []):
+            self._drop(statement_id, value_key, statement)
+
+    def _drop(self, statement_id, value_key, statement):
+        if statement_id is not None and self.by_id.get(statement_id, (None, None))[1] is statement:
+            del self.by_id[statement_id]
+        matches = self.by_value.get(value_key, [])
+        for n, match in enumerate(matches):
+            if match is statement:
+                del matches[n]
+                break
+        if not matches:
+            self.by_value.pop(value_key, None)
+
+    def _refresh(self):
+        for property_id in self.stale:
+            self._unindex_property(property_id)
+            self._index_property(property_id)
+        self.stale.clear()
+
+    def mark_stale(self, property_id):
+        self.stale.add(property_id)
+
+    def add(self, property_id, statement):
+        if property_id not in self.stale:
+            self._index_statement(property_id, statement)
+
+    def remove(self, property_id, statement):
+        if property_id in self.stale:
+            return
+        entries = self.indexed.get(property_id, [])
+        for n, entry in enumerate(entries):
+            if entry[2] is statement:
+                del entries[n]
+                self._drop(*entry)
+                break
+
+    def get(self, statement_id):
+        # (property ID, statement), or (None, None)
+        self._refresh()
+        return self.by_id.get(statement_id, (None, None))
+
+    def find(self, property_id, value):
+        self._refresh()
+        return list(self.by_value.get((property_id, normalize_value(value)), []))
@@ -1,10 +1,34 @@
 from api import *
-import credentials
+from mockserver import MockServer
 import hashlib
 import time
 
 test_endpoint = "https://test.wikidata.org/w/rest.php/wikibase/v0"
 
+def make_statement(statement_id, property_id, content):
+    return {"id": statement_id, "rank": "normal",
+            "property": {"id": property_id, "data_type": "wikibase-item"},
+            "value": {"type": "value", "content": content},
+            "qualifiers": [], "references": []}
+
+# Stand-ins for an item and a property on test.wikidata.org
+test_entities = [
+    {"id": "Q41487", "type": "item",
+     "labels": {"en": "test item", "de": "Testobjekt"},
+     "descriptions": {"en": "an item to test with"},
+     "aliases": {"en-us": ["sample item"]},
+     "statements": {"P286": [make_statement(
+         "Q41487$afcef841-4ee6-4be6-3c62-eb4021c84eed", "P286", "Q225467")]},
+     "sitelinks": {"commonswiki": {"title": "Category:Test", "badges": []}}},
+    {"id": "P98435", "type": "property", "data_type": "wikibase-item",
+     "labels": {"en": "test property"},
+     "descriptions": {"en": "a property to test with"},
+     "aliases": {"en-us": ["sample property"]},
+     "statements": {"P31": [make_statement(
+         "P98435$f2550e05-42fa-3537-c0a9-16aa8038f3f5", "P31", "Q41487")]}},
+    {"id": "Q225467", "type": "item"}
+]
+
 def make_up_string(tweak):
     current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
     time_bytes = current_time.encode('utf-8')
@@ -19,15 +43,33 @@ def test_create_apisession():
     assert testobj.api_secret is None
     assert testobj.endpoint == wikidata_endpoint
     assert testobj.access_token is None
-    assert testobj.base_headers == {"Content-Type": "application/json"}
+    assert testobj.base_headers == {"Content-Type": "application/json",
+                                    "Accept-Encoding": default_accept_encoding}
     assert WikibaseRestAPI(endpoint=test_endpoint).endpoint == test_endpoint
     assert WikibaseRestAPI(access_token="abcdefg").base_headers == {
         "Content-Type": "application/json",
-        "Authorization": "Bearer abcdefg"
+        "Authorization": "Bearer abcdefg",
+        "Accept-Encoding": default_accept_encoding
     }
 
+def test_session_pool():
+    testobj = WikibaseRestAPI(pool_maxsize=4)
+    assert testobj.owns_session
+    adapter = testobj.session.get_adapter(test_endpoint)
+    assert adapter._pool_maxsize == 4
+
+    shared = make_session()
+    first = WikibaseRestAPI(session=shared)
+    second = WikibaseRestAPI(session=shared)
+    assert first.session is second.session
+    assert not first.owns_session
+    first.close()
+    assert shared.adapters
+
+    assert "Connection" not in testobj.base_headers
+    assert WikibaseRestAPI(keep_alive=False).base_headers["Connection"] == "close"
+
 def test_getters():
-    # Corresponding to test.wikidata.org
     test_item = "Q41487"
     test_property = "P98435"
     language_code = "en"
@@ -38,10 +80,11 @@ def test_getters():
     test_property_statement = "P98435$f2550e05-42fa-3537-c0a9-16aa8038f3f5"
     test_property_statement_property = "P31"
 
-    testobj = WikibaseRestAPI(endpoint=test_endpoint)
-    request = requests.get(test_endpoint + f"/entities/items/{test_item}")
+    server = MockServer(entities=test_entities)
+    testobj = WikibaseRestAPI(endpoint=server.endpoint)
+    request = requests.get(server.endpoint + f"/entities/items/{test_item}")
     benchmark = request.json()
-    request_property = requests.get(test_endpoint + f"/entities/properties/{test_property}")
+    request_property = requests.get(server.endpoint + f"/entities/properties/{test_property}")
     benchmark_property = request_property.json()
 
     print("get_item")
@@ -124,9 +167,13 @@ def test_getters():
     assert testobj.get_property_statement(test_property, test_property_statement) \
         == benchmark_property["statements"].get(test_property_statement_property)[0]
 
+    testobj.close()
+    server.stop()
+
 
 def test_editing():
-    testobj = WikibaseRestAPI(endpoint=test_endpoint, access_token=credentials.access_token)
+    server = MockServer(entities=test_entities)
+    testobj = WikibaseRestAPI(endpoint=server.endpoint, access_token="abcdefg")
 
     print("add_item")
     item_data = {
@@ -189,6 +236,13 @@ def test_editing():
     old_aliases = updated_item_data["aliases"]
     testobj.update_item_aliases(item_id, new_aliases, old_aliases)
 
+    stored = server.wiki.get_entity(item_id)
+    assert stored["labels"] == new_labels
+    assert stored["descriptions"] == new_description
+    assert stored["aliases"] == new_aliases
+    assert [statement["id"] for statement in stored["statements"]["P95201"]] == [statement_id]
+    assert stored["statements"]["P95201"][0]["value"]["content"] == "Q41487"
+
     #print("delete_statement")
     #testobj.delete_item_statement(item_id, statement_id)
 
@@ -196,7 +250,7 @@ def test_editing():
     #testobj.delete_item(item_id)
 
     property_id = "P98435"
-    property_data = requests.get(test_endpoint + f"/entities/properties/{property_id}").json()
+    property_data = requests.get(server.endpoint + f"/entities/properties/{property_id}").json()
 
     #print("add_property_statement")
     #property_statement_response = testobj.add_property_statement(property_id, statement_data)
@@ -216,8 +270,12 @@ def test_editing():
     # delete_property
     #testobj.delete_property(property_id)
 
+    testobj.close()
+    server.stop()
+
 def run_tests():
     test_create_apisession()
+    test_session_pool()
     test_getters()
     test_editing()
     print("Tests complete.")
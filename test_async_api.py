@@ -0,0 +1,123 @@
+from async_api import *
+from entity import AsyncConnection, Entity
+from mockserver import MockServer
+import unittest
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+item = {
+    "id": "Q1",
+    "type": "item",
+    "labels": {"en": "old label"},
+    "descriptions": {},
+    "aliases": {},
+    "statements": {},
+    "sitelinks": {}
+}
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class TestAsyncWikibaseRestAPI(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.received = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def get_entity(request):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return web.json_response(item)
+
+        async def patch_entity(request):
+            self.received.append((request.headers["Content-Type"], await request.json()))
+            return web.json_response(item)
+
+        async def put_label(request):
+            self.received.append((request.path, await request.json()))
+            return web.json_response((await request.json())["label"])
+
+        app = web.Application()
+        app.router.add_get("/entities/items/{id}", get_entity)
+        app.router.add_patch("/entities/items/{id}", patch_entity)
+        app.router.add_put("/entities/items/{id}/labels/{language}", put_label)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.endpoint = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_get_item(self):
+        async with AsyncWikibaseRestAPI(endpoint=self.endpoint) as api:
+            self.assertEqual(await api.get_item("Q1"), item)
+
+    async def test_semaphore_bounds_concurrency(self):
+        async with AsyncWikibaseRestAPI(endpoint=self.endpoint, max_concurrency=3) as api:
+            results = await asyncio.gather(*[api.get_item("Q1") for _ in range(12)])
+        self.assertEqual(len(results), 12)
+        self.assertLessEqual(self.max_in_flight, 3)
+
+    async def test_update_item_sends_json_patch(self):
+        async with AsyncWikibaseRestAPI(endpoint=self.endpoint) as api:
+            new_data = dict(item, labels={"en": "new label"})
+            await api.update_item("Q1", new_data, item, edit_summary="test")
+        content_type, payload = self.received[0]
+        self.assertEqual(content_type, "application/json-patch+json")
+        self.assertEqual(payload["patch"], [
+            {"op": "replace", "path": "/labels/en", "value": "new label"}])
+        self.assertEqual(payload["comment"], "test")
+
+    async def test_entity_load_and_submit(self):
+        async with AsyncConnection(endpoint=self.endpoint) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            self.assertIsNone(entity.original_data)
+            await entity.load_async()
+            self.assertEqual(entity.get_label("en"), "old label")
+            self.assertIsNone(await entity.submit_async())
+            entity.set_label("en", "new label")
+            self.assertEqual(await entity.submit_async(), "new label")
+            self.assertEqual(entity.original_data["labels"], {"en": "new label"})
+            entity.set_label("en", "newer label")
+            entity.set_label("de", "neues Etikett")
+            self.assertEqual(await entity.submit_async(), item)
+        self.assertEqual(self.received[0][0], "/entities/items/Q1/labels/en")
+        self.assertEqual(self.received[0][1]["label"], "new label")
+        self.assertEqual(self.received[1][0], "application/json-patch+json")
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class TestAsyncLoadMany(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MockServer(entities=[dict(item, id=f"Q{n}") for n in range(1, 6)])
+
+    async def asyncTearDown(self):
+        self.server.stop()
+
+    async def test_load_many(self):
+        ids = ["Q1", "Q2", "Q9", "Q3", "Q4", "Q5"]
+        errors = {}
+        async with AsyncConnection(endpoint=self.server.endpoint) as connection:
+            entities = await connection.load_many(ids, workers=2, errors=errors)
+            unordered = await connection.load_many(ids, workers=2, ordered=False)
+            partial = await connection.load_many(["Q1"], fields=["labels"])
+        self.assertEqual([entity.get_id() for entity in entities], ["Q1", "Q2", "Q3", "Q4", "Q5"])
+        self.assertTrue(all(entity.loaded for entity in entities))
+        self.assertEqual(entities[0].get_label("en"), "old label")
+        self.assertEqual(list(errors), ["Q9"])
+        self.assertEqual(sorted(entity.get_id() for entity in unordered),
+                         ["Q1", "Q2", "Q3", "Q4", "Q5"])
+        self.assertEqual(partial[0].unloaded, {"descriptions", "aliases", "statements", "sitelinks"})
+
+    async def test_edit_queue_is_refused(self):
+        async with AsyncConnection(endpoint=self.server.endpoint) as connection:
+            with self.assertRaises(TypeError):
+                connection.edit_queue()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+from cache import *
+from api import WikibaseRestAPI
+from test_rate_limiter import FakeResponse, FakeSession
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+def store_many(path, worker):
+    cache = DiskCache(path)
+    for n in range(50):
+        cache.store(f"/entities/items/Q{worker}{n:03}", f'"{n}"', b"x" * 100)
+
+class TestPaths(unittest.TestCase):
+    def test_entity_id_from_path(self):
+        self.assertEqual(entity_id_from_path("/entities/items/Q42"), "Q42")
+        self.assertEqual(entity_id_from_path("/entities/items/Q42/labels/en"), "Q42")
+        self.assertEqual(entity_id_from_path("/statements/Q42$F078E5B3-F9A8"), "Q42")
+        self.assertIsNone(entity_id_from_path("/entities/items"))
+
+    def test_cache_key(self):
+        self.assertEqual(cache_key("/entities/items/Q1", {}), "/entities/items/Q1")
+        self.assertEqual(cache_key("/x", {"b": 2, "a": 1}), "/x?a=1&b=2")
+
+class TestResponseCache(unittest.TestCase):
+    def test_fresh_and_stale(self):
+        cache = ResponseCache(ttl=60)
+        self.assertEqual(cache.lookup("/entities/items/Q1"), (None, False))
+        cache.store("/entities/items/Q1", '"12"', b"{}")
+        entry, fresh = cache.lookup("/entities/items/Q1")
+        self.assertTrue(fresh)
+        self.assertEqual(entry.etag, '"12"')
+        cache.ttl = 0
+        self.assertFalse(cache.lookup("/entities/items/Q1")[1])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_byte_bound_evicts_least_recently_used(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.store("/entities/items/Q1", None, b"aaaa")
+        cache.store("/entities/items/Q2", None, b"bbbb")
+        cache.lookup("/entities/items/Q1")
+        cache.store("/entities/items/Q3", None, b"cccc")
+        self.assertIsNotNone(cache.lookup("/entities/items/Q1")[0])
+        self.assertIsNone(cache.lookup("/entities/items/Q2")[0])
+        self.assertEqual(cache.stats()["bytes"], 8)
+        cache.store("/entities/items/Q4", None, b"x" * 11)
+        self.assertIsNone(cache.lookup("/entities/items/Q4")[0])
+
+    def test_invalidate_entity(self):
+        cache = ResponseCache()
+        cache.store("/entities/items/Q1", None, b"{}")
+        cache.store("/entities/items/Q1/labels", None, b"{}")
+        cache.store("/entities/items/Q2", None, b"{}")
+        cache.invalidate("Q1")
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.keys_by_entity, {"Q2": {"/entities/items/Q2"}})
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persists_across_instances(self):
+        DiskCache(self.path).store("/entities/items/Q1", '"7"', b'{"id": "Q1"}')
+        cache = DiskCache(self.path)
+        entry, fresh = cache.lookup("/entities/items/Q1")
+        self.assertTrue(fresh)
+        self.assertEqual((entry.etag, entry.body), ('"7"', b'{"id": "Q1"}'))
+        self.assertEqual(cache.get_revision("Q1"), '"7"')
+        cache.ttl = 0
+        self.assertFalse(cache.lookup("/entities/items/Q1")[1])
+        self.assertEqual(cache.revalidated("/entities/items/Q1").body, b'{"id": "Q1"}')
+        cache.invalidate("Q1")
+        self.assertEqual(cache.lookup("/entities/items/Q1"), (None, False))
+
+    def test_eviction_by_age_and_size(self):
+        cache = DiskCache(self.path, max_bytes=250, max_age=60)
+        for n in range(5):
+            cache.store(f"/entities/items/Q{n}", None, b"x" * 100)
+        cache._db().execute("UPDATE responses SET stored_at = stored_at - 120 WHERE key = ?",
+                            ("/entities/items/Q4",))
+        cache.evict()
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["bytes"]), (2, 200))
+        self.assertIsNone(cache.lookup("/entities/items/Q4")[0])
+        self.assertIsNotNone(cache.lookup("/entities/items/Q3")[0])
+
+    def test_concurrent_processes(self):
+        DiskCache(self.path)
+        processes = [multiprocessing.Process(target=store_many, args=(self.path, n))
+                     for n in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(DiskCache(self.path).stats()["entries"], 200)
+
+    def test_as_request_cache(self):
+        api = WikibaseRestAPI(cache=DiskCache(self.path, ttl=0))
+        api.session = FakeSession([
+            FakeResponse(200, "first", {"ETag": '"1"'}),
+            FakeResponse(304, "")])
+        self.assertEqual(api.get_item("Q1"), {"body": "first"})
+        self.assertEqual(api.get_item("Q1"), {"body": "first"})
+        self.assertEqual(api.session.sent_headers[1]["If-None-Match"], '"1"')
+
+class TestCachedRequests(unittest.TestCase):
+    def test_fresh_entry_skips_request(self):
+        api = WikibaseRestAPI(cache=ResponseCache(ttl=60))
+        api.session = FakeSession([FakeResponse(200, "first", {"ETag": '"1"'})])
+        self.assertEqual(api.get_item("Q1"), {"body": "first"})
+        self.assertEqual(api.get_item("Q1"), {"body": "first"})
+        self.assertEqual(len(api.session.sent), 1)
+
+    def test_revalidation(self):
+        api = WikibaseRestAPI(cache=ResponseCache(ttl=0))
+        api.session = FakeSession([
+            FakeResponse(200, "first", {"ETag": '"1"'}),
+            FakeResponse(304, "", {"ETag": '"1"'}),
+            FakeResponse(200, "second", {"ETag": '"2"'})])
+        self.assertEqual(api.get_item("Q1"), {"body": "first"})
+        self.assertEqual(api.get_item("Q1"), {"body": "first"})
+        self.assertEqual(api.session.sent_headers[1]["If-None-Match"], '"1"')
+        self.assertEqual(api.get_item("Q1"), {"body": "second"})
+        self.assertEqual(api.cache.stats()["revalidations"], 1)
+        self.assertEqual(api.cache.stats()["misses"], 2)
+
+    def test_writes_invalidate(self):
+        api = WikibaseRestAPI(cache=ResponseCache(ttl=60))
+        api.session = FakeSession([
+            FakeResponse(200, "labels"),
+            FakeResponse(200, "edited"),
+            FakeResponse(200, "new labels")])
+        api.get_item_labels("Q1")
+        api.replace_item_label("Q1", "en", "label")
+        self.assertEqual(api.get_item_labels("Q1"), {"body": "new labels"})
+
+if __name__ == '__main__':
+    unittest.main()
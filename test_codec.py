@@ -0,0 +1,70 @@
+from codec import *
+from api import WikibaseRestAPI
+from mockserver import MockServer
+import json
+import unittest
+
+class RecordingSession:
+    def __init__(self, session):
+        self.session = session
+        self.bodies = []
+
+    def request(self, verb, url, **kwargs):
+        self.bodies.append((verb, kwargs.get("data")))
+        return self.session.request(verb, url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+class TestCodecs(unittest.TestCase):
+    def test_round_trip(self):
+        value = {"labels": {"de": "Straße", "ja": "東京"}, "amount": 1.5, "ids": [1, None, True]}
+        for name in codecs:
+            codec = get_codec(name)
+            encoded = codec.dumps(value)
+            self.assertIsInstance(encoded, bytes)
+            self.assertIn("Straße".encode("utf-8"), encoded)
+            self.assertEqual(json.loads(encoded), value)
+            self.assertEqual(codec.loads(encoded), value)
+            self.assertEqual(codec.loads(encoded.decode("utf-8")), value)
+
+    def test_sort_keys(self):
+        for name in codecs:
+            codec = get_codec(name)
+            self.assertEqual(codec.dumps({"b": 1, "a": {"d": 2, "c": 3}}, sort_keys=True),
+                             codec.dumps({"a": {"c": 3, "d": 2}, "b": 1}, sort_keys=True))
+
+    def test_decode_errors(self):
+        # The retry policy counts these as transient
+        for name in codecs:
+            with self.assertRaises(json.JSONDecodeError):
+                get_codec(name).loads(b'{"truncated":')
+
+    def test_get_codec(self):
+        self.assertEqual(get_codec("json").name, "json")
+        self.assertEqual(default_codec.name, "orjson" if orjson is not None else "json")
+        with self.assertRaises(ValueError):
+            get_codec("yaml")
+
+class TestAPICodec(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[{"id": "Q1", "labels": {"en": "label"}}])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_requests(self):
+        for name in codecs:
+            with WikibaseRestAPI(endpoint=self.server.endpoint, codec=get_codec(name)) as api:
+                recorder = RecordingSession(api.session)
+                api.session = recorder
+                self.assertEqual(api.get_item("Q1")["id"], "Q1")
+                api.replace_entity_label("items", "Q1", "en", f"Straße {name}")
+            (get_verb, get_body), (put_verb, put_body) = recorder.bodies
+            self.assertIsNone(get_body)
+            self.assertIsInstance(put_body, bytes)
+            self.assertEqual(json.loads(put_body)["label"], f"Straße {name}")
+            self.assertEqual(self.server.wiki.get_entity("Q1")["labels"]["en"], f"Straße {name}")
+
+if __name__ == '__main__':
+    unittest.main()
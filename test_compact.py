@@ -0,0 +1,46 @@
+from compact import *
+from benchmarks.synthetic import make_entity
+import json
+import unittest
+
+class TestCompactEntity(unittest.TestCase):
+    def test_round_trip(self):
+        entity = make_entity(100)
+        self.assertEqual(CompactEntity.from_dict(entity).to_dict(), entity)
+
+    def test_round_trip_unusual_shapes(self):
+        entity = make_entity(40)
+        statements = entity["statements"]["P1"]
+        statements[0]["value"] = {"type": "value", "content": {
+            "amount": "+5", "unit": "http://www.wikidata.org/entity/Q11573"}}
+        statements[1]["value"] = {"type": "novalue"}
+        statements[2]["extra"] = [1, {"a": [2]}]
+        del statements[3]["qualifiers"]
+        entity["statements"]["P2"][0] = {"not": "a statement"}
+        del entity["sitelinks"]["enwiki"]["url"]
+        del entity["descriptions"]
+        entity["lastrevid"] = 5
+        self.assertEqual(CompactEntity.from_dict(entity).to_dict(), entity)
+
+    def test_interned(self):
+        first = json.loads(json.dumps({"statements": {"P31": [{
+            "id": "Q1$1", "rank": "normal",
+            "property": {"id": "P31", "data_type": "wikibase-item"},
+            "value": {"type": "value", "content": "Q5"}}]}}))
+        second = json.loads(json.dumps(first))
+        a = CompactEntity.from_dict(first).get_statements("P31")[0]
+        b = CompactEntity.from_dict(second).get_statements("P31")[0]
+        self.assertIs(a.property_id, b.property_id)
+        self.assertIs(a.content, b.content)
+        self.assertEqual(a.get_value(), {"type": "value", "content": "Q5"})
+        self.assertEqual(a.get_id(), "Q1$1")
+
+    def test_immutable_parts(self):
+        entity = CompactEntity.from_dict(make_entity(20))
+        statement = entity.get_statements("P1")[0]
+        self.assertIsInstance(statement.references, tuple)
+        self.assertIsInstance(entity.aliases["en"], tuple)
+        self.assertFalse(hasattr(statement, "__dict__"))
+
+if __name__ == '__main__':
+    unittest.main()
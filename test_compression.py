@@ -0,0 +1,113 @@
+from api import WikibaseRestAPI, decompress
+from async_api import AsyncWikibaseRestAPI, aiohttp
+from metrics import MetricsCollector
+from mockserver import MockServer
+from retry import HTTPError, RetryPolicy
+import gzip
+import zlib
+import unittest
+
+big_item = {"id": "Q1", "labels": {f"l{n}": f"A rather repetitive label {n}" for n in range(200)}}
+big_label = "label " * 200
+fast_retries = RetryPolicy(base_delay=0.001, max_delay=0.001)
+
+class RecordingHook:
+    def __init__(self):
+        self.infos = []
+
+    def after_request(self, info):
+        self.infos.append(info)
+
+class TestDecompress(unittest.TestCase):
+    def test_encodings(self):
+        body = b'{"a":"' + b"x" * 100 + b'"}'
+        self.assertEqual(decompress(gzip.compress(body), "gzip"), body)
+        self.assertEqual(decompress(zlib.compress(body), "deflate"), body)
+        raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        self.assertEqual(decompress(raw_deflate.compress(body) + raw_deflate.flush(), "deflate"), body)
+        self.assertEqual(decompress(body, None), body)
+        self.assertEqual(decompress(body, "identity"), body)
+        with self.assertRaises(ValueError):
+            decompress(body, "br")
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[big_item], gzip_responses=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_compressed_responses(self):
+        hook = RecordingHook()
+        metrics = MetricsCollector()
+        with WikibaseRestAPI(endpoint=self.server.endpoint, hooks=[hook, metrics]) as api:
+            self.assertEqual(api.get_item("Q1"), self.server.wiki.get_entity("Q1"))
+        info, = hook.infos
+        self.assertLess(info.bytes_received, info.uncompressed_bytes_received)
+        self.assertGreater(info.compression_ratio(), 3)
+        self.assertIsNone(info.compression_ratio("sent"))
+        self.assertAlmostEqual(metrics.compression_ratio(verb="get"), info.compression_ratio())
+        self.assertIn('wikibase_request_uncompressed_bytes_received_total{verb="get",'
+                      'endpoint="/entities/items/{entity_id}"} '
+                      f'{info.uncompressed_bytes_received}\n', metrics.openmetrics())
+
+    def test_identity_when_not_asked_for(self):
+        hook = RecordingHook()
+        with WikibaseRestAPI(endpoint=self.server.endpoint, hooks=[hook],
+                             accept_encoding="identity") as api:
+            api.get_item("Q1")
+        self.assertEqual(hook.infos[0].compression_ratio(), 1.0)
+
+    def test_compressed_requests(self):
+        hook = RecordingHook()
+        with WikibaseRestAPI(endpoint=self.server.endpoint, hooks=[hook],
+                             compress_requests=512) as api:
+            api.replace_entity_label("items", "Q1", "en", "short")
+            api.replace_entity_label("items", "Q1", "de", big_label)
+        short, long = hook.infos
+        self.assertEqual(short.bytes_sent, short.uncompressed_bytes_sent)
+        self.assertLess(long.bytes_sent, long.uncompressed_bytes_sent)
+        self.assertGreater(long.compression_ratio("sent"), 3)
+        self.assertEqual(self.server.wiki.get_entity("Q1")["labels"]["de"], big_label)
+
+    def test_refused_compression_falls_back(self):
+        self.server.gzip_requests = False
+        hook = RecordingHook()
+        with WikibaseRestAPI(endpoint=self.server.endpoint, hooks=[hook],
+                             compress_requests=512, retry_policy=fast_retries) as api:
+            api.replace_entity_label("items", "Q1", "de", big_label)
+            self.assertIsNone(api.compress_requests)
+            api.replace_entity_label("items", "Q1", "fr", big_label)
+        self.assertEqual([info.status for info in hook.infos], [415, 201, 201])
+        self.assertEqual(self.server.wiki.get_entity("Q1")["labels"]["fr"], big_label)
+
+    def test_415_without_a_body_is_permanent(self):
+        with WikibaseRestAPI(endpoint=self.server.endpoint, compress_requests=512,
+                             retry_policy=fast_retries) as api:
+            self.server.fail_next(415)
+            with self.assertRaises(HTTPError):
+                api.get_item("Q1")
+            self.assertEqual(api.compress_requests, 512)
+        self.assertEqual(len(self.server.requests), 1)
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncCompression(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MockServer(entities=[big_item], gzip_responses=True)
+
+    async def asyncTearDown(self):
+        self.server.stop()
+
+    async def test_compression(self):
+        hook = RecordingHook()
+        async with AsyncWikibaseRestAPI(endpoint=self.server.endpoint, hooks=[hook],
+                                        compress_requests=512) as api:
+            self.assertEqual(await api.get_item("Q1"), self.server.wiki.get_entity("Q1"))
+            await api.replace_entity_label("items", "Q1", "de", big_label)
+        get, put = hook.infos
+        self.assertGreater(get.compression_ratio(), 3)
+        self.assertGreater(put.compression_ratio("sent"), 3)
+        self.assertEqual(self.server.wiki.get_entity("Q1")["labels"]["de"], big_label)
+
+if __name__ == '__main__':
+    unittest.main()
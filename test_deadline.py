@@ -0,0 +1,98 @@
+from deadline import *
+from api import WikibaseRestAPI
+from async_api import AsyncWikibaseRestAPI, aiohttp
+from edit_queue import EditQueue
+from entity import Connection
+from mockserver import MockServer
+from retry import RetriesExhausted, RetryPolicy
+import time
+import unittest
+
+fast_retries = RetryPolicy(base_delay=0.01, max_delay=0.01, jitter=False)
+
+class TestDeadline(unittest.TestCase):
+    def test_nesting(self):
+        self.assertIsNone(remaining())
+        self.assertIsNone(expiry())
+        with deadline(10):
+            self.assertAlmostEqual(remaining(), 10, delta=0.1)
+            with deadline(1):
+                self.assertAlmostEqual(remaining(), 1, delta=0.1)
+            # An inner deadline cannot extend the outer one
+            with deadline(100):
+                self.assertAlmostEqual(remaining(), 10, delta=0.1)
+            self.assertAlmostEqual(remaining(expiry(2)), 2, delta=0.1)
+        self.assertIsNone(remaining())
+
+    def test_edit_queue_carries_deadline(self):
+        with EditQueue(workers=2) as queue:
+            with deadline(5):
+                inside = queue.call("Q1", remaining)
+            outside = queue.call("Q2", remaining)
+            self.assertAlmostEqual(inside.result(), 5, delta=0.5)
+            self.assertIsNone(outside.result())
+
+class TestTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[{"id": "Q1"}, {"id": "Q2"}], latency=1)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_read_timeout(self):
+        start = time.monotonic()
+        with WikibaseRestAPI(endpoint=self.server.endpoint, timeout=(1, 0.05),
+                             retry_policy=fast_retries) as api:
+            with self.assertRaisesRegex(RetriesExhausted, "All retries exhausted after 2"):
+                api._request("get", "/entities/items/Q1", max_retries=2)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_call_deadline_covers_retries(self):
+        self.server.latency = 0
+        self.server.fail_next(500, count=100)
+        start = time.monotonic()
+        policy = RetryPolicy(max_retries=100, base_delay=0.05, max_delay=0.05, jitter=False)
+        with WikibaseRestAPI(endpoint=self.server.endpoint, deadline=0.2,
+                             retry_policy=policy) as api:
+            with self.assertRaisesRegex(DeadlineExceeded, "Deadline exceeded after"):
+                api.get_item("Q1")
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertGreater(len(self.server.requests), 2)
+
+    def test_deadline_reaches_load_many(self):
+        errors = {}
+        start = time.monotonic()
+        with Connection(endpoint=self.server.endpoint, retry_policy=fast_retries) as connection:
+            with deadline(0.1):
+                loaded = list(connection.load_many(["Q1", "Q2"], workers=2, errors=errors))
+        self.assertEqual(loaded, [])
+        self.assertEqual(set(errors), {"Q1", "Q2"})
+        self.assertIsInstance(errors["Q1"], DeadlineExceeded)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_expired_deadline_sends_nothing(self):
+        with WikibaseRestAPI(endpoint=self.server.endpoint) as api:
+            with deadline(0):
+                with self.assertRaises(DeadlineExceeded):
+                    api.get_item("Q1")
+        self.assertEqual(self.server.requests, [])
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncDeadline(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MockServer(entities=[{"id": "Q1"}], latency=1)
+
+    async def asyncTearDown(self):
+        self.server.stop()
+
+    async def test_deadline(self):
+        start = time.monotonic()
+        async with AsyncWikibaseRestAPI(endpoint=self.server.endpoint,
+                                        retry_policy=fast_retries) as api:
+            with deadline(0.1):
+                with self.assertRaises(DeadlineExceeded):
+                    await api.get_item("Q1")
+        self.assertLess(time.monotonic() - start, 0.6)
+
+if __name__ == '__main__':
+    unittest.main()
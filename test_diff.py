@@ -0,0 +1,79 @@
+from diff import *
+from benchmarks.synthetic import edits, make_entity, make_statement
+import copy
+import jsonpatch
+import random
+import unittest
+
+class TestMakePatch(unittest.TestCase):
+    def assertRoundTrip(self, old, new):
+        ops = make_patch(old, new)
+        self.assertEqual(jsonpatch.apply_patch(old, ops), new)
+        return ops
+
+    def test_no_changes(self):
+        entity = make_entity(50)
+        self.assertEqual(make_patch(entity, copy.deepcopy(entity)), [])
+
+    def test_scalars_and_keys(self):
+        ops = self.assertRoundTrip(
+            {"a": 1, "b": "x", "c": True, "a/b": 1},
+            {"a": 2, "c": 1, "d": None, "a/b": 2})
+        self.assertIn({"op": "replace", "path": "/a~1b", "value": 2}, ops)
+        self.assertIn({"op": "replace", "path": "/c", "value": 1}, ops)
+
+    def test_statement_removed_from_middle(self):
+        old = make_entity(200, n_properties=1)
+        new = copy.deepcopy(old)
+        del new["statements"]["P1"][100]
+        self.assertEqual(self.assertRoundTrip(old, new),
+                         [{"op": "remove", "path": "/statements/P1/100"}])
+
+    def test_statement_inserted_at_front(self):
+        old = make_entity(200, n_properties=1)
+        new = copy.deepcopy(old)
+        statement = make_statement(random.Random(5), "Q1", "P1")
+        new["statements"]["P1"].insert(0, statement)
+        self.assertEqual(self.assertRoundTrip(old, new),
+                         [{"op": "add", "path": "/statements/P1/0", "value": statement}])
+
+    def test_statement_edited_in_place(self):
+        old = make_entity(200, n_properties=1)
+        new = copy.deepcopy(old)
+        new["statements"]["P1"][7]["references"].pop()
+        new["statements"]["P1"][7]["rank"] = "preferred"
+        ops = self.assertRoundTrip(old, new)
+        self.assertEqual(len(ops), 2)
+        self.assertTrue(all(op["path"].startswith("/statements/P1/7/") for op in ops))
+
+    def test_reordered(self):
+        old = {"aliases": {"en": ["a", "b", "c", "d"]}}
+        new = {"aliases": {"en": ["d", "a", "c", "b"]}}
+        self.assertRoundTrip(old, new)
+
+    def test_duplicate_values(self):
+        self.assertRoundTrip(["a", "a", "b", "a"], ["a", "b", "a", "a", "c"])
+        self.assertRoundTrip([{"x": 1}, {"x": 1}], [{"x": 1}])
+
+    def test_new_statement_without_id(self):
+        old = make_entity(20, n_properties=2)
+        new = copy.deepcopy(old)
+        new["statements"]["P2"].append({"id": None, "rank": "normal",
+                                        "property": {"id": "P2"},
+                                        "value": {"type": "novalue"}})
+        self.assertEqual(len(self.assertRoundTrip(old, new)), 1)
+
+    def test_random_edits(self):
+        rng = random.Random(42)
+        old = make_entity(300, n_properties=3)
+        for _ in range(30):
+            new = copy.deepcopy(old)
+            for edit in rng.sample(list(edits.values()), 3):
+                edit(new, rng)
+            statements = new["statements"]["P1"]
+            rng.shuffle(statements)
+            del statements[rng.randrange(len(statements))]
+            self.assertRoundTrip(old, new)
+
+if __name__ == '__main__':
+    unittest.main()
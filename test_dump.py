@@ -0,0 +1,139 @@
+from dump import *
+from dump import _bz2_range_lines, _range_lines, _shards
+from entity import Connection
+import bz2
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+def dump_entity(n):
+    entity_id = f"Q{n}"
+    return {
+        "type": "item",
+        "id": entity_id,
+        "lastrevid": 1000 + n,
+        "labels": {"en": {"language": "en", "value": f"label {n}"}},
+        "descriptions": {},
+        "aliases": {"en": [{"language": "en", "value": f"alias {n}"}]},
+        "claims": {"P31" if n % 3 == 0 else "P279": [{
+            "mainsnak": {"snaktype": "value", "property": "P31" if n % 3 == 0 else "P279",
+                         "hash": "h", "datatype": "wikibase-item",
+                         "datavalue": {"value": {"entity-type": "item", "numeric-id": 5, "id": "Q5"},
+                                       "type": "wikibase-entityid"}},
+            "type": "statement",
+            "id": f"{entity_id}$1",
+            "rank": "normal",
+            "qualifiers": {"P585": [{
+                "snaktype": "value", "property": "P585", "hash": "q", "datatype": "time",
+                "datavalue": {"value": {"time": "+2001-01-01T00:00:00Z", "timezone": 0,
+                                        "before": 0, "after": 0, "precision": 11,
+                                        "calendarmodel": "http://www.wikidata.org/entity/Q1985727"},
+                              "type": "time"}}],
+                           "P580": [{"snaktype": "novalue", "property": "P580", "hash": "r",
+                                     "datatype": "time"}]},
+            "qualifiers-order": ["P580", "P585"],
+            "references": [{"hash": "abc", "snaks": {"P854": [{
+                "snaktype": "value", "property": "P854", "datatype": "url",
+                "datavalue": {"value": "https://example.org", "type": "string"}}]},
+                "snaks-order": ["P854"]}]}]},
+        "sitelinks": {"enwiki": {"site": "enwiki", "title": f"Title {n}", "badges": []}}
+    }
+
+def dump_text(count):
+    lines = [json.dumps(dump_entity(n)) for n in range(1, count + 1)]
+    return ("[\n" + ",\n".join(lines) + "\n]\n").encode()
+
+class TestDump(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.text = dump_text(60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def multistream(self, size):
+        # Streams cut every size bytes, mostly in the middle of lines
+        return b"".join(bz2.compress(self.text[n:n + size])
+                        for n in range(0, len(self.text), size))
+
+    def ids(self, entities):
+        return [entity["id"] for entity in entities]
+
+    def test_to_rest(self):
+        entity = to_rest(dump_entity(3))
+        self.assertEqual(entity["labels"], {"en": "label 3"})
+        self.assertEqual(entity["aliases"], {"en": ["alias 3"]})
+        self.assertEqual(entity["sitelinks"], {"enwiki": {"title": "Title 3", "badges": []}})
+        statement = entity["statements"]["P31"][0]
+        self.assertEqual(statement["property"], {"id": "P31", "data_type": "wikibase-item"})
+        self.assertEqual(statement["value"], {"type": "value", "content": "Q5"})
+        self.assertEqual(statement["qualifiers"][0], {
+            "property": {"id": "P580", "data_type": "time"}, "value": {"type": "novalue"}})
+        self.assertEqual(statement["qualifiers"][1]["value"]["content"], {
+            "time": "+2001-01-01T00:00:00Z", "precision": 11,
+            "calendarmodel": "http://www.wikidata.org/entity/Q1985727"})
+        self.assertEqual(statement["references"][0]["parts"][0]["value"]["content"],
+                         "https://example.org")
+
+    def test_formats(self):
+        expected = [f"Q{n}" for n in range(1, 61)]
+        for name, data in [("dump.json", self.text),
+                           ("dump.json.gz", gzip.compress(self.text)),
+                           ("dump.json.bz2", bz2.compress(self.text))]:
+            path = self.write(name, data)
+            self.assertEqual(self.ids(read_dump(path)), expected)
+
+    def test_shards(self):
+        expected = [f"Q{n}" for n in range(1, 61)]
+        path = self.write("dump.json", self.text)
+        for chunk_bytes in (100, 997, 4096):
+            shards = [list(_range_lines(path, start, end)) for start, end in _shards(path, chunk_bytes)]
+            lines = [line for shard in shards for line in shard]
+            self.assertEqual(lines, self.text.splitlines(keepends=True))
+            entities = [parse_line(line) for line in lines]
+            self.assertEqual(self.ids(entity for entity in entities if entity is not None),
+                             expected)
+        path = self.write("multi.json.bz2", self.multistream(1500))
+        for chunk_bytes in (300, 1000, 5000):
+            shards = _shards(path, chunk_bytes)
+            self.assertGreater(len(shards), 1)
+            lines = [line for start, end in shards for line in _bz2_range_lines(path, start, end)]
+            self.assertEqual(lines, self.text.splitlines(keepends=True))
+            entities = [parse_line(line) for line in lines]
+            self.assertEqual(self.ids(entity for entity in entities if entity is not None),
+                             expected)
+
+    def test_processes(self):
+        expected = [f"Q{n}" for n in range(1, 61)]
+        for name, data in [("dump.json", self.text),
+                           ("multi.json.bz2", self.multistream(1500)),
+                           ("dump.json.gz", gzip.compress(self.text))]:
+            path = self.write(name, data)
+            entities = read_dump(path, processes=2, chunk_bytes=2000, batch_lines=7)
+            self.assertEqual(self.ids(entities), expected)
+
+    def test_filters(self):
+        path = self.write("dump.json", self.text)
+        self.assertEqual(self.ids(read_dump(path, properties=["P31"])),
+                         [f"Q{n}" for n in range(3, 61, 3)])
+        self.assertEqual(list(read_dump(path, types=["property"])), [])
+        raw = next(read_dump(path, raw=True))
+        self.assertIn("claims", raw)
+
+    def test_entities(self):
+        path = self.write("dump.json", self.text)
+        entity = next(read_dump_entities(path, Connection()))
+        self.assertEqual(entity.get_label("en"), "label 1")
+        self.assertEqual(entity.revision, "1001")
+        self.assertFalse(entity.has_changes())
+
+if __name__ == '__main__':
+    unittest.main()
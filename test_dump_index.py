@@ -0,0 +1,97 @@
+from dump_index import *
+from entity import Connection, Entity
+from test_dump import dump_entity
+import bz2
+import json
+import os
+import random
+import tempfile
+import unittest
+
+class TestDumpIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        numbers = list(range(1, 201))
+        random.Random(1).shuffle(numbers)
+        lines = [json.dumps(dump_entity(n)) for n in numbers]
+        self.text = ("[\n" + ",\n".join(lines) + "\n]\n").encode()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def build(self, name, data, run_records=1000000):
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+        count = build_index(self.path(name), self.path("index"), run_records=run_records)
+        self.assertEqual(count, 200)
+        return DumpIndex(self.path("index"), self.path(name))
+
+    def check(self, index):
+        with index:
+            self.assertEqual(len(index), 200)
+            for n in (1, 57, 200):
+                self.assertEqual(index.get_raw(f"Q{n}")["id"], f"Q{n}")
+            self.assertEqual(index.get("Q7")["labels"], {"en": "label 7"})
+            self.assertIsNone(index.get("Q201"))
+            self.assertIsNone(index.get("P1"))
+            self.assertNotIn("Q0", index)
+            self.assertNotIn("not an ID", index)
+
+    def test_id_key(self):
+        self.assertLess(id_key("Q9"), id_key("Q10"))
+        self.assertLess(id_key("P100"), id_key("Q1"))
+        self.assertIsNone(id_key("L1-F1"))
+
+    def test_plain(self):
+        self.check(self.build("dump.json", self.text))
+
+    def test_sorted_in_runs(self):
+        self.check(self.build("dump.json", self.text, run_records=7))
+
+    def test_multistream_bz2(self):
+        # Streams cut mid-line, so some lines run on into the next stream
+        size = 900
+        data = b"".join(bz2.compress(self.text[n:n + size]) for n in range(0, len(self.text), size))
+        index = self.build("dump.json.bz2", data)
+        self.assertTrue(index.compressed)
+        self.check(index)
+
+    def test_rejects(self):
+        with open(self.path("dump.json.gz"), "wb") as f:
+            f.write(b"")
+        with self.assertRaises(ValueError):
+            build_index(self.path("dump.json.gz"), self.path("index"))
+        self.build("dump.json", self.text).close()
+        with open(self.path("dump.json"), "ab") as f:
+            f.write(b"\n")
+        with self.assertRaises(ValueError):
+            DumpIndex(self.path("index"), self.path("dump.json"))
+
+    def test_connection(self):
+        index = self.build("dump.json", self.text)
+        with Connection(api=DumpAPI(index)) as connection:
+            entity = Entity(connection=connection, entity_id="Q12")
+            self.assertEqual(entity.get_label("en"), "label 12")
+            self.assertEqual(entity.revision, "1012")
+
+            entity = Entity(connection=connection, entity_id="Q12", properties=["P31"])
+            self.assertEqual(list(entity.get_statements()), ["P31"])
+            self.assertEqual(entity.get_sitelinks()["enwiki"]["title"], "Title 12")
+
+            # Entities never share the dicts they were loaded from
+            entity.set_label("en", "changed")
+            self.assertEqual(Entity(connection=connection, entity_id="Q12").get_label("en"),
+                             "label 12")
+            with self.assertRaises(AttributeError):
+                entity.submit()
+
+            errors = {}
+            loaded = list(connection.load_many(["Q1", "Q999", "Q3"], errors=errors))
+            self.assertEqual([entity.get_id() for entity in loaded], ["Q1", "Q3"])
+            self.assertIsInstance(errors["Q999"], KeyError)
+
+if __name__ == '__main__':
+    unittest.main()
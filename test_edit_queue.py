@@ -0,0 +1,53 @@
+from edit_queue import *
+import random
+import threading
+import time
+import unittest
+
+class TestEditQueue(unittest.TestCase):
+    def test_same_key_runs_in_order(self):
+        log = []
+        def edit(key, n):
+            time.sleep(random.random() / 200)
+            log.append((key, n))
+            return n
+        with EditQueue(workers=8) as queue:
+            futures = [queue.call(key, edit, key, n)
+                       for n in range(20) for key in ("Q1", "Q2", "Q3")]
+            queue.join()
+        for key in ("Q1", "Q2", "Q3"):
+            self.assertEqual([n for k, n in log if k == key], list(range(20)))
+        self.assertEqual([f.result() for f in futures[:3]], [0, 0, 0])
+
+    def test_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(4, timeout=5)
+        with EditQueue(workers=4) as queue:
+            futures = [queue.call(f"Q{n}", barrier.wait) for n in range(4)]
+        for future in futures:
+            self.assertIsNone(future.exception())
+
+    def test_failure_does_not_block_the_chain(self):
+        def fail():
+            raise ValueError("bad payload")
+        with EditQueue(workers=2) as queue:
+            first = queue.call("Q1", fail)
+            second = queue.call("Q1", lambda: "revision")
+        self.assertIsInstance(first.exception(), ValueError)
+        self.assertEqual(second.result(), "revision")
+
+    def test_submit_entity(self):
+        class FakeEntity:
+            def __init__(self, entity_id):
+                self.entity_id = entity_id
+            def get_id(self):
+                return self.entity_id
+            def submit(self):
+                return {"id": self.entity_id}
+        with EditQueue() as queue:
+            futures = [queue.submit(FakeEntity(qid)) for qid in ("Q1", None, None)]
+        self.assertEqual([f.result() for f in futures], [{"id": "Q1"}, {"id": None}, {"id": None}])
+        self.assertEqual(queue.pending(), 0)
+        self.assertRaises(RuntimeError, queue.call, "Q1", print)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,19 @@
 from entity import *
+from api import EditConflict
+from mockserver import MockServer
+from statement_index import normalize_value
+import copy
+import jsonpatch
+import random
+import time
 import unittest
 
-connection = Connection()
+server = MockServer(entities=[{"id": "Q123", "type": "item", "labels": {"en": "Example"}}])
+connection = Connection(endpoint=server.endpoint)
+
+def tearDownModule():
+    connection.close()
+    server.stop()
 
 class TestSnak(unittest.TestCase):
     def test_set_and_get_property(self):
@@ -65,6 +77,18 @@ class TestReference(unittest.TestCase):
         self.assertNotIn(snak.data, reference.data["parts"])
 
 class TestStatement(unittest.TestCase):
+    def test_to_dict(self):
+        statement = Statement(statement_id="S1", property_id="P1", data_type="string", value_content="x")
+        statement.add_qualifier(Snak(property_id="P2", data_type="string", value_content="y"))
+        reference = Reference(ref_hash="abc")
+        reference.add_part(Snak(property_id="P3", data_type="url", value_content="https://example.org"))
+        statement.add_reference(reference)
+        self.assertEqual(statement.to_dict(), statement.data)
+        self.assertEqual(reference.to_dict(), reference.data)
+        entity = Entity(connection=connection)
+        entity.add_statement(statement)
+        self.assertEqual(entity.to_dict()["statements"], {"P1": [statement.data]})
+
     def test_set_and_get_id(self):
         statement = Statement(statement_id="S123")
         self.assertEqual(statement.get_id(), "S123")
@@ -121,5 +145,352 @@ class TestEntity(unittest.TestCase):
         entity = Entity(connection=connection)
         self.assertEqual(entity.get_sitelinks(), {})
 
+class StubAPI:
+    def __init__(self, missing=()):
+        self.missing = missing
+
+    def get_entity_with_revision(self, entity_type, entity_id):
+        time.sleep(random.random() / 100)
+        if entity_id in self.missing:
+            raise Exception("HTTP Error with status code: 404")
+        return {"id": entity_id, "type": "item", "labels": {}, "descriptions": {},
+                "aliases": {}, "statements": {}, "sitelinks": {}}, "1"
+
+class ConflictingAPI:
+    # Someone else keeps editing the item between our load and our submit
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        self.revision = 1
+        self.server = {"id": "Q1", "type": "item", "labels": {"en": "label"},
+                       "descriptions": {}, "aliases": {}, "statements": {}, "sitelinks": {}}
+        self.sent_revisions = []
+
+    def get_entity_with_revision(self, entity_type, entity_id):
+        return copy.deepcopy(self.server), str(self.revision)
+
+    def update_entity(self, entity_type, entity_id, data, old_data, revision=None,
+                      return_revision=False, **kwargs):
+        self.sent_revisions.append(revision)
+        if self.conflicts:
+            self.conflicts -= 1
+            self.revision += 1
+            self.server["descriptions"]["en"] = f"edit {self.revision}"
+            raise EditConflict(412, "")
+        self.server = jsonpatch.make_patch(old_data, data).apply(self.server)
+        self.revision += 1
+        return copy.deepcopy(self.server), str(self.revision)
+
+class TestLoadMany(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection()
+        self.connection.api = StubAPI(missing={"Q3", "Q7"})
+        self.ids = [f"Q{n}" for n in range(1, 41)]
+
+    def test_ordered(self):
+        errors = {}
+        entities = list(self.connection.load_many(self.ids, workers=4, errors=errors))
+        expected = [qid for qid in self.ids if qid not in ("Q3", "Q7")]
+        self.assertEqual([entity.get_id() for entity in entities], expected)
+        self.assertEqual(set(errors), {"Q3", "Q7"})
+        self.assertEqual(entities[0].original_data, entities[0].data)
+
+    def test_unordered(self):
+        errors = {}
+        entities = self.connection.load_many(iter(self.ids), workers=4, ordered=False, errors=errors)
+        self.assertEqual(sorted(entity.get_id() for entity in entities),
+                         sorted(qid for qid in self.ids if qid not in ("Q3", "Q7")))
+        self.assertEqual(set(errors), {"Q3", "Q7"})
+
+class RecordingAPI:
+    def __init__(self):
+        self.calls = []
+        self.statement_count = 0
+
+    def get_entity_with_revision(self, entity_type, entity_id):
+        return {"id": entity_id, "type": "item",
+                "labels": {"en": "label", "fr": "étiquette"},
+                "descriptions": {}, "aliases": {"en": ["a"]}, "sitelinks": {},
+                "statements": {"P1": [
+                    {"id": "Q1$1", "rank": "normal", "property": {"id": "P1"},
+                     "value": {"type": "value", "content": "x"}, "qualifiers": [], "references": []},
+                    {"id": "Q1$2", "rank": "normal", "property": {"id": "P1"},
+                     "value": {"type": "value", "content": "y"}, "qualifiers": [], "references": []}]}}, "5"
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args))
+            if name == "add_entity_statement":
+                self.statement_count += 1
+                return dict(args[2], id=f"Q1$new{self.statement_count}")
+            if name == "update_entity":
+                return args[2], "6"
+            return {}
+        return call
+
+def make_entity(api=None, max_targeted_edits=10, **options):
+    # Q1 loaded from api, a RecordingAPI by default
+    connection = Connection(max_targeted_edits=max_targeted_edits)
+    connection.api = RecordingAPI() if api is None else api
+    return Entity(connection=connection, entity_id="Q1", **options)
+
+class TestSectionEdits(unittest.TestCase):
+    def test_single_label(self):
+        entity = make_entity()
+        entity.set_label("en", "new")
+        entity.submit()
+        self.assertEqual(entity.connection.api.calls,
+                         [("replace_entity_label", ("items", "Q1", "en", "new"))])
+        self.assertEqual(entity.data, entity.original_data)
+        self.assertEqual(entity.revision, "5")
+
+    def test_each_section(self):
+        entity = make_entity()
+        entity.remove_label("fr")
+        entity.set_description("en", "description")
+        entity.add_alias("en", "b")
+        entity.add_sitelink(Sitelink(site_code="enwiki", title="Title"))
+        entity.touch("statements", "P1")
+        entity.data["statements"]["P1"][0]["rank"] = "preferred"
+        entity.data["statements"]["P1"].pop(1)
+        statement = Statement()
+        statement.set_string_value("P2", "z")
+        entity.add_statement(statement)
+        entity.submit()
+        calls = {name: args for name, args in entity.connection.api.calls}
+        self.assertEqual(calls["delete_entity_label"], ("items", "Q1", "fr"))
+        self.assertEqual(calls["replace_entity_description"], ("items", "Q1", "en", "description"))
+        self.assertEqual(calls["update_entity_aliases"], ("items", "Q1", {"en": ["a", "b"]}, {"en": ["a"]}))
+        self.assertEqual(calls["replace_item_sitelink"][:2], ("Q1", "enwiki"))
+        self.assertEqual(calls["delete_statement"], ("Q1$2",))
+        self.assertEqual(calls["update_statement"][0], "Q1$1")
+        self.assertNotIn("id", calls["add_entity_statement"][2])
+        self.assertEqual(len(entity.connection.api.calls), 7)
+        self.assertEqual(statement.get_id(), "Q1$new1")
+        self.assertEqual(entity.data, entity.original_data)
+
+    def test_falls_back_to_entity_patch(self):
+        entity = make_entity(max_targeted_edits=1)
+        entity.set_label("en", "new")
+        entity.set_label("de", "neu")
+        entity.submit()
+        self.assertEqual([name for name, args in entity.connection.api.calls], ["update_entity"])
+        self.assertEqual(entity.revision, "6")
+
+    def test_reordered_statements_use_entity_patch(self):
+        entity = make_entity()
+        entity.touch("statements", "P1")
+        entity.data["statements"]["P1"].reverse()
+        entity.submit()
+        self.assertEqual([name for name, args in entity.connection.api.calls], ["update_entity"])
+
+class TestChangeTracking(unittest.TestCase):
+    def test_load_does_not_copy(self):
+        entity = make_entity()
+        self.assertFalse(entity.has_changes())
+        self.assertIs(entity.original_data["statements"], entity.data["statements"])
+        entity.set_label("en", "new")
+        self.assertEqual(entity.original_data["labels"]["en"], "label")
+        self.assertIs(entity.original_data["statements"], entity.data["statements"])
+
+    def test_untouched_entity_is_not_submitted(self):
+        entity = make_entity()
+        self.assertIsNone(entity.submit())
+        entity.set_label("en", "new")
+        entity.set_label("en", "label")
+        self.assertIsNone(entity.submit())
+        self.assertEqual(entity.connection.api.calls, [])
+        self.assertFalse(entity.has_changes())
+
+    def test_entity_patch_only_sends_changed_keys(self):
+        entity = make_entity(max_targeted_edits=0)
+        entity.set_label("en", "new")
+        entity.remove_label("fr")
+        entity.submit()
+        name, args = entity.connection.api.calls[0]
+        self.assertEqual(args[2], {"labels": {"en": "new"}})
+        self.assertEqual(args[3], {"labels": {"en": "label", "fr": "étiquette"}})
+
+    def test_statement_changes_after_adding(self):
+        entity = make_entity()
+        statement = Statement()
+        statement.set_string_value("P2", "z")
+        entity.add_statement(statement)
+        entity.submit()
+        statement.set_rank("preferred")
+        qualifier = Snak()
+        statement.add_qualifier(qualifier)
+        qualifier.set_string_value("P3", "q")
+        entity.submit()
+        name, args = entity.connection.api.calls[-1]
+        self.assertEqual(name, "update_statement")
+        self.assertEqual(args[1]["rank"], "preferred")
+        self.assertEqual(args[1]["qualifiers"][0]["value"]["content"], "q")
+        self.assertEqual(args[2]["rank"], "normal")
+        self.assertEqual(args[2]["qualifiers"], [])
+
+    def test_sitelink_changes_after_adding(self):
+        entity = make_entity()
+        sitelink = Sitelink(site_code="enwiki", title="Title")
+        entity.add_sitelink(sitelink)
+        entity.submit()
+        sitelink.add_badge("Q17437796")
+        entity.submit()
+        self.assertEqual(entity.connection.api.calls[-1][0], "replace_item_sitelink")
+        entity.remove_sitelink("enwiki")
+        entity.submit()
+        self.assertEqual(entity.connection.api.calls[-1], ("delete_item_sitelink", ("Q1", "enwiki")))
+
+class SectionAPI(RecordingAPI):
+    def get_entity_with_revision(self, entity_type, entity_id, fields=None):
+        self.calls.append(("get_entity_with_revision", (entity_type, entity_id, fields)))
+        data, revision = super().get_entity_with_revision(entity_type, entity_id)
+        if fields is not None:
+            data = {field: data[field] for field in fields}
+        return data, revision
+
+    def get_entity_statements(self, entity_type, entity_id, property_id=None, return_revision=False):
+        self.calls.append(("get_entity_statements", (entity_type, entity_id, property_id)))
+        statements = super().get_entity_with_revision(entity_type, entity_id)[0]["statements"]
+        if property_id is not None:
+            statements = {key: value for key, value in statements.items() if key == property_id}
+        return statements, "7"
+
+class TestPartialLoading(unittest.TestCase):
+    def make_entity(self, fields):
+        return make_entity(SectionAPI(), max_targeted_edits=0, fields=fields)
+
+    def test_only_requested_sections(self):
+        entity = self.make_entity(["labels"])
+        self.assertEqual(set(entity.data), {"id", "type", "labels"})
+        self.assertEqual(entity.get_entity_type(), "item")
+        self.assertEqual(entity.connection.api.calls,
+                         [("get_entity_with_revision", ("items", "Q1", ["labels"]))])
+
+    def test_lazy_section(self):
+        entity = self.make_entity(["labels"])
+        self.assertEqual(len(entity.get_statements("P1")), 2)
+        self.assertEqual(len(entity.get_statements("P1")), 2)
+        names = [name for name, args in entity.connection.api.calls]
+        self.assertEqual(names, ["get_entity_with_revision", "get_entity_statements"])
+        # The revision of the first load is the one edits are checked against
+        self.assertEqual(entity.revision, "5")
+
+    def test_submit_only_loaded_sections(self):
+        entity = self.make_entity(["labels"])
+        entity.set_label("en", "new")
+        entity.submit()
+        name, args = entity.connection.api.calls[-1]
+        self.assertEqual(name, "update_entity")
+        self.assertEqual(args[2], {"labels": {"en": "new"}})
+        self.assertNotIn("get_entity_statements", [name for name, args in entity.connection.api.calls])
+
+class TestStatementView(unittest.TestCase):
+    def make_entity(self, properties, max_targeted_edits=0):
+        return make_entity(SectionAPI(), max_targeted_edits, properties=properties)
+
+    def test_only_requested_properties(self):
+        entity = self.make_entity(["P1", "P9"])
+        self.assertEqual(list(entity.get_statements()), ["P1"])
+        self.assertEqual(entity.connection.api.calls, [
+            ("get_entity_statements", ("items", "Q1", "P1")),
+            ("get_entity_statements", ("items", "Q1", "P9"))])
+        self.assertIsNone(entity.get_statements("P9"))
+        self.assertEqual(len(entity.connection.api.calls), 2)
+        self.assertEqual(entity.revision, "7")
+
+    def test_submit_subset(self):
+        entity = self.make_entity(["P1"])
+        entity.touch("statements", "P1")
+        entity.get_statements("P1")[0]["rank"] = "preferred"
+        entity.submit()
+        name, args = entity.connection.api.calls[-1]
+        self.assertEqual(name, "update_entity")
+        self.assertEqual(list(args[2]), ["statements"])
+        self.assertEqual(args[2]["statements"]["P1"][0]["rank"], "preferred")
+        self.assertEqual(args[3]["statements"]["P1"][0]["rank"], "normal")
+
+    def test_adding_to_another_property_fetches_it_first(self):
+        entity = self.make_entity(["P9"], max_targeted_edits=10)
+        statement = Statement()
+        statement.set_string_value("P1", "z")
+        entity.add_statement(statement)
+        self.assertEqual(len(entity.get_statements("P1")), 3)
+        entity.submit()
+        self.assertEqual(entity.connection.api.calls[-1][0], "add_entity_statement")
+
+class TestStatementIndex(unittest.TestCase):
+    def test_lazy(self):
+        entity = make_entity()
+        self.assertIsNone(entity.index)
+        self.assertEqual(entity.get_statement("Q1$2")["value"]["content"], "y")
+        self.assertIsNotNone(entity.index)
+        self.assertIsNone(entity.get_statement("Q1$3"))
+
+    def test_find_by_value(self):
+        entity = make_entity()
+        found = entity.find_statements("P1", {"content": "x", "type": "value"})
+        self.assertEqual([statement["id"] for statement in found], ["Q1$1"])
+        self.assertEqual(entity.find_statements("P2", {"type": "value", "content": "x"}), [])
+        self.assertEqual(normalize_value({"type": "value", "content": {"amount": "+5", "unit": "1"}}),
+                         normalize_value({"type": "value", "content": {"unit": "1", "amount": "5"}}))
+
+    def test_kept_up_to_date(self):
+        entity = make_entity()
+        entity.get_statement("Q1$1")
+        statement = Statement()
+        statement.set_string_value("P1", "x")
+        entity.add_statement(statement)
+        self.assertEqual(len(entity.find_statements("P1", statement.get_value())), 2)
+        statement.set_string_value("P1", "z")
+        self.assertEqual(len(entity.find_statements("P1", {"type": "value", "content": "x"})), 1)
+        self.assertEqual(entity.find_statements("P1", {"type": "value", "content": "z"}), [statement.data])
+        entity.submit()
+        self.assertIs(entity.get_statement("Q1$new1"), statement.data)
+
+    def test_remove_statement(self):
+        entity = make_entity()
+        entity.remove_statement("Q1$1")
+        self.assertIsNone(entity.get_statement("Q1$1"))
+        entity.remove_statement(entity.get_statement("Q1$2"))
+        self.assertNotIn("P1", entity.get_statements())
+        statement = Statement()
+        statement.set_string_value("P2", "z")
+        entity.add_statement(statement)
+        entity.remove_statement(statement)
+        self.assertEqual(entity.get_statements(), {})
+        entity.remove_statement("Q1$1")
+        entity.submit()
+        self.assertEqual(sorted(args[0] for name, args in entity.connection.api.calls),
+                         ["Q1$1", "Q1$2"])
+
+class TestConflicts(unittest.TestCase):
+    def make_entity(self, conflicts):
+        connection = Connection(conflict_retries=2, max_targeted_edits=0)
+        connection.api = ConflictingAPI(conflicts)
+        return Entity(connection=connection, entity_id="Q1")
+
+    def test_rebase_after_conflict(self):
+        entity = self.make_entity(conflicts=2)
+        self.assertEqual(entity.revision, "1")
+        entity.set_label("de", "Etikett")
+        entity.submit()
+        api = entity.connection.api
+        self.assertEqual(api.sent_revisions, ["1", "2", "3"])
+        self.assertEqual(api.server["labels"], {"en": "label", "de": "Etikett"})
+        self.assertEqual(api.server["descriptions"], {"en": "edit 3"})
+        self.assertEqual(entity.revision, "4")
+        self.assertEqual(entity.data, entity.original_data)
+
+    def test_retry_budget(self):
+        entity = self.make_entity(conflicts=3)
+        entity.set_label("de", "Etikett")
+        self.assertRaises(EditConflict, entity.submit)
+
+    def test_incompatible_change(self):
+        entity = self.make_entity(conflicts=1)
+        entity.set_label("en", "renamed")
+        entity.connection.api.server["labels"] = {}
+        self.assertRaises(EditConflict, entity.submit)
+
 if __name__ == '__main__':
     unittest.main()
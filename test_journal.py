@@ -0,0 +1,121 @@
+from journal import *
+from api import WikibaseRestAPI
+from entity import Connection, Entity
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+class Response:
+    def __init__(self, status_code, data, etag=None):
+        self.status_code = status_code
+        self.headers = {} if etag is None else {"ETag": f'"{etag}"'}
+        self.content = json.dumps(data).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+
+class WikiSession:
+    # Answers GETs with one entity and writes with increasing revisions;
+    # If-Match revisions other than the current one get a 412
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revisions = {}
+        self.sent = []
+
+    def request(self, verb, url, params=None, headers={}, data=None, timeout=None):
+        entity_id = url.split("/entities/items/")[1].split("/")[0]
+        with self.lock:
+            revision = self.revisions.get(entity_id, 5)
+            if verb == "get":
+                return Response(200, {"id": entity_id, "type": "item", "labels": {"en": "old"},
+                                      "descriptions": {}, "aliases": {}, "statements": {},
+                                      "sitelinks": {}}, revision)
+            self.sent.append((verb, url, headers.get("If-Match"), json.loads(data)))
+            if "If-Match" in headers and headers["If-Match"] != f'"{revision}"':
+                return Response(412, {"code": "precondition-failed"})
+            self.revisions[entity_id] = revision + 1
+            return Response(200, {}, revision + 1)
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "journal.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record_job(self, entity_ids):
+        session = WikiSession()
+        with Journal(self.path) as journal:
+            connection = Connection(session=session, journal=journal, max_targeted_edits=0)
+            for entity_id in entity_ids:
+                entity = Entity(connection=connection, entity_id=entity_id)
+                entity.set_label("en", "first")
+                entity.submit()
+                entity.set_label("de", "zweite")
+                entity.submit()
+        # Nothing but the loads went out
+        self.assertEqual(session.sent, [])
+        return list(read_journal(self.path))
+
+    def test_record(self):
+        records = self.record_job(["Q1"])
+        self.assertEqual([offset for offset, record in records], [0, 1])
+        first, second = records[0][1], records[1][1]
+        self.assertEqual(first["verb"], "patch")
+        self.assertEqual(first["path"], "/entities/items/Q1")
+        self.assertEqual(first["revision"], "5")
+        self.assertEqual(first["payload"]["patch"],
+                         [{"op": "replace", "path": "/labels/en", "value": "first"}])
+        # The second submit only carries the second change
+        self.assertEqual(second["payload"]["patch"],
+                         [{"op": "add", "path": "/labels/de", "value": "zweite"}])
+        self.assertEqual(second["revision"], "5")
+
+    def test_replay_carries_revisions_forward(self):
+        self.record_job(["Q1", "Q2", "Q3"])
+        session = WikiSession()
+        api = WikibaseRestAPI(session=session)
+        self.assertEqual(replay(api, self.path, workers=3), 6)
+        for entity_id in ("Q1", "Q2", "Q3"):
+            sent = [(if_match, payload["patch"][0]["path"]) for verb, url, if_match, payload
+                    in session.sent if url.endswith(entity_id)]
+            self.assertEqual(sent, [('"5"', "/labels/en"), ('"6"', "/labels/de")])
+
+    def test_errors_and_resume(self):
+        self.record_job(["Q1", "Q2"])
+        checkpoint = os.path.join(self.directory.name, "checkpoint")
+        session = WikiSession()
+        # Someone else edited Q2 since the job was planned
+        session.revisions["Q2"] = 9
+        errors = {}
+        api = WikibaseRestAPI(session=session)
+        self.assertEqual(replay(api, self.path, errors=errors, checkpoint=checkpoint), 4)
+        self.assertEqual(sorted(errors), [2, 3])
+        self.assertIsInstance(errors[2], Exception)
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), "4\n")
+        # Resuming from the checkpoint has nothing left to send
+        sent = len(session.sent)
+        self.assertEqual(replay(api, self.path, checkpoint=checkpoint), 4)
+        self.assertEqual(len(session.sent), sent)
+        # Resuming from an offset sends only what follows it
+        session.revisions["Q2"] = 5
+        self.assertEqual(replay(api, self.path, start=2), 4)
+        self.assertEqual([url[-2:] for verb, url, if_match, payload in session.sent[sent:]],
+                         ["Q2", "Q2"])
+
+    def test_raises_without_errors(self):
+        self.record_job(["Q1"])
+        session = WikiSession()
+        session.revisions["Q1"] = 9
+        with self.assertRaises(Exception):
+            replay(WikibaseRestAPI(session=session), self.path)
+
+    def test_refuses_recording_api(self):
+        with Journal(self.path) as journal:
+            with self.assertRaises(ValueError):
+                replay(WikibaseRestAPI(journal=journal), self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+from metrics import *
+from api import WikibaseRestAPI
+from entity import Connection, Entity
+from mockserver import MockServer
+import unittest
+
+class RecordingHook:
+    def __init__(self):
+        self.events = []
+
+    def before_request(self, info):
+        self.events.append(("before", info.verb, info.endpoint, info.attempt))
+
+    def after_request(self, info):
+        self.events.append(("after", info.status, info.attempt, info.bytes_received > 0))
+
+class TestEndpointTemplate(unittest.TestCase):
+    def test_templates(self):
+        self.assertEqual(endpoint_template("/entities/items/Q42"), "/entities/items/{entity_id}")
+        self.assertEqual(endpoint_template("/entities/items/Q42/labels/en"),
+                         "/entities/items/{entity_id}/labels/{language_code}")
+        self.assertEqual(endpoint_template("/entities/items/Q42/sitelinks/enwiki"),
+                         "/entities/items/{entity_id}/sitelinks/{site_id}")
+        self.assertEqual(endpoint_template("/statements/Q42$ABC"), "/statements/{statement_id}")
+        self.assertEqual(endpoint_template("/entities/items/Q1/statements"),
+                         "/entities/items/{entity_id}/statements")
+
+class TestHistogram(unittest.TestCase):
+    def test_quantile(self):
+        histogram = Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 0])
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1.0), 4)
+        self.assertIsNone(Histogram((1,)).quantile(0.5))
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[{"id": "Q1", "labels": {"en": "label"}}])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_hooks_see_every_attempt(self):
+        hook = RecordingHook()
+        with WikibaseRestAPI(endpoint=self.server.endpoint, hooks=[hook]) as api:
+            self.server.fail_next(503, retry_after=0)
+            api.get_item("Q1")
+        self.assertEqual(hook.events, [
+            ("before", "get", "/entities/items/{entity_id}", 1),
+            ("after", 503, 1, True),
+            ("before", "get", "/entities/items/{entity_id}", 2),
+            ("after", 200, 2, True)])
+
+    def test_connection_errors_are_reported(self):
+        hook = RecordingHook()
+        with WikibaseRestAPI(endpoint="http://127.0.0.1:9", hooks=[hook]) as api:
+            with self.assertRaises(Exception):
+                api._request("get", "/entities/items/Q1", max_retries=1)
+        self.assertEqual(hook.events[1], ("after", None, 1, False))
+
+    def test_collector(self):
+        metrics = MetricsCollector()
+        with Connection(endpoint=self.server.endpoint, hooks=[metrics], tracer=metrics,
+                        max_targeted_edits=0) as connection:
+            self.server.fail_next(503, retry_after=0, verbs=["get"])
+            entity = Entity(connection=connection, entity_id="Q1")
+            entity.set_label("en", "changed")
+            entity.submit()
+        key = ("get", "/entities/items/{entity_id}")
+        self.assertEqual(metrics.requests[key + ("503",)], 1)
+        self.assertEqual(metrics.requests[key + ("200",)], 1)
+        self.assertEqual(metrics.retries[key], 1)
+        self.assertEqual(metrics.requests[("patch", "/entities/items/{entity_id}", "200")], 1)
+        self.assertGreater(metrics.bytes_sent[("patch", "/entities/items/{entity_id}")], 0)
+        self.assertEqual(set(metrics.spans), {"load", "diff", "submit"})
+        self.assertIsNotNone(metrics.quantile(0.99, verb="get"))
+
+        text = metrics.openmetrics()
+        self.assertTrue(text.endswith("# EOF\n"))
+        self.assertIn("# TYPE wikibase_requests counter\n", text)
+        self.assertIn('wikibase_requests_total{verb="get",endpoint="/entities/items/{entity_id}",'
+                      'status="503"} 1\n', text)
+        self.assertIn('wikibase_request_duration_seconds_bucket{verb="patch",'
+                      'endpoint="/entities/items/{entity_id}",le="+Inf"} 1\n', text)
+        self.assertIn('wikibase_entity_phase_duration_seconds_count{phase="submit"} 1\n', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+from mockserver import *
+from api import EditConflict, WikibaseRestAPI
+from cache import ResponseCache
+from entity import Connection, Entity, Statement
+import unittest
+
+def make_item(entity_id="Q1"):
+    return {
+        "id": entity_id,
+        "type": "item",
+        "labels": {"en": "label", "de": "Bezeichnung"},
+        "descriptions": {"en": "description"},
+        "aliases": {"en": ["alias"]},
+        "statements": {
+            "P1": [{"id": f"{entity_id}$A", "rank": "normal",
+                    "property": {"id": "P1", "data_type": "string"},
+                    "value": {"type": "value", "content": "a"},
+                    "qualifiers": [], "references": []}],
+            "P2": [{"id": f"{entity_id}$B", "rank": "normal",
+                    "property": {"id": "P2", "data_type": "string"},
+                    "value": {"type": "value", "content": "b"},
+                    "qualifiers": [], "references": []}]},
+        "sitelinks": {"enwiki": {"title": "Title", "badges": []}}
+    }
+
+class TestMockServer(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[make_item()])
+        self.api = WikibaseRestAPI(endpoint=self.server.endpoint)
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_reads(self):
+        entity, revision = self.api.get_entity_with_revision("items", "Q1")
+        self.assertEqual(entity["labels"]["en"], "label")
+        self.assertEqual(revision, str(self.server.wiki.get_revision("Q1")))
+        self.assertEqual(set(self.api.get_entity("items", "Q1", fields=["labels"])),
+                         {"id", "labels"})
+        self.assertEqual(self.api.get_item_label("Q1", "de"), "Bezeichnung")
+        self.assertEqual(list(self.api.get_entity_statements("items", "Q1", property_id="P2")),
+                         ["P2"])
+        self.assertEqual(self.api.get_entity_statements("items", "Q1", property_id="P9"), {})
+        self.assertEqual(self.api.get_entity_statement("items", "Q1", "Q1$B")["value"]["content"],
+                         "b")
+        self.assertEqual(self.api.get_item_sitelink("Q1", "enwiki")["title"], "Title")
+
+    def test_missing_entity(self):
+        with self.assertRaises(Exception):
+            self.api._request("get", "/entities/items/Q404", max_retries=1)
+        self.assertEqual(self.server.requests, [("get", "/entities/items/Q404")])
+
+    def test_writes_bump_revision(self):
+        revision = self.server.wiki.get_revision("Q1")
+        self.api.replace_entity_label("items", "Q1", "fr", "libellé")
+        self.api.delete_entity_description("items", "Q1", "en")
+        self.api.replace_item_sitelink("Q1", "dewiki", {"title": "Titel", "badges": []})
+        added = self.api.add_entity_statement("items", "Q1", {
+            "property": {"id": "P3"}, "value": {"type": "value", "content": "c"}})
+        self.assertTrue(added["id"].startswith("Q1$"))
+        self.api.delete_statement("Q1$A")
+        entity = self.server.wiki.get_entity("Q1")
+        self.assertEqual(entity["labels"]["fr"], "libellé")
+        self.assertEqual(entity["descriptions"], {})
+        self.assertNotIn("P1", entity["statements"])
+        self.assertEqual(entity["statements"]["P3"][0]["rank"], "normal")
+        self.assertEqual(self.server.wiki.get_revision("Q1"), revision + 5)
+
+    def test_patch_conflicts(self):
+        _, revision = self.api.get_entity_with_revision("items", "Q1")
+        patch = {"patch": [{"op": "test", "path": "/labels/en", "value": "other"}]}
+        with self.assertRaises(EditConflict) as caught:
+            self.api._request("patch", "/entities/items/Q1", payload=patch)
+        self.assertEqual(caught.exception.status_code, 409)
+        self.api.replace_entity_label("items", "Q1", "en", "new")
+        with self.assertRaises(EditConflict) as caught:
+            self.api.update_entity("items", "Q1", {"labels": {"en": "x"}}, {"labels": {"en": "new"}},
+                                   revision=revision)
+        self.assertEqual(caught.exception.status_code, 412)
+
+    def test_not_modified(self):
+        api = WikibaseRestAPI(endpoint=self.server.endpoint, cache=ResponseCache(ttl=0))
+        api.get_item("Q1")
+        self.assertEqual(api.get_item("Q1")["id"], "Q1")
+        self.assertEqual(api.cache.stats()["revalidations"], 1)
+        api.close()
+
+    def test_injected_errors_are_retried(self):
+        self.server.fail_next(503, count=2, retry_after=0)
+        self.assertEqual(self.api.get_item("Q1")["id"], "Q1")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_create_item(self):
+        created, revision = self.api.add_item({"labels": {"en": "new item"}}, return_revision=True)
+        self.assertEqual(created["id"], "Q2")
+        self.assertEqual(self.api.get_item("Q2")["labels"], {"en": "new item"})
+
+class TestEntityAgainstMockServer(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[make_item()])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def connection(self, max_targeted_edits=1):
+        return Connection(endpoint=self.server.endpoint, max_targeted_edits=max_targeted_edits)
+
+    def test_submit_patch(self):
+        with self.connection(max_targeted_edits=0) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            entity.set_label("en", "changed")
+            entity.remove_statement("Q1$A")
+            entity.submit()
+            self.assertEqual(entity.revision, str(self.server.wiki.get_revision("Q1")))
+        stored = self.server.wiki.get_entity("Q1")
+        self.assertEqual(stored["labels"]["en"], "changed")
+        self.assertNotIn("P1", stored["statements"])
+
+    def test_targeted_edits(self):
+        with self.connection(max_targeted_edits=5) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            entity.set_label("en", "changed")
+            statement = Statement(property_id="P3", data_type="string", value_content="c")
+            entity.add_statement(statement)
+            entity.submit()
+            self.assertFalse(entity.has_changes())
+            self.assertTrue(statement.get_id().startswith("Q1$"))
+        verbs = [verb for verb, path in self.server.requests]
+        self.assertEqual(sorted(verbs), ["get", "post", "put"])
+        self.assertEqual(self.server.wiki.get_entity("Q1")["statements"]["P3"][0]["id"],
+                         statement.get_id())
+
+    def test_targeted_edits_keep_the_loaded_revision(self):
+        item = make_item()
+        item["statements"]["P1"] = [dict(item["statements"]["P1"][0], id=f"Q1${n}")
+                                    for n in range(1, 4)]
+        self.server.wiki.put_entity(item)
+        with self.connection(max_targeted_edits=1) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            loaded_revision = entity.revision
+            # Someone else removes Q1$1, shifting the others down
+            del item["statements"]["P1"][0]
+            self.server.wiki.put_entity(item)
+            entity.set_label("en", "changed")
+            entity.submit()
+            # The targeted edit did not see that, so a later entity PATCH
+            # must still be checked against the loaded revision
+            self.assertEqual(entity.revision, loaded_revision)
+            entity.touch("statements", "P1")
+            entity.get_statement("Q1$2")["rank"] = "preferred"
+            entity.set_label("de", "geändert")
+            entity.submit()
+        stored = self.server.wiki.get_entity("Q1")
+        self.assertEqual([(statement["id"], statement["rank"])
+                          for statement in stored["statements"]["P1"]],
+                         [("Q1$2", "preferred"), ("Q1$3", "normal")])
+        self.assertEqual(stored["labels"]["de"], "geändert")
+
+    def test_conflict_is_rebased(self):
+        with self.connection(max_targeted_edits=0) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            # Someone else edits another part of the entity meanwhile
+            other = make_item()
+            other["labels"]["fr"] = "libellé"
+            self.server.wiki.put_entity(other)
+            entity.set_label("en", "changed")
+            entity.submit()
+        stored = self.server.wiki.get_entity("Q1")
+        self.assertEqual(stored["labels"]["en"], "changed")
+        self.assertEqual(stored["labels"]["fr"], "libellé")
+        self.assertIn(("patch", "/entities/items/Q1"), self.server.requests)
+
+    def add_second_p1_statement(self):
+        item = make_item()
+        second = dict(item["statements"]["P1"][0], id="Q1$C")
+        item["statements"]["P1"].append(second)
+        self.server.wiki.put_entity(item)
+        return item
+
+    def test_rebase_follows_statement_ids(self):
+        item = self.add_second_p1_statement()
+        with self.connection(max_targeted_edits=0) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            # Someone else removes Q1$A, shifting Q1$C to the front
+            del item["statements"]["P1"][0]
+            self.server.wiki.put_entity(item)
+            entity.touch("statements", "P1")
+            entity.get_statement("Q1$C")["rank"] = "preferred"
+            entity.set_label("en", "changed")
+            entity.submit()
+        stored = self.server.wiki.get_entity("Q1")
+        self.assertEqual([(statement["id"], statement["rank"])
+                          for statement in stored["statements"]["P1"]],
+                         [("Q1$C", "preferred")])
+        self.assertEqual(stored["labels"]["en"], "changed")
+
+    def test_changed_statement_removed_meanwhile(self):
+        item = self.add_second_p1_statement()
+        with self.connection(max_targeted_edits=0) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            del item["statements"]["P1"][0]
+            self.server.wiki.put_entity(item)
+            entity.touch("statements", "P1")
+            entity.get_statement("Q1$A")["rank"] = "preferred"
+            entity.set_label("en", "changed")
+            with self.assertRaises(EditConflict):
+                entity.submit()
+        stored = self.server.wiki.get_entity("Q1")
+        self.assertEqual([(statement["id"], statement["rank"])
+                          for statement in stored["statements"]["P1"]],
+                         [("Q1$C", "normal")])
+        self.assertEqual(stored["labels"]["en"], "label")
+
+    def test_conflict_bypasses_cache(self):
+        with Connection(endpoint=self.server.endpoint, max_targeted_edits=0,
+                        cache=ResponseCache(ttl=60)) as connection:
+            entity = Entity(connection=connection, entity_id="Q1")
+            other = make_item()
+            other["labels"]["fr"] = "libellé"
+            self.server.wiki.put_entity(other)
+            entity.set_label("en", "changed")
+            entity.submit()
+        stored = self.server.wiki.get_entity("Q1")
+        self.assertEqual(stored["labels"]["en"], "changed")
+        self.assertEqual(stored["labels"]["fr"], "libellé")
+        self.assertEqual(self.server.requests.count(("patch", "/entities/items/Q1")), 2)
+
+    def test_parallel_loads(self):
+        for n in range(2, 30):
+            self.server.wiki.put_entity(make_item(f"Q{n}"))
+        with self.connection() as connection:
+            ids = [f"Q{n}" for n in range(1, 30)]
+            entities = list(connection.load_many(ids, workers=8))
+        self.assertEqual([entity.get_id() for entity in entities], ids)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+from rate_limiter import RateLimiter, parse_retry_after, shared_rate_limiter
+from api import WikibaseRestAPI
+from email.utils import formatdate
+import json
+import time
+import unittest
+
+class FakeResponse:
+    def __init__(self, status_code, body, headers={}):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = body
+        self.content = json.dumps({"body": body}).encode("utf-8")
+
+    def json(self):
+        return {"body": self.text}
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent = []
+        self.sent_headers = []
+
+    def request(self, verb, url, **kwargs):
+        self.sent.append((verb, url, time.monotonic()))
+        self.sent_headers.append(kwargs.get("headers", {}))
+        return self.responses.pop(0)
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+
+    def test_http_date(self):
+        value = parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+        self.assertTrue(25 < value <= 30)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+class TestRateLimiter(unittest.TestCase):
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        self.assertEqual([limiter.reserve() for _ in range(100)], [0.0] * 100)
+
+    def test_edits_per_minute(self):
+        limiter = RateLimiter(edits_per_minute=60)
+        self.assertEqual(limiter.reserve(edit=True), 0.0)
+        self.assertAlmostEqual(limiter.reserve(edit=True), 1.0, places=2)
+        self.assertAlmostEqual(limiter.reserve(edit=True), 2.0, places=2)
+        # Reads are not charged against the edit budget
+        self.assertEqual(limiter.reserve(edit=False), 0.0)
+
+    def test_throttle_pauses_everyone_and_halves_rate(self):
+        limiter = RateLimiter(requests_per_second=10, edits_per_minute=60)
+        limiter.throttle(retry_after=3)
+        self.assertAlmostEqual(limiter.reserve(), 3.0, places=1)
+        self.assertGreaterEqual(limiter.reserve(edit=True), 3.0)
+        self.assertEqual(limiter.current_rates(), (5.0, 30.0))
+        self.assertEqual(limiter.throttled_count, 1)
+        for _ in range(200):
+            limiter.succeed()
+        self.assertEqual(limiter.current_rates(), (10.0, 60.0))
+
+    def test_rate_floor(self):
+        limiter = RateLimiter(requests_per_second=10, min_rate_fraction=0.25)
+        for _ in range(10):
+            limiter.throttle(retry_after=0)
+        self.assertEqual(limiter.current_rates(), (2.5, None))
+
+    def test_shared_rate_limiter(self):
+        self.assertIs(shared_rate_limiter(edits_per_minute=30), shared_rate_limiter())
+
+class TestRequestThrottling(unittest.TestCase):
+    def test_retry_after_is_honored(self):
+        limiter = RateLimiter()
+        api = WikibaseRestAPI(rate_limiter=limiter)
+        api.session = FakeSession([
+            FakeResponse(429, "slow down", {"Retry-After": "0.2"}),
+            FakeResponse(200, "ok")])
+        self.assertEqual(api.get_item("Q1"), {"body": "ok"})
+        first, second = api.session.sent
+        self.assertGreaterEqual(second[2] - first[2], 0.2)
+        self.assertEqual(limiter.throttled_count, 1)
+
+    def test_retry_after_without_limiter(self):
+        api = WikibaseRestAPI()
+        api.session = FakeSession([
+            FakeResponse(503, "lagged", {"Retry-After": "0.1", "X-Database-Lag": "7"}),
+            FakeResponse(200, "ok")])
+        self.assertEqual(api.get_item("Q1"), {"body": "ok"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+from retry import *
+from api import EditConflict, WikibaseRestAPI
+from async_api import AsyncWikibaseRestAPI, aiohttp
+from mockserver import MockServer
+import time
+import unittest
+
+endpoint = ("get", "/entities/items/{entity_id}")
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_is_transient(self):
+        policy = RetryPolicy()
+        for status in (408, 429, 500, 502, 503, 504):
+            self.assertTrue(policy.is_transient(status), status)
+        for status in (400, 401, 403, 404, 409, 412, 422):
+            self.assertFalse(policy.is_transient(status), status)
+        self.assertTrue(policy.is_transient(error=ConnectionResetError()))
+        self.assertTrue(policy.is_transient(error=TimeoutError()))
+        self.assertTrue(policy.is_transient(error=RetryableError()))
+        self.assertFalse(policy.is_transient(error=TypeError()))
+        self.assertFalse(policy.is_transient(error=HTTPError(404, "")))
+
+    def test_full_jitter(self):
+        policy = RetryPolicy(base_delay=1, max_delay=10, seed=1)
+        for attempt, ceiling in ((1, 1), (2, 2), (3, 4), (8, 10)):
+            delays = [policy.delay(attempt) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+        self.assertEqual(RetryPolicy(jitter=False).delay(3), 4)
+        self.assertEqual(policy.delay(3, retry_after=7), 7)
+        self.assertEqual(policy.delay(3, retry_after=86400), 10)
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_and_probes(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.failed(endpoint)
+        breaker.before_request(endpoint)
+        breaker.failed(endpoint)
+        self.assertEqual(breaker.state(endpoint), "open")
+        with self.assertRaises(CircuitOpen):
+            breaker.before_request(endpoint)
+        # Other endpoints are unaffected
+        breaker.before_request(("patch", "/entities/items/{entity_id}"))
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state(endpoint), "half-open")
+        breaker.before_request(endpoint)
+        # Only one probe at a time
+        with self.assertRaises(CircuitOpen):
+            breaker.before_request(endpoint)
+        breaker.failed(endpoint)
+        self.assertEqual(breaker.state(endpoint), "open")
+
+        time.sleep(0.06)
+        breaker.before_request(endpoint)
+        breaker.succeeded(endpoint)
+        self.assertEqual(breaker.state(endpoint), "closed")
+        breaker.before_request(endpoint)
+
+    def test_throttling_is_not_a_failure(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        policy = RetryPolicy(circuit_breaker=breaker)
+        policy.record(endpoint, 429)
+        policy.record(endpoint, 503, retry_after=5)
+        policy.record(endpoint, 404)
+        policy.record(endpoint, error=RetryableError())
+        self.assertEqual(breaker.state(endpoint), "closed")
+        policy.record(endpoint, error=ConnectionRefusedError())
+        self.assertEqual(breaker.state(endpoint), "open")
+
+class TestRetries(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(entities=[{"id": "Q1", "labels": {"en": "label"}}])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def api(self, **options):
+        return WikibaseRestAPI(endpoint=self.server.endpoint, retry_policy=RetryPolicy(
+            base_delay=0.001, max_delay=0.01, **options))
+
+    def test_transient_errors_are_retried(self):
+        with self.api() as api:
+            self.server.fail_next(500, count=2)
+            self.assertEqual(api.get_item("Q1")["labels"]["en"], "label")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_permanent_errors_fail_fast(self):
+        with self.api() as api:
+            with self.assertRaises(HTTPError) as raised:
+                api.get_item("Q404")
+            self.assertEqual(raised.exception.status_code, 404)
+            self.server.fail_next(403)
+            with self.assertRaises(HTTPError):
+                api.get_item("Q1")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_edit_conflicts_are_not_retried(self):
+        with self.api() as api:
+            with self.assertRaises(EditConflict) as raised:
+                api._request("put", "/entities/items/Q1/labels/en",
+                             payload={"label": "new"}, revision="1000")
+            self.assertIsInstance(raised.exception, HTTPError)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retries_exhausted(self):
+        with self.api(max_retries=3) as api:
+            self.server.fail_next(502, count=5)
+            with self.assertRaisesRegex(RetriesExhausted, "All retries exhausted after 3") as raised:
+                api.get_item("Q1")
+            self.assertEqual(raised.exception.status_code, 502)
+            self.assertIsInstance(raised.exception.error, HTTPError)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_after_is_capped(self):
+        with self.api(max_retries=2) as api:
+            self.server.fail_next(503, retry_after=86400)
+            start = time.monotonic()
+            self.assertEqual(api.get_item("Q1")["labels"]["en"], "label")
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_circuit_breaker_sheds_load(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        with self.api(max_retries=5, circuit_breaker=breaker) as api:
+            self.server.fail_next(500, count=5, verbs=["get"])
+            with self.assertRaises(CircuitOpen):
+                api.get_item("Q1")
+            with self.assertRaises(CircuitOpen):
+                api.get_item("Q1")
+            # Writes to the same entity are a different endpoint
+            api.replace_entity_label("items", "Q1", "en", "new")
+        self.assertEqual(self.server.requests, [("get", "/entities/items/Q1")] * 2 +
+                                               [("put", "/entities/items/Q1/labels/en")])
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncRetries(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MockServer(entities=[{"id": "Q1", "labels": {"en": "label"}}])
+
+    async def asyncTearDown(self):
+        self.server.stop()
+
+    async def test_retries(self):
+        policy = RetryPolicy(base_delay=0.001, max_delay=0.01)
+        async with AsyncWikibaseRestAPI(endpoint=self.server.endpoint,
+                                        retry_policy=policy) as api:
+            self.server.fail_next(503)
+            self.assertEqual((await api.get_item("Q1"))["labels"]["en"], "label")
+            with self.assertRaises(HTTPError):
+                await api.get_item("Q404")
+        self.assertEqual(len(self.server.requests), 3)
+
+if __name__ == '__main__':
+    unittest.main()
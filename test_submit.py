@@ -1,10 +1,10 @@
 from entity import *
+from mockserver import MockServer
 from test_api import make_up_string
-import requests
-import credentials
 import random
 
-connection = Connection(endpoint="https://test.wikidata.org/w/rest.php/wikibase/v0", access_token=credentials.access_token)
+# Items the made-up statements can point at
+known_items = ["Q41487", "Q225467", "Q235642"]
 
 def make_up_badge():
     badges = ["Q609", "Q608", "Q226102", "Q226103"]
@@ -12,39 +12,15 @@ def make_up_badge():
     return badges[n]
 
 def make_up_item():
-    url = "https://test.wikidata.org/w/api.php"
-    params = {
-        "action": "query",
-        "list": "random",
-        "rnnamespace": 0,
-        "rnlimit": 1,
-        "rnfilterredir": "nonredirects",
-        "format": "json"
-    }
-    response = requests.get(url, params=params)
-    data = response.json()
-    qitem = data["query"]["random"][0]["title"]
-    return str(qitem)
+    return random.choice(known_items)
 
 def make_up_sitelink(domain="en.wikipedia.org", namespace=0):
-    url = "https://" + domain + "/w/api.php"
-    params = {
-        "action": "query",
-        "list": "random",
-        "rnnamespace": namespace,
-        "rnlimit": 1,
-        "format": "json"
-    }
-    response = requests.get(url, params=params)
-    data = response.json()
-    article_title = data['query']['random'][0]['title']
+    article_title = f"Article {make_up_string('t')}"
     article_link = f"https://{domain}/wiki/{article_title.replace(' ', '_')}"
     return article_title, article_link
 
 def make_up_commons_file():
-    article_title, _ = make_up_sitelink(domain="commons.wikimedia.org", namespace=6)
-    article_title = article_title.replace("File:", "")
-    return article_title
+    return f"{make_up_string('f')}.jpg"
 
 def make_up_time():
     year = str(random.randint(1800, 2020))
@@ -52,7 +28,7 @@ def make_up_time():
     day = str(random.randint(1, 29)).zfill(2)
     return f"+{year}-{month}-{day}"
 
-def generate_random_test_entity(entity_id=None):
+def generate_random_test_entity(connection, entity_id=None):
     entity = Entity(connection=connection, entity_id=entity_id)
     entity.set_label("en", make_up_string("l"))
     entity.set_description("en", make_up_string("d"))
@@ -114,9 +90,31 @@ def generate_random_test_entity(entity_id=None):
     return entity
 
 
-if __name__ == "__main__":
-    new_item = generate_random_test_entity()
-    new_item.submit()
+def submitted(server, entity):
+    stored = server.wiki.get_entity(entity.get_id())
+    assert stored["labels"] == entity.get_labels()
+    assert stored["descriptions"] == entity.get_descriptions()
+    assert stored["aliases"] == entity.get_aliases()
+    assert stored["statements"] == entity.get_statements()
+    return stored
+
+def test_submit_new_item():
+    with MockServer() as server:
+        with Connection(endpoint=server.endpoint, access_token="abcdefg") as connection:
+            new_item = generate_random_test_entity(connection)
+            new_item.submit()
+            stored = submitted(server, new_item)
+            assert stored["sitelinks"]["enwiki"]["title"] == new_item.get_sitelink("enwiki")["title"]
+            assert len(stored["statements"]) == 8
+
+def test_submit_existing_item():
+    with MockServer(entities=[{"id": "Q235642", "labels": {"en": "existing"}}]) as server:
+        with Connection(endpoint=server.endpoint, access_token="abcdefg") as connection:
+            existing_item = generate_random_test_entity(connection, entity_id="Q235642")
+            existing_item.submit()
+            submitted(server, existing_item)
 
-    existing_item = generate_random_test_entity(entity_id="Q235642")
-    existing_item.submit()
+if __name__ == "__main__":
+    test_submit_new_item()
+    test_submit_existing_item()
+    print("Tests complete.")